@@ -1,5 +1,13 @@
-import gc
 import re
+import collections
+import sqlite3
+import struct
+import hashlib
+import io
+import zipfile
+import tarfile
+import shutil
+import tempfile
 import tkinter as tk
 from tkinter import *
 from tkinter.filedialog import askdirectory
@@ -7,7 +15,7 @@ import numpy as np
 import os
 import xlsxwriter as xlsx
 import openpyxl as opxl
-from natsort import natsorted, ns
+from natsort import natsort_keygen, ns
 import pydicom
 import matplotlib.pyplot as plt
 import matplotlib
@@ -19,9 +27,15 @@ import time
 import functools as fut
 import pandas as pd
 import docx
-from scipy import optimize as opt
+import scipy.fft
+import scipy.sparse
+import scipy.signal
 import multiprocessing as mp
 import json
+try:
+    import pyfftw
+except ImportError:
+    pyfftw = None
 
 
 class StartClass:
@@ -97,8 +111,27 @@ class StartClass:
                 Keys : absolute paths to studies' folders;
                 Values : inner dicts.
             Inner dict:
-                Keys : absolute paths to series' folders;
-                Values : list of files that are in respective series' folder.
+                Keys : names of series' folders (with suffix '_S<Series Number>'
+                    if the folder contains several series);
+                Values : list of files of respective series ordered by
+                    Instance Number and slice position.
+
+        pixel_cache : instance of class PixelArrayCache
+            Decoded int16 pixel arrays used by method create_base_array.
+
+        scan_catalog_name : string
+            Name of SQLite file containing folders and headers of previous scans.
+
+        scan_catalog : instance of class ScanCatalog or None
+            Catalog of previous scans (None if 'use_scan_catalog' is False in init_dict).
+
+        header_catalog : instance of class HeaderCatalog
+            Headers of all images in filelist, read without pixel data.
+            Used to fill attributes im_height_dict, im_width_dict and metadata_dict.
+
+        series_volumes : instance of class SeriesVolumeStore or None
+            Memory-mapped int16 volumes of series folders, used by method create_base_array
+            (None if 'use_series_volumes' is False in init_dict).
 
         new_files : dict of dicts
             Dict containing filelist and filedict attributes.
@@ -118,15 +151,19 @@ class StartClass:
             Create dialog window for selecting folder with all images
             to be analyzed. Used to build attribute folder_with_images.
 
-        create_dataset_dictionary(list_of_indices, dataset_dicom)
-            Retrieve metadata from current dicom-file. Used to build attribute metadata_subdict.
+        compile_tag_paths(list_of_indices)
+            Convert tags' hexstrings into integer tag paths once.
+
+        private_creator_tag(tag)
+            Return tag of private creator of private tag.
 
-        create_filelist(self, pathtoFiles, suffix_array)
-            Search for files with specified extensions and build list of them.
+        read_tag_values(dataset_dicom, tag_paths)
+            Retrieve metadata of compiled tag paths from dicom-file.
+            Used to build attribute metadata_subdict.
 
-        create_filedict(self, pathtoFiles, suffix_array)
-            Search for files with specified extensions and build
-            sorting dict of files to be analyzed.
+        scan_folder(self, pathtoFiles, suffix_array, scan_catalog=None)
+            Search for files with specified extensions and build list of them
+            and sorting dict of files to be analyzed in one traversal.
 
         exclude_files(self, file_dict, file_list,
                       num_files_to_exclude_start,
@@ -197,6 +234,8 @@ class StartClass:
 
         # name for json-file containing previous settings
         self.file_exclusion_json = 'file_exclusion_settings.txt'
+        # name for SQLite file containing folders and headers of previous scans
+        self.scan_catalog_name = 'scan_catalog.sqlite'
         # dictionary for measurements of each image
         self.im_height_dict = {}
         self.im_width_dict = {}
@@ -206,6 +245,8 @@ class StartClass:
         self.metadata_dict = {}
         # collect all images in png-format
         self.all_images = []
+        # cache of decoded pixel arrays
+        self.pixel_cache = PixelArrayCache(max_megabytes=init_dict['pixel_cache_max_mb'])
 
         # create dialog window to specify part of meta data to be retrieved
         # creating dialog window for entering tag numbers
@@ -228,12 +269,34 @@ class StartClass:
         # select folder with images
         self.folder_with_images = self.select_folder(
             title='Select folder with images')
-        # create list of found images
-        self.filelist = self.create_filelist(pathtoFiles=self.folder_with_images,
-                                             suffix_array=self.suffixes)
-
-        self.filedict = self.create_filedict(pathtoFiles=self.folder_with_images,
-                                             suffix_array=self.suffixes)
+        # open catalog of previous scans
+        self.scan_catalog = None
+        if init_dict['use_scan_catalog']:
+            self.scan_catalog = ScanCatalog(db_path=self.scan_catalog_name,
+                                            suffixes=self.suffixes,
+                                            metadata_tags_list=self.metadata_tags_list)
+        # create list and sorting dict of found images
+        found_files = self.scan_folder(pathtoFiles=self.folder_with_images,
+                                       suffix_array=self.suffixes,
+                                       scan_catalog=self.scan_catalog)
+        self.filelist = found_files['file_list']
+        self.filedict = found_files['file_dict']
+
+        # read headers of all images (without pixel data)
+        self.header_catalog = HeaderCatalog(metadata_tags_list=self.metadata_tags_list,
+                                            workers=init_dict['header_workers'])
+        self.header_catalog.build(filelist=self.filelist, scan_catalog=self.scan_catalog)
+        if self.scan_catalog is not None:
+            self.scan_catalog.prune(root_folder=self.folder_with_images, file_list=self.filelist)
+            self.scan_catalog.close()
+        for path_to_file, record in self.header_catalog.records.items():
+            self.im_height_dict.update({path_to_file: record['rows']})
+            self.im_width_dict.update({path_to_file: record['columns']})
+            self.metadata_dict.update({path_to_file: record['metadata_subdict']})
+        # group files into series and order slices by their headers
+        grouped_files = self.header_catalog.group_series(filelist=self.filelist)
+        self.filelist = grouped_files['file_list']
+        self.filedict = grouped_files['file_dict']
 
         # create dialog window to exclude some files from folders
         fields = ['remove_begin', 'remove_end']
@@ -261,6 +324,13 @@ class StartClass:
         self.filelist = self.new_files['file_list']
         self.filedict = self.new_files['file_dict']
 
+        # stack series into memory-mapped volumes
+        self.series_volumes = None
+        if init_dict['use_series_volumes']:
+            self.series_volumes = SeriesVolumeStore(folder=StartClass.create_aux_folder('04.Series_volumes'),
+                                                    workers=init_dict['decode_workers'])
+            self.series_volumes.build(filedict=self.filedict, header_catalog=self.header_catalog)
+
         # self.create_image_arrays(filelist=self.filelist)
         # create png-images
         for num, key in enumerate(self.filelist):
@@ -293,51 +363,71 @@ class StartClass:
         return list_of_indices
 
     @staticmethod
-    def create_dataset_dictionary(list_of_indices, dataset_dicom):
+    def compile_tag_paths(list_of_indices):
         """
-        Retrieve specified metadata from dicom-file.
+        Convert tags' hexstrings into integer tag paths once.
 
-        :param list_of_indices: list of hexstrings
-            Tags' hexadecimal numbers. Attribute metadata_tags_list is a value
-            of this parameter (see init of class StartClass).
-        :param dataset_dicom: Dataset object
-            Dataset object of current dicom-file
-        :return: dataset_dict : dict
-            (See attribute metadata_subdict in init of class StartClass).
+        :param list_of_indices: list of lists of hexstrings
+            (See attribute metadata_tags_list of class StartClass)
+        :return: list of tuples of ints
+            The first integer tag is a tag of the dataset, each further
+            tag is a tag in the first item of the sequence before.
         """
 
-        # initialize dataset_dictionary
-        dataset_dictionary = {}
+        tag_paths = []
         # iterate over indices in the passed list
         for prop_index in list_of_indices:
             if len(prop_index) < 2:
                 continue
-            first_index = prop_index[0]
-            second_index = prop_index[1]
-            # retrieve DataElement object
-            try:
-                d_element = dataset_dicom[first_index, second_index]
-                # if sub indices are used
-                if len(prop_index) > 2:
-                    # iterate over indices in prop_index
-                    for num_index, sub_index in enumerate(prop_index[2:]):
-                        # iterate only over even indices of prop_index
-                        if num_index % 2 != 0:
-                            continue
-                        d_element = d_element[0][sub_index,
-                                                 prop_index[num_index + 3]]
+            # pairs of group and element numbers
+            tag_paths.append(tuple(int(prop_index[num_index], 16) << 16 | int(prop_index[num_index + 1], 16)
+                                   for num_index in range(0, len(prop_index) - 1, 2)))
+        return tag_paths
 
-                # get value of property
-                value_of_property = d_element.value
-                # get the name of property
-                try:
-                    name_of_property = d_element.name
-                except IndexError:
-                    name_of_property = ''
-                    print('problem with: ', d_element)
-                dataset_dictionary.update({name_of_property: value_of_property})
-            except KeyError:
+    @staticmethod
+    def private_creator_tag(tag):
+        """
+        Return tag of private creator of private tag (or None for other tags).
+        Private creator is needed to name private tags.
+
+        :param tag: int
+        :return: int or None
+        """
+
+        group, element = tag >> 16, tag & 0xFFFF
+        if group % 2 == 0 or element < 0x1000:
+            return None
+        return group << 16 | element >> 8
+
+    @staticmethod
+    def read_tag_values(dataset_dicom, tag_paths):
+        """
+        Retrieve values of compiled tag paths from dicom-file.
+
+        :param dataset_dicom: Dataset object
+            Dataset object of current dicom-file
+        :param tag_paths: list of tuples
+            (See return of method compile_tag_paths)
+        :return: dataset_dict : dict
+            Keys : names of present tags (private tags are named through
+            their private creator) or 'undefined_tag';
+            Values : values of tags ('undefined' for 'undefined_tag').
+        """
+
+        # initialize dataset_dictionary
+        dataset_dictionary = {}
+        for tag_path in tag_paths:
+            d_element = dataset_dicom.get(tag_path[0]) if dataset_dicom is not None else None
+            # descend into first items of sequences
+            for sub_tag in tag_path[1:]:
+                if d_element is None or d_element.VR != 'SQ' or len(d_element.value) == 0:
+                    d_element = None
+                    break
+                d_element = d_element.value[0].get(sub_tag)
+            if d_element is None:
                 dataset_dictionary.update({'undefined_tag': 'undefined'})
+            else:
+                dataset_dictionary.update({d_element.name: d_element.value})
         return dataset_dictionary
 
     def select_folder(self, title):
@@ -355,144 +445,102 @@ class StartClass:
         root_2.mainloop()
         return selected_folder
 
-    def create_filelist(self, pathtoFiles, suffix_array):
-        """
-        Search for files with specified extensions and build list of files to be analyzed.
-        :param pathtoFiles: string
-            Path to folder with all images to be analyzed
-        :param suffix_array: list of strings
-            Extensions of files to be searched for.
-        :return: list of strings
-            List of paths to all found images
-        """
-
-        print('create_filelist is being executed')
-        # list of paths to all found files
-        lstFiles = []
-        # find out how many files found
-        counter_files = 0
-        sorted_file_names = []
-        # list of all directories with found files
-        all_dir_names = []
-        # empty dict to sort files in directories
-        directories_dict = {}
-        # subdict = {}
-        # search for files with certain extensions
-        for dirName, subdirList, fileList in os.walk(pathtoFiles):
-            for filename in fileList:
-                # if any of extensions are present in filename
-                if any(suffix.lower() in filename.lower() for suffix in suffix_array):
-                    lstFiles.append(os.path.join(dirName, filename))
-                    filepath = os.path.join(dirName, filename)
-                    # base name of current directory with file
-                    basedirname = os.path.basename(dirName)
-                    classdirname = os.path.dirname(os.path.dirname(dirName))
-                    try:  # update dict if the key-value-pair already exists
-                        temp_dict = directories_dict[classdirname]
-                    except KeyError:
-                        sub_dict = {}
-                        directories_dict.update({classdirname: sub_dict})
-                        temp_dict = directories_dict[classdirname]
-                    try:
-                        temp_list = temp_dict[basedirname]
-                        temp_list.append(filepath)
-                        temp_dict.update({basedirname: temp_list})
-                        directories_dict.update({classdirname: temp_dict})
-                    except KeyError:
-                        # or create key-value pair
-
-                        # get subdict
-                        temp_subdict = directories_dict[classdirname]
-                        temp_subdict.update({basedirname: [filepath]})
-                        directories_dict.update({classdirname: temp_subdict})
-
-        # create array of only file names, sorted generally (based on whole path)
-        for fnamepath in natsorted(lstFiles, alg=ns.IGNORECASE):
-            sorted_file_names.append(os.path.basename(fnamepath))
-        # create array of only folder names, sorted generally (based on whole path)
-        for fdir in natsorted(lstFiles, alg=ns.IGNORECASE):
-            all_dir_names.append(os.path.basename(os.path.dirname(fdir)))
-        # print base names of found files
-        for q in natsorted(lstFiles, alg=ns.IGNORECASE):
-            print(os.path.basename(q))
-        # print the number of found files
-        print('%d files have been found' % len(lstFiles))
-        print('create_filelist is done')
-        return natsorted(lstFiles, alg=ns.IGNORECASE, key=lambda x: x.split('_')[-1])
-
-    def create_filedict(self, pathtoFiles, suffix_array):
+    def scan_folder(self, pathtoFiles, suffix_array, scan_catalog=None):
 
         """
-        Search for files with specified extensions and build
-        sorting dict of files to be analyzed.
+        Search for files with specified extensions and build the list of
+        files to be analyzed together with the sorting dict of them
+        in a single traversal of the folder tree.
+        Zip and tar archives are listed like folders (See class ArchiveInput).
         :param pathtoFiles: string
             Path to folder with all images to be analyzed
         :param suffix_array: list of strings
             Extensions of files to be searched for.
-        :return: dict of dicts
-            (See attribute filedict of class StartClass)
+        :param scan_catalog: instance of class ScanCatalog or None
+            If passed, folders with unchanged modification time
+            are not listed again, their stored listing is used.
+        :return: dict
+            Key: 'file_list' : Value: list of paths to all found images
+                (See attribute filelist of class StartClass);
+            Key: 'file_dict' : Value: dict of dicts
+                (See attribute filedict of class StartClass).
         """
 
-        print('create_filedict is being executed')
-
+        print('scan_folder is being executed')
 
+        # lower-case suffixes are built once for all files
+        suffixes_lower = [suffix.lower() for suffix in suffix_array]
         # list of paths to all found files
         lstFiles = []
-        # find out how many files found
-        counter_files = 0
-        sorted_file_names = []
-        # list of all directories with found files
-        all_dir_names = []
+        # number of visited folders
+        counter_folders = 0
+        # folders still to be visited
+        folders_to_scan = [pathtoFiles]
+        # number of folders, whose listing has been taken from the scan catalog
+        counter_unchanged_folders = 0
+        while folders_to_scan:
+            dirName = folders_to_scan.pop()
+            counter_folders += 1
+            try:
+                dir_mtime_ns = os.stat(dirName).st_mtime_ns
+                stored_folder = None if scan_catalog is None else scan_catalog.get_folder(dirName)
+                # unchanged folder: reuse its stored listing
+                if stored_folder is not None and stored_folder[0] == dir_mtime_ns:
+                    counter_unchanged_folders += 1
+                    subfolder_names, file_names = stored_folder[1], stored_folder[2]
+                else:
+                    subfolder_names = []
+                    file_names = []
+                    # archives are listed like folders (names of members contain their sub-folders)
+                    if ArchiveInput.is_archive(dirName):
+                        for member_name in ArchiveInput.list_members(dirName):
+                            if any(suffix in os.path.basename(member_name).lower() for suffix in suffixes_lower):
+                                file_names.append(member_name)
+                    else:
+                        with os.scandir(dirName) as dir_entries:
+                            for entry in dir_entries:
+                                # descend into sub-folders (symbolic links are not followed as in os.walk)
+                                # and into archives
+                                if entry.is_dir(follow_symlinks=False) or \
+                                        (ArchiveInput.is_archive(entry.name) and entry.is_file()):
+                                    subfolder_names.append(entry.name)
+                                # if any of extensions are present in filename
+                                elif any(suffix in entry.name.lower() for suffix in suffixes_lower):
+                                    file_names.append(entry.name)
+                    if scan_catalog is not None:
+                        scan_catalog.put_folder(dirName, dir_mtime_ns, subfolder_names, file_names)
+            except (OSError, zipfile.BadZipFile, tarfile.TarError):
+                print('Folder %s can not be read' % dirName)
+                continue
+            folders_to_scan += [os.path.join(dirName, subfolder_name) for subfolder_name in subfolder_names]
+            for filename in file_names:
+                lstFiles.append(os.path.join(dirName, filename))
+                # stream progress
+                if len(lstFiles) % 1000 == 0:
+                    print('%d files found in %d folders' % (len(lstFiles), counter_folders))
+
+        # sort keys are computed only once per file
+        natsort_key = natsort_keygen(key=lambda x: x.split('_')[-1], alg=ns.IGNORECASE)
+        sort_keys = [natsort_key(filepath) for filepath in lstFiles]
+        file_list = [lstFiles[i] for i in sorted(range(len(lstFiles)), key=sort_keys.__getitem__)]
+
         # empty dict to sort files in directories
         directories_dict = {}
-        # subdict = {}
-        # search for files with certain extensions
-        for dirName, subdirList, fileList in os.walk(pathtoFiles):
-            for filename in fileList:
-                # # counter used to exclude files from the start of the list
-                # counter_exclude_start = 1
-                # # counter used to exclude file from the end of the list
-                # counter_exclude_end = len(fileList)
-                # if any of extensions are present in filename
-                if any(suffix.lower() in filename.lower() for suffix in suffix_array):
-                    lstFiles.append(os.path.join(dirName, filename))
-                    filepath = os.path.join(dirName, filename)
-                    # base name of current directory with file
-                    basedirname = os.path.basename(dirName)
-                    classdirname = os.path.dirname(dirName)
-                    try:  # update dict if the key-value-pair already exists
-                        temp_dict = directories_dict[classdirname]
-                    except KeyError:
-                        sub_dict = {}
-                        directories_dict.update({classdirname: sub_dict})
-                        temp_dict = directories_dict[classdirname]
-                    try:
-                        temp_list = temp_dict[basedirname]
-                        temp_list.append(filepath)
-                        temp_dict.update({basedirname: temp_list})
-                        directories_dict.update({classdirname: temp_dict})
-                    except KeyError:
-                        # or create key-value-pair
-
-                        # get subdict
-                        temp_subdict = directories_dict[classdirname]
-                        temp_subdict.update({basedirname: [filepath]})
-                        directories_dict.update({classdirname: temp_subdict})
-
-        # create array of only file names, sorted generally (based on whole path)
-        for fnamepath in natsorted(lstFiles, alg=ns.IGNORECASE):
-            sorted_file_names.append(os.path.basename(fnamepath))
-        # create array of only folder names, sorted generally (based on whole path)
-        for fdir in natsorted(lstFiles, alg=ns.IGNORECASE):
-            all_dir_names.append(os.path.basename(os.path.dirname(fdir)))
-        # print base names of found files
-        # for q in natsorted(lstFiles, alg=ns.IGNORECASE):
-        #     print(os.path.basename(q))
-        # # print the number of found files
-        # print('%d files have been found' % len(lstFiles))
-        print('create_filedict is done')
-
-        return directories_dict
+        for filepath in file_list:
+            dirName = os.path.dirname(filepath)
+            # base name of current directory with file
+            basedirname = os.path.basename(dirName)
+            classdirname = os.path.dirname(dirName)
+            directories_dict.setdefault(classdirname, {}).setdefault(basedirname, []).append(filepath)
+
+        # print the number of found files
+        print('%d files have been found in %d folders '
+              '(%d folders unchanged since last scan)' % (len(file_list), counter_folders,
+                                                          counter_unchanged_folders))
+        print('scan_folder is done')
+
+        return {'file_list': file_list,
+                'file_dict': directories_dict}
 
     def exclude_files(self, file_dict, file_list,
                       num_files_to_exclude_start,
@@ -524,36 +572,25 @@ class StartClass:
 
             return ret_dict
 
-        # empty list for files to exclude
-        files_to_exclude = []
-
-        # drop files in file_dict
-
+        # drop files in file_dict (series are already ordered, see method group_series of class HeaderCatalog)
         # iterate over folders
-        for folder in natsorted(file_dict.keys(), key=lambda f: f.split('_')[-1]):
+        for folder in file_dict:
             temp_dict = file_dict[folder]
             # iterate over series
-            for series in natsorted(temp_dict.keys(), key=lambda f: f.split('_')[-1]):
+            for series in temp_dict:
                 # get list of files in series
                 temp_list = temp_dict[series]
-                # drop files
-                try:
-                    new_temp_list = temp_list[num_files_to_exclude_start: -num_files_to_exclude_end]
-                    files_to_exclude += temp_list[:num_files_to_exclude_start]
-                    files_to_exclude += temp_list[-num_files_to_exclude_end:]
-                    temp_dict.update({series: new_temp_list})
-                except IndexError:
+                if len(temp_list) <= num_files_to_exclude_start + num_files_to_exclude_end:
                     print('There less files in the folder %s/%s, than attempted to exclude' % (folder, series))
-            file_dict.update({folder: temp_dict})
-
-        # get rid of repeated file names
-        files_to_exclude = set(files_to_exclude)
-        files_to_exclude = list(files_to_exclude)
-
-        for file_to_remove in files_to_exclude:
-            file_list.remove(file_to_remove)
+                # drop files
+                temp_dict.update({series: temp_list[num_files_to_exclude_start:
+                                                    max(num_files_to_exclude_start,
+                                                        len(temp_list) - num_files_to_exclude_end)]})
 
-        file_list = natsorted(file_list, alg=ns.IGNORECASE)
+        # remaining files in order of file_dict
+        file_list = [image_file for folder in file_dict
+                     for series in file_dict[folder]
+                     for image_file in file_dict[folder][series]]
 
         ret_dict = {'file_list': file_list,
                     'file_dict': file_dict}
@@ -567,49 +604,59 @@ class StartClass:
         """
         Read current dicom file and retrieve pixel array.
         Retrieve part of meta data
-        and update attribute metadata_dict
+        and update attribute metadata_dict.
+        Pixel arrays are taken from attribute series_volumes if available.
+        Otherwise decoded pixel arrays are kept in attribute pixel_cache,
+        so repeated calls for the same file do not decode it again.
         :param image_file: string
             Absolute path to current image.
         :return: dict
-            Key: 'base_array' : Value: pixel array of current image;
+            Key: 'base_array' : Value: pixel array of current image (int16, read-only);
             Key: 'meatdata_subdict' : Value: dict of specified metadata;
-            Key: 'whole_dcm' : Value: Dataset object of current dicom.
+            Key: 'whole_dcm' : Value: Dataset object of current dicom
+                (None if the pixel array has been taken from the cache).
         """
 
         print('create_base_array is being executed')
 
+        # slice of series volume or decoded pixel array of this version of the file, if it is cached
+        base_array = None
+        if self.series_volumes is not None:
+            base_array = self.series_volumes.get(image_file)
+        if base_array is None:
+            mtime = ArchiveInput.getmtime(image_file)
+            base_array = self.pixel_cache.get(image_file, mtime)
+
+        # decode the file, if its pixel array is not cached
+        image_dcm = None
+        if base_array is None:
+            decoded = StartClass.read_pixel_array(image_file)
+            self.array = decoded['base_array']
+            image_dcm = decoded['whole_dcm']
+
         # if we handle with dicom-file
         if os.path.basename(image_file)[-4:] == '.dcm':
-            try:
-                # create data element object from dicom
-                image_dcm = pydicom.dcmread(image_file, force=True)
-            except:
-                print('\n\n\nThere is a problem with the file: ')
-                print(image_file)
-            gc.collect()
-            self.array = image_dcm.pixel_array
-            self.metadata_subdict = StartClass.create_dataset_dictionary(
-                list_of_indices=self.metadata_tags_list,
-                dataset_dicom=image_dcm
-            )
+            # metadata have been already extracted by the header catalog
+            if image_file in self.metadata_dict:
+                self.metadata_subdict = self.metadata_dict[image_file]
+            else:
+                self.metadata_subdict = StartClass.read_tag_values(dataset_dicom=image_dcm,
+                                                                   tag_paths=self.header_catalog.tag_paths)
             metadata_subdict = self.metadata_subdict
             self.metadata_dict.update({image_file: self.metadata_subdict})
 
         # if we handle file with another file-extension
         else:
-            # read image as list with PIL-library
-            img = Image.open(image_file)
-            # convert list into numpy-array
-            self.array = np.array(img)
-            # if we have colored image
-            if len(self.array.shape) > 2:
-                self.array = self.rgb2gray(self.array)
             self.metadata_subdict = {'undefined': 'undefined'}
             metadata_subdict = {'undefined': 'undefined'}
 
             # if the image is not a dicom, store 'undefined' in metadata_dict
             self.metadata_dict.update({image_file: {'undefined_tag': 'undefined'}})
             image_dcm = ''
+        # store newly decoded array in the cache
+        if base_array is None:
+            base_array = self.pixel_cache.put(image_file, mtime, self.array)
+        self.array = base_array
         # image measurements
         self.px_height = self.array.shape[0]
         self.px_width = self.array.shape[1]
@@ -618,7 +665,7 @@ class StartClass:
         # image file base name with extension
         self.basename_w_ext = os.path.basename(image_file)
 
-        ret_dict = {'base_array': self.array.astype(np.int16),
+        ret_dict = {'base_array': base_array,
                     'metadata_subdict': metadata_subdict,
                     'whole_dcm': image_dcm}
 
@@ -626,6 +673,144 @@ class StartClass:
 
         return ret_dict
 
+    @staticmethod
+    def read_pixel_array(image_file, keep_dataset=True):
+
+        """
+        Decode pixel array of one image file.
+        Static, so that it can be run in worker processes
+        (see method decode_series of class ProcessROI).
+        :param image_file: string
+            Absolute path to image.
+        :param keep_dataset: boolean
+            Whether the Dataset object of a dicom should be returned.
+            Workers do not return it to avoid pickling of whole datasets.
+        :return: dict
+            Key: 'base_array' : Value: pixel array of the image (int16);
+            Key: 'pixel_spacing' : Value: list of two floats (None if not available);
+            Key: 'whole_dcm' : Value: Dataset object of dicom
+                (None for not-dicoms or if keep_dataset is False).
+        """
+
+        image_dcm = None
+        pixel_spacing = None
+        # if we handle with dicom-file
+        if os.path.basename(image_file)[-4:] == '.dcm':
+            try:
+                # create data element object from dicom (file or archive member)
+                with ArchiveInput.open_file(image_file) as file_obj:
+                    image_dcm = pydicom.dcmread(file_obj, force=True)
+            except:
+                print('\n\n\nThere is a problem with the file: ')
+                print(image_file)
+            array = image_dcm.pixel_array
+            if 'PixelSpacing' in image_dcm:
+                pixel_spacing = [float(value) for value in image_dcm.PixelSpacing]
+            if not keep_dataset:
+                image_dcm = None
+        # if we handle file with another file-extension
+        else:
+            # read image with PIL-library and convert it into numpy-array
+            with ArchiveInput.open_file(image_file) as file_obj:
+                array = np.array(Image.open(file_obj))
+            # if we have colored image, convert it to grayscale
+            # (same formula as in method rgb2gray)
+            if len(array.shape) > 2:
+                array = np.dot(array[..., :3], [0.299, 0.587, 0.114])
+
+        ret_dict = {'base_array': array.astype(np.int16),
+                    'pixel_spacing': pixel_spacing,
+                    'whole_dcm': image_dcm}
+
+        return ret_dict
+
+    @staticmethod
+    def read_pixel_rows(image_file, row_span, keep_dataset=False):
+
+        """
+        Read only rows row_span[0]:row_span[1] of an uncompressed
+        single-frame dicom directly from the file.
+        The offset of Pixel Data is found by reading the header up to it;
+        rows outside of the span are left zero.
+        Files with compressed or big endian transfer syntax, several frames
+        or samples per pixel as well as not-dicoms are decoded completely
+        by method read_pixel_array.
+        :param image_file: string
+            Absolute path to image.
+        :param row_span: tuple of two ints
+            First row and row after the last row to be read
+            (i.e. union of row ranges of all ROIs on the image).
+        :param keep_dataset: boolean
+            Passed to read_pixel_array if the image is decoded completely.
+        :return: dict
+            Keys as in method read_pixel_array and additionally
+            Key: 'partial' : Value: boolean, whether only the row span has been read
+                (such arrays must not be stored in the pixel cache).
+        """
+
+        # transfer syntaxes with native little endian pixel data
+        uncompressed_syntaxes = ['1.2.840.10008.1.2', '1.2.840.10008.1.2.1']
+        if os.path.basename(image_file)[-4:] == '.dcm':
+            try:
+                with ArchiveInput.open_file(image_file) as file_obj:
+                    # reading stops in front of the Pixel Data element
+                    header_dcm = pydicom.dcmread(file_obj, force=True, stop_before_pixels=True)
+                    element_start = file_obj.tell()
+                    transfer_syntax = str(header_dcm.file_meta.get('TransferSyntaxUID', '1.2.840.10008.1.2'))
+                    bits_allocated = int(header_dcm.get('BitsAllocated', 0))
+                    bits_stored = int(header_dcm.get('BitsStored', bits_allocated))
+                    usable = (transfer_syntax in uncompressed_syntaxes
+                              and bits_allocated in (8, 16)
+                              and int(header_dcm.get('SamplesPerPixel', 1)) == 1
+                              and int(header_dcm.get('NumberOfFrames', 1) or 1) == 1)
+                    if usable:
+                        rows = int(header_dcm.Rows)
+                        columns = int(header_dcm.Columns)
+                        # tag and length (and VR) of Pixel Data element
+                        element_header = file_obj.read(12 if transfer_syntax == '1.2.840.10008.1.2.1' else 8)
+                        tag = struct.unpack('<HH', element_header[:4])
+                        length = struct.unpack('<I', element_header[-4:])[0]
+                        bytes_per_pixel = bits_allocated // 8
+                        usable = (tag == (0x7FE0, 0x0010)
+                                  and length != 0xFFFFFFFF
+                                  and length >= rows * columns * bytes_per_pixel)
+                    if usable:
+                        first_row = max(0, int(row_span[0]))
+                        last_row = min(rows, int(row_span[1]))
+                        signed = int(header_dcm.get('PixelRepresentation', 0)) == 1
+                        dtype = np.dtype('<%s%d' % ('i' if signed else 'u', bytes_per_pixel))
+                        # read row span only
+                        file_obj.seek(element_start + len(element_header) + first_row * columns * bytes_per_pixel)
+                        rows_array = np.frombuffer(file_obj.read(max(0, last_row - first_row) * columns * bytes_per_pixel),
+                                                   dtype=dtype).reshape(-1, columns)
+            except:
+                usable = False
+            if usable:
+                # keep only stored bits (as pydicom does)
+                if bits_stored < bits_allocated:
+                    rows_array = rows_array.astype(np.int32) & ((1 << bits_stored) - 1)
+                    if signed:
+                        rows_array = np.where(rows_array >= 1 << (bits_stored - 1),
+                                              rows_array - (1 << bits_stored), rows_array)
+                array = np.zeros((rows, columns), dtype=np.int16)
+                array[first_row:first_row + rows_array.shape[0]] = rows_array
+                pixel_spacing = None
+                if 'PixelSpacing' in header_dcm:
+                    pixel_spacing = [float(value) for value in header_dcm.PixelSpacing]
+
+                ret_dict = {'base_array': array,
+                            'pixel_spacing': pixel_spacing,
+                            'whole_dcm': header_dcm if keep_dataset else None,
+                            'partial': True}
+
+                return ret_dict
+
+        # complete decoding
+        ret_dict = StartClass.read_pixel_array(image_file, keep_dataset=keep_dataset)
+        ret_dict['partial'] = False
+
+        return ret_dict
+
     def rgb2gray(self, rgb):
         
         """
@@ -683,64 +868,1235 @@ class StartClass:
             filename
         """
 
-        print('create_image_from_2d_array is being executed')
+        print('create_image_from_2d_array is being executed')
+
+        image_array = np.array(StartClass.norm_2d_array(arr_2d=arr_2d,
+                                                        value_min=0,
+                                                        value_max=255))
+        cv2.imwrite(filename=filename, img=image_array)
+
+        print('create_image_from_2d_array is done')
+
+        return filename
+
+    def create_png_image(self, key):
+        
+        """
+        Create .png-image from current dicom-file.
+        :param key: string
+            Absolute path to dicom file
+        :return: string
+            Absolute path to created image.
+        """
+
+        print('create_png_image is being executed')
+
+        # pixel array for current image
+        curr_array = self.create_base_array(key)['base_array']
+        # name of image file without extension
+        name_of_file_without_extension = os.path.basename(key)[:-4]
+        # create png-image
+        png_image_path = StartClass.create_image_from_2d_array(arr_2d=curr_array,
+                                                               filename='03.PNG_images/%s.png' %
+                                                               name_of_file_without_extension)
+        # store path to png image in list
+        # self.all_images.append(png_image_path)
+        # return self.all_images
+
+        print('create_png_image is done')
+
+        return png_image_path
+
+    @staticmethod
+    def create_aux_folder(folder_name):
+
+        """
+        Create auxiliary folder in the directory with executable py-file.
+        :param folder_name: string
+            Name of folder to be created (not path to it!)
+        :return: string
+            Absolute path to the created folder.
+        """
+        # current folder with py-file
+        cur_fold = os.path.dirname(os.path.abspath(__file__))
+        # path to auxiliary folder
+        aux_folder = cur_fold + '/' + folder_name
+        # if the folder does not exist yet, create it
+        if not os.path.exists(aux_folder):
+            os.mkdir(aux_folder)
+        # return path to folder
+        return aux_folder
+
+
+class ArchiveInput:
+
+    """
+    Read images stored in zip or tar archives without unpacking them by hand.
+
+    Archives are treated like folders: a member is addressed by the virtual
+    path of the archive joined with the name of the member,
+    e.g. 'D:/exports/study.zip/Ct_Abdomen - 001/ser_1/img_1.dcm'.
+    Members are read into memory and handed to pydicom or PIL as file-like objects.
+    Archives are opened once per process and listed in archive order,
+    so that members can be read sequentially. Compressed tar archives allow
+    no random access to members; their files are extracted once in archive order
+    into a temporary folder, which is shared with forked worker processes.
+    Handles and temporary folders are released by method close_archives.
+
+    Attributes
+    ----------
+    archive_suffixes : tuple of strings
+        Lower-case suffixes of recognized archives.
+    open_archives : dict
+        Keys : tuples (process id, absolute path to archive);
+        Values : dicts with keys
+            'handle' : ZipFile or TarFile object (None for compressed tar archives),
+            'members' : dict of ZipInfo or TarInfo objects by member name,
+            'order' : list of member names (files only) in archive order,
+            'mtime_ns' : modification time of the archive in ns,
+            'extracted' : dict of paths to extracted files by member name
+                          (compressed tar archives; None for others).
+    extracted_archives : dict
+        Keys : absolute paths to compressed tar archives;
+        Values : dicts returned by method extract_members.
+    archive_folders : dict
+        Keys : absolute paths to folders (or folders inside archives);
+        Values : absolute path to archive containing the folder (None for usual folders).
+
+    Methods
+    -------
+    is_archive(path)
+        Whether passed path has suffix of an archive.
+    split_path(path)
+        Split virtual path into path to archive and name of member.
+    get_archive(archive_path)
+        Return opened archive of current process.
+    extract_members(archive_path)
+        Extract files of compressed tar archive into a temporary folder.
+    close_archives()
+        Close opened archives and delete temporary folders.
+    list_members(archive_path)
+        Return names of files in archive in archive order.
+    archive_order(image_files)
+        Sort paths, so that members of each archive are in archive order.
+    open_file(path)
+        Return binary file-like object of file or archive member.
+    stat(path)
+        Return size and modification time in ns of file or archive member.
+    getmtime(path)
+        Return modification time of file or archive member in seconds.
+    output_folder(folder)
+        Return real folder for results of a (virtual) folder.
+    """
+
+    archive_suffixes = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+    open_archives = {}
+    extracted_archives = {}
+    archive_folders = {}
+
+    @staticmethod
+    def is_archive(path):
+
+        """
+        Whether passed path has suffix of an archive.
+        :param path: string
+        :return: boolean
+        """
+
+        return path.lower().endswith(ArchiveInput.archive_suffixes)
+
+    @staticmethod
+    def split_path(path):
+
+        """
+        Split virtual path into path to archive and name of member.
+        :param path: string
+            Absolute path to file or archive member.
+        :return: tuple
+            (path to archive, name of member) or (None, None) for usual files.
+        """
+
+        # archive containing the folder is looked up once per folder
+        folder = os.path.dirname(path)
+        if folder not in ArchiveInput.archive_folders:
+            archive_path = None
+            head = folder
+            while True:
+                if ArchiveInput.is_archive(head) and os.path.isfile(head):
+                    archive_path = head
+                    break
+                parent = os.path.dirname(head)
+                if parent == head:
+                    break
+                head = parent
+            ArchiveInput.archive_folders[folder] = archive_path
+        archive_path = ArchiveInput.archive_folders[folder]
+        if archive_path is None:
+            return None, None
+        return archive_path, os.path.relpath(path, archive_path).replace(os.sep, '/')
+
+    @staticmethod
+    def get_archive(archive_path):
+
+        """
+        Return opened archive of current process.
+        Handles are not shared with forked worker processes.
+        :param archive_path: string
+            Absolute path to archive.
+        :return: dict
+            (See values of attribute open_archives)
+        """
+
+        key = (os.getpid(), archive_path)
+        if key not in ArchiveInput.open_archives:
+            handle = None
+            extracted = None
+            if zipfile.is_zipfile(archive_path):
+                handle = zipfile.ZipFile(archive_path, 'r')
+                member_infos = [info for info in handle.infolist() if not info.is_dir()]
+                members = {info.filename: info for info in member_infos}
+            elif archive_path.lower().endswith('.tar'):
+                handle = tarfile.open(archive_path, 'r:*')
+                member_infos = [info for info in handle.getmembers() if info.isfile()]
+                members = {info.name: info for info in member_infos}
+            else:
+                # compressed streams allow no random access to members, they are extracted once
+                # (forked worker processes use the folder extracted by the parent process)
+                if archive_path not in ArchiveInput.extracted_archives:
+                    ArchiveInput.extracted_archives[archive_path] = ArchiveInput.extract_members(archive_path)
+                members = ArchiveInput.extracted_archives[archive_path]['members']
+                extracted = ArchiveInput.extracted_archives[archive_path]['paths']
+            ArchiveInput.open_archives[key] = {'handle': handle,
+                                               'members': members,
+                                               'order': list(members),
+                                               'mtime_ns': os.stat(archive_path).st_mtime_ns,
+                                               'extracted': extracted}
+        return ArchiveInput.open_archives[key]
+
+    @staticmethod
+    def extract_members(archive_path):
+
+        """
+        Extract files of compressed tar archive into a temporary folder.
+        The archive is read as a stream, i.e. it is decompressed only once.
+        Files are named by their position in the archive, so that member names
+        cannot point outside of the folder.
+        :param archive_path: string
+            Absolute path to archive.
+        :return: dict
+            Key: 'folder' : Value: absolute path to temporary folder;
+            Key: 'members' : Value: dict of TarInfo objects by member name (archive order);
+            Key: 'paths' : Value: dict of absolute paths to extracted files by member name.
+        """
+
+        extracted_folder = tempfile.mkdtemp(prefix='nps_tool_archive_')
+        members = {}
+        paths = {}
+        with tarfile.open(archive_path, 'r|*') as handle:
+            for member_info in handle:
+                if not member_info.isfile():
+                    continue
+                extracted_file = os.path.join(extracted_folder, '%d' % len(members))
+                with handle.extractfile(member_info) as member_file, open(extracted_file, 'wb') as file:
+                    shutil.copyfileobj(member_file, file)
+                members.update({member_info.name: member_info})
+                paths.update({member_info.name: extracted_file})
+        return {'folder': extracted_folder, 'members': members, 'paths': paths}
+
+    @staticmethod
+    def close_archives():
+
+        """
+        Close archives opened by current process and delete temporary folders
+        with extracted members. Archives are opened again, when they are read next time.
+        :return: nothing
+        """
+
+        for key in list(ArchiveInput.open_archives):
+            if key[0] == os.getpid():
+                handle = ArchiveInput.open_archives.pop(key)['handle']
+                if handle is not None:
+                    handle.close()
+        for extracted_archive in ArchiveInput.extracted_archives.values():
+            shutil.rmtree(extracted_archive['folder'], ignore_errors=True)
+        ArchiveInput.extracted_archives.clear()
+        ArchiveInput.archive_folders.clear()
+
+    @staticmethod
+    def list_members(archive_path):
+
+        """
+        Return names of files in archive in archive order.
+        :param archive_path: string
+            Absolute path to archive.
+        :return: list of strings
+        """
+
+        return ArchiveInput.get_archive(archive_path)['order']
+
+    @staticmethod
+    def archive_order(image_files):
+
+        """
+        Sort paths, so that members of each archive follow each other in archive order.
+        Usual files keep their order and come first.
+        :param image_files: list of strings
+            Absolute paths to files or archive members.
+        :return: list of strings
+        """
+
+        usual_files = []
+        archive_members = []
+        for image_file in image_files:
+            archive_path, member_name = ArchiveInput.split_path(image_file)
+            if archive_path is None:
+                usual_files.append(image_file)
+            else:
+                member_order = ArchiveInput.get_archive(archive_path)['order']
+                archive_members.append((archive_path, member_order.index(member_name), image_file))
+        archive_members.sort(key=lambda member: member[:2])
+        return usual_files + [member[2] for member in archive_members]
+
+    @staticmethod
+    def open_file(path):
+
+        """
+        Return binary file-like object of file or archive member.
+        Archive members are read into memory completely.
+        :param path: string
+            Absolute path to file or archive member.
+        :return: file object or BytesIO
+        """
+
+        archive_path, member_name = ArchiveInput.split_path(path)
+        if archive_path is None:
+            return open(path, 'rb')
+        archive = ArchiveInput.get_archive(archive_path)
+        if archive['extracted'] is not None:
+            with open(archive['extracted'][member_name], 'rb') as file:
+                member_bytes = file.read()
+        elif isinstance(archive['handle'], zipfile.ZipFile):
+            member_bytes = archive['handle'].read(member_name)
+        else:
+            member_bytes = archive['handle'].extractfile(archive['members'][member_name]).read()
+        return io.BytesIO(member_bytes)
+
+    @staticmethod
+    def stat(path):
+
+        """
+        Return size and modification time in ns of file or archive member.
+        Members get the modification time of their archive.
+        :param path: string
+            Absolute path to file or archive member.
+        :return: tuple of ints
+            (size in bytes, modification time in ns)
+        """
+
+        archive_path, member_name = ArchiveInput.split_path(path)
+        if archive_path is None:
+            stat_result = os.stat(path)
+            return stat_result.st_size, stat_result.st_mtime_ns
+        archive = ArchiveInput.get_archive(archive_path)
+        member_info = archive['members'][member_name]
+        if isinstance(member_info, zipfile.ZipInfo):
+            return member_info.file_size, archive['mtime_ns']
+        return member_info.size, archive['mtime_ns']
+
+    @staticmethod
+    def getmtime(path):
+
+        """
+        Return modification time of file or archive member in seconds.
+        :param path: string
+            Absolute path to file or archive member.
+        :return: float
+        """
+
+        return ArchiveInput.stat(path)[1] / 1e9
+
+    @staticmethod
+    def output_folder(folder):
+
+        """
+        Return real folder for results of a (virtual) folder.
+        Results of folders inside an archive are written into a folder
+        next to the archive named after it, e.g. 'study.zip/Ct - 001' -> 'study_zip/Ct - 001'.
+        :param folder: string
+            Absolute path to folder or folder inside an archive.
+        :return: string
+            Absolute path to existing folder.
+        """
+
+        archive_path, member_name = ArchiveInput.split_path(os.path.join(folder, 'file'))
+        if archive_path is None:
+            return folder
+        archive_folder = os.path.join(os.path.dirname(archive_path),
+                                      os.path.basename(archive_path).replace('.', '_'))
+        real_folder = os.path.join(archive_folder, os.path.dirname(member_name))
+        os.makedirs(real_folder, exist_ok=True)
+        return real_folder
+
+
+class HeaderCatalog:
+
+    """
+    In-memory table of image headers, built without decoding pixel data.
+
+    All DICOMs are read with stop_before_pixels=True (in parallel if
+    workers > 1). Later stages (GUI, ProcessROI) query this table for
+    image size, pixel spacing and metadata instead of decoding the images.
+
+    Attributes
+    ----------
+    record_version : int
+        Version of layout of records; stored records of other versions
+        are not taken from the scan catalog.
+    metadata_tags_list : list of lists of hexstrings
+        (See attribute metadata_tags_list of class StartClass)
+    tag_paths : list of tuples
+        Compiled metadata_tags_list (See method compile_tag_paths of class StartClass).
+    specific_tags : list of ints
+        Top-level tags, which are parsed by pydicom; all other elements are skipped.
+    workers : int
+        Number of worker processes used to read the headers.
+        0 or 1: headers are read in the main process.
+    records : dict of dicts
+        Keys : absolute paths to images;
+        Values : dicts with keys
+            'rows' : int or None - number of rows of pixel array,
+            'columns' : int or None - number of columns of pixel array,
+            'pixel_spacing' : list of two floats or None - tag (0028,0030),
+            'rescale_slope' : float - tag (0028,1053), 1.0 if not present,
+            'rescale_intercept' : float - tag (0028,1052), 0.0 if not present,
+            'series_uid' : string or None - tag (0020,000E),
+            'instance_uid' : string or None - tag (0008,0018),
+            'series_number' : int or None - tag (0020,0011),
+            'sort_key' : list of four ints - order of slice in its series:
+                [0 if tag (0020,0013) is present else 1, Instance Number,
+                 0 if tag (0020,0032) is present else 1, position along normal of
+                 image plane (tags (0020,0032) and (0020,0037)) in micrometers],
+            'metadata_subdict' : dict - metadata specified by user
+                (See attribute metadata_subdict of class StartClass).
+
+    Methods
+    -------
+    read_header(image_file, tag_paths, specific_tags)
+        Read header of one image file without its pixel data.
+    plain_value(value_of_property)
+        Convert value of DICOM element into plain python type.
+    build(self, filelist, scan_catalog=None)
+        Read headers of all passed files (or take unchanged ones
+        from the scan catalog) and fill attribute records.
+    get(self, image_file)
+        Return record of passed image file.
+    shape(self, image_file)
+        Return (rows, columns) of passed image file.
+    pixel_spacing(self, image_file)
+        Return pixel spacing of passed image file.
+    slice_position(self, image_file)
+        Return position of passed image file along normal of image plane.
+    group_series(self, filelist)
+        Group files into series and order slices of each series by their headers.
+    """
+
+    record_version = 4
+
+    def __init__(self, metadata_tags_list, workers):
+
+        """
+        :param metadata_tags_list: list of lists of hexstrings
+            (See attribute metadata_tags_list of class StartClass)
+        :param workers: int
+            Number of worker processes. Specified in init_dict.
+        """
+
+        self.metadata_tags_list = metadata_tags_list
+        self.tag_paths = StartClass.compile_tag_paths(metadata_tags_list)
+        # tags of record fields and first tags of metadata tag paths
+        catalog_tags = [0x00080005,  # Specific Character Set
+                        0x00080018,  # SOP Instance UID
+                        0x0020000E,  # Series Instance UID
+                        0x00200011,  # Series Number
+                        0x00200013,  # Instance Number
+                        0x00200032,  # Image Position (Patient)
+                        0x00200037,  # Image Orientation (Patient)
+                        0x00280010,  # Rows
+                        0x00280011,  # Columns
+                        0x00280030,  # Pixel Spacing
+                        0x00281052,  # Rescale Intercept
+                        0x00281053]  # Rescale Slope
+        # private creators are read along with private tags to name them
+        private_creator_tags = [StartClass.private_creator_tag(tag_path[0]) for tag_path in self.tag_paths]
+        self.specific_tags = sorted(set(catalog_tags + [tag_path[0] for tag_path in self.tag_paths] +
+                                        [tag for tag in private_creator_tags if tag is not None]))
+        self.workers = workers
+        self.records = {}
+
+    @staticmethod
+    def read_header(image_file, tag_paths, specific_tags):
+
+        """
+        Read header of one image file without its pixel data.
+        Static to be usable by worker processes.
+
+        :param image_file: string
+            Absolute path to image file.
+        :param tag_paths: list of tuples
+            (See attribute tag_paths)
+        :param specific_tags: list of ints
+            (See attribute specific_tags)
+        :return: dict
+            (See values of attribute records of class HeaderCatalog)
+        """
+
+        record = {'rows': None,
+                  'columns': None,
+                  'pixel_spacing': None,
+                  'rescale_slope': 1.0,
+                  'rescale_intercept': 0.0,
+                  'series_uid': None,
+                  'instance_uid': None,
+                  'series_number': None,
+                  'sort_key': [1, 0, 1, 0],
+                  'metadata_subdict': {'undefined_tag': 'undefined'}}
+
+        # if we handle with dicom-file
+        if os.path.basename(image_file)[-4:] == '.dcm':
+            try:
+                # parse only needed elements in front of pixel data
+                with ArchiveInput.open_file(image_file) as file_obj:
+                    header_dcm = pydicom.dcmread(file_obj, force=True, stop_before_pixels=True,
+                                                 specific_tags=specific_tags)
+            except Exception:
+                print('\n\n\nThere is a problem with the file: ')
+                print(image_file)
+                return record
+            record['rows'] = header_dcm.get('Rows')
+            record['columns'] = header_dcm.get('Columns')
+            if 'PixelSpacing' in header_dcm:
+                try:
+                    record['pixel_spacing'] = [float(i) for i in header_dcm.PixelSpacing]
+                except (TypeError, ValueError):
+                    print('There is no property \'Pixel Spacing\'')
+            record['rescale_slope'] = float(header_dcm.get('RescaleSlope', 1.0))
+            record['rescale_intercept'] = float(header_dcm.get('RescaleIntercept', 0.0))
+            record['series_uid'] = str(header_dcm.get('SeriesInstanceUID', '')) or None
+            record['instance_uid'] = str(header_dcm.get('SOPInstanceUID', '')) or None
+            try:
+                record['series_number'] = int(header_dcm.get('SeriesNumber'))
+            except (TypeError, ValueError):
+                pass
+            # integer sort key of the slice
+            try:
+                record['sort_key'][:2] = [0, int(header_dcm.get('InstanceNumber'))]
+            except (TypeError, ValueError):
+                pass
+            try:
+                image_position = np.array(header_dcm.ImagePositionPatient, dtype=float)
+                if 'ImageOrientationPatient' in header_dcm:
+                    image_orientation = np.array(header_dcm.ImageOrientationPatient, dtype=float)
+                    normal = np.cross(image_orientation[:3], image_orientation[3:])
+                else:
+                    normal = np.array([0.0, 0.0, 1.0])
+                record['sort_key'][2:] = [0, int(round(float(np.dot(image_position, normal)) * 1000))]
+            except (AttributeError, TypeError, ValueError):
+                pass
+            metadata_subdict = StartClass.read_tag_values(dataset_dicom=header_dcm,
+                                                          tag_paths=tag_paths)
+            # plain values can be stored in the scan catalog
+            record['metadata_subdict'] = {name_of_property: HeaderCatalog.plain_value(value_of_property)
+                                          for name_of_property, value_of_property in metadata_subdict.items()}
+        # if we handle file with another file-extension
+        else:
+            # PIL reads only the header until pixel data are accessed
+            with ArchiveInput.open_file(image_file) as file_obj, Image.open(file_obj) as img:
+                record['columns'], record['rows'] = img.size
+        return record
+
+    @staticmethod
+    def plain_value(value_of_property):
+
+        """
+        Convert value of DICOM element into plain python type.
+        :param value_of_property: any
+            Value of DICOM element (e.g. DSfloat, IS, PersonName, MultiValue).
+        :return: int, float or string
+        """
+
+        if isinstance(value_of_property, bool):
+            return value_of_property
+        if isinstance(value_of_property, int):
+            return int(value_of_property)
+        if isinstance(value_of_property, float):
+            return float(value_of_property)
+        if isinstance(value_of_property, bytes):
+            return value_of_property.decode('latin-1')
+        return str(value_of_property)
+
+    def build(self, filelist, scan_catalog=None):
+
+        """
+        Read headers of all passed files and fill attribute records.
+
+        :param filelist: list of strings
+            (See attribute filelist of class StartClass)
+        :param scan_catalog: instance of class ScanCatalog or None
+            If passed, headers of files with unchanged size and modification
+            time are taken from it, and newly read headers are stored in it.
+        :return: dict
+            Attribute records.
+        """
+
+        print('build of header catalog is being executed')
+
+        # files, whose headers have to be read
+        files_to_read = filelist
+        if scan_catalog is not None:
+            stored_files = scan_catalog.get_files(filelist)
+            files_to_read = []
+            # sizes and modification times of all files
+            file_stats = {}
+            for image_file in filelist:
+                file_stats.update({image_file: ArchiveInput.stat(image_file)})
+                stored_file = stored_files.get(image_file)
+                if stored_file is not None and stored_file[:2] == file_stats[image_file]:
+                    self.records.update({image_file: stored_file[2]})
+                else:
+                    files_to_read.append(image_file)
+            print('%d of %d headers are taken from the scan catalog' % (len(filelist) - len(files_to_read),
+                                                                          len(filelist)))
+
+        # members of archives are read sequentially
+        files_to_read = ArchiveInput.archive_order(files_to_read)
+        read_header = fut.partial(HeaderCatalog.read_header,
+                                  tag_paths=self.tag_paths,
+                                  specific_tags=self.specific_tags)
+        if self.workers > 1 and len(files_to_read) > 1:
+            # hand out files in chunks to keep inter-process overhead low
+            chunksize = max(1, len(files_to_read) // (self.workers * 4))
+            with mp.Pool(processes=self.workers) as pool:
+                all_records = pool.map(read_header, files_to_read, chunksize=chunksize)
+        else:
+            all_records = list(map(read_header, files_to_read))
+        self.records.update(zip(files_to_read, all_records))
+
+        # store newly read headers for the next run
+        if scan_catalog is not None:
+            scan_catalog.put_files([(image_file,) + file_stats[image_file] + (record,)
+                                    for image_file, record in zip(files_to_read, all_records)])
+
+        print('%d headers have been read' % len(files_to_read))
+        print('build of header catalog is done')
+
+        return self.records
+
+    def get(self, image_file):
+
+        """
+        Return record of passed image file.
+        :param image_file: string
+            Absolute path to image file.
+        :return: dict or None
+            (See values of attribute records)
+        """
+
+        return self.records.get(image_file)
+
+    def shape(self, image_file):
+
+        """
+        Return shape of pixel array of passed image file.
+        :param image_file: string
+            Absolute path to image file.
+        :return: tuple of ints
+            (rows, columns)
+        """
+
+        record = self.records[image_file]
+        return record['rows'], record['columns']
+
+    def pixel_spacing(self, image_file):
+
+        """
+        Return pixel spacing of passed image file.
+        :param image_file: string
+            Absolute path to image file.
+        :return: list of two floats or None
+            None if the file is not a DICOM or has no tag (0028,0030).
+        """
+
+        record = self.records.get(image_file)
+        if record is None:
+            return None
+        return record['pixel_spacing']
+
+    def slice_position(self, image_file):
+
+        """
+        Return position of passed image file along normal of image plane
+        (See key 'sort_key' of attribute records).
+        :param image_file: string
+            Absolute path to image file.
+        :return: float or None
+            Position in mm; None if the file is not a DICOM or has no tag (0020,0032).
+        """
+
+        record = self.records.get(image_file)
+        if record is None or record['sort_key'][2] != 0:
+            return None
+        return record['sort_key'][3] / 1000
+
+    def group_series(self, filelist):
+
+        """
+        Group files into series and order slices of each series by their headers.
+        Series are recognized by Series Instance UID, so that a folder
+        containing several series is split into several series, named
+        '<folder name>_S<Series Number>'. Slices are ordered by Instance Number
+        and position; files without these tags keep order of filelist.
+        All is done in one sort with precomputed integer keys.
+
+        :param filelist: list of strings
+            (See attribute filelist of class StartClass)
+        :return: dict
+            Key: 'file_list' : Value: list of paths to all images in order of series and slices;
+            Key: 'file_dict' : Value: dict of dicts
+                (See attribute filedict of class StartClass).
+        """
+
+        print('group_series is being executed')
+
+        default_record = {'series_uid': None, 'series_number': None, 'sort_key': [1, 0, 1, 0]}
+        # series found in each folder (in order of first appearance)
+        folder_series = {}
+        for image_file in filelist:
+            record = self.records.get(image_file) or default_record
+            folder_series.setdefault(os.path.dirname(image_file), {}).setdefault(record['series_uid'],
+                                                                               record['series_number'])
+        # name suffix and rank of each series in its folder
+        series_names = {}
+        for folder, series_numbers in folder_series.items():
+            numbers = list(series_numbers.values())
+            # numbers are used as suffixes only if they are present and unique
+            use_numbers = None not in numbers and len(set(numbers)) == len(numbers)
+            series_in_order = sorted(series_numbers, key=lambda uid: (series_numbers[uid] is None,
+                                                                      series_numbers[uid] or 0))
+            for series_rank, series_uid in enumerate(series_in_order):
+                if len(series_numbers) == 1:
+                    suffix = ''
+                else:
+                    suffix = '_S%d' % (series_numbers[series_uid] if use_numbers else series_rank + 1)
+                series_names[(folder, series_uid)] = (series_rank, os.path.basename(folder) + suffix)
+
+        # natural order of folders (one key per folder)
+        natsort_key = natsort_keygen(alg=ns.IGNORECASE)
+        folder_keys = {folder: natsort_key(folder) for folder in folder_series}
+        sort_keys = []
+        for rank, image_file in enumerate(filelist):
+            record = self.records.get(image_file) or default_record
+            folder = os.path.dirname(image_file)
+            series_rank = series_names[(folder, record['series_uid'])][0]
+            sort_keys.append((folder_keys[folder], series_rank, record['sort_key'], rank))
+        file_list = [filelist[i] for i in sorted(range(len(filelist)), key=sort_keys.__getitem__)]
+
+        # empty dict to sort files in directories
+        directories_dict = {}
+        for image_file in file_list:
+            folder = os.path.dirname(image_file)
+            series_name = series_names[(folder, (self.records.get(image_file) or default_record)['series_uid'])][1]
+            directories_dict.setdefault(os.path.dirname(folder), {}).setdefault(series_name, []).append(image_file)
+
+        print('%d files have been grouped into %d series' % (len(file_list), len(series_names)))
+        print('group_series is done')
+
+        return {'file_list': file_list,
+                'file_dict': directories_dict}
+
+
+class ScanCatalog:
+
+    """
+    Persistent catalog of scanned folders and image headers (SQLite file).
+
+    Stored between program runs, so that a rescan of the same folder
+    tree only stats the folders and reads headers of files whose size
+    or modification time has changed.
+
+    Attributes
+    ----------
+    db_path : string
+        Relative path to SQLite file (next to file_exclusion_settings.txt).
+    connection : sqlite3 Connection object
+        Connection to the SQLite file.
+    settings_signature : string
+        JSON of suffixes and metadata tags the catalog has been built with.
+        If it changes, all stored folders and headers are dropped.
+
+    Methods
+    -------
+    get_folder(self, folder_path)
+        Return stored listing of folder or None.
+    put_folder(self, folder_path, mtime_ns, subfolders, files)
+        Store listing of folder.
+    get_files(self, file_paths)
+        Return stored sizes, modification times and headers of files.
+    put_files(self, file_rows)
+        Store sizes, modification times and headers of files.
+    prune(self, root_folder, file_list)
+        Drop stored files below root_folder, that have not been found.
+    close(self)
+        Commit changes and close the SQLite file.
+    """
+
+    def __init__(self, db_path, suffixes, metadata_tags_list):
+
+        """
+        :param db_path: string
+            Relative path to SQLite file.
+        :param suffixes: list of strings
+            (See attribute suffixes of class StartClass)
+        :param metadata_tags_list: list of lists of hexstrings
+            (See attribute metadata_tags_list of class StartClass)
+        """
+
+        self.db_path = db_path
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS settings '
+                                '(name TEXT PRIMARY KEY, value TEXT)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS folders '
+                                '(path TEXT PRIMARY KEY, mtime_ns INTEGER, subfolders TEXT, files TEXT)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS files '
+                                '(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, header TEXT)')
+        # stored listings and headers are only valid for the same settings
+        self.settings_signature = json.dumps({'suffixes': sorted(suffixes),
+                                              'metadata_tags_list': metadata_tags_list,
+                                              'record_version': HeaderCatalog.record_version})
+        stored_signature = self.connection.execute(
+            'SELECT value FROM settings WHERE name = ?', ('signature',)).fetchone()
+        if stored_signature is None or stored_signature[0] != self.settings_signature:
+            self.connection.execute('DELETE FROM folders')
+            self.connection.execute('DELETE FROM files')
+            self.connection.execute('INSERT OR REPLACE INTO settings VALUES (?, ?)',
+                                    ('signature', self.settings_signature))
+        self.connection.commit()
+
+    def get_folder(self, folder_path):
+
+        """
+        Return stored listing of folder or None.
+        :param folder_path: string
+            Absolute path to folder.
+        :return: tuple or None
+            (mtime_ns, list of sub-folder names, list of found file names)
+        """
+
+        row = self.connection.execute('SELECT mtime_ns, subfolders, files FROM folders WHERE path = ?',
+                                      (folder_path,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), json.loads(row[2])
+
+    def put_folder(self, folder_path, mtime_ns, subfolders, files):
+
+        """
+        Store listing of folder.
+        :param folder_path: string
+            Absolute path to folder.
+        :param mtime_ns: int
+            Modification time of folder in nanoseconds.
+        :param subfolders: list of strings
+            Names of sub-folders.
+        :param files: list of strings
+            Names of found files with specified extensions.
+        :return: nothing
+        """
+
+        self.connection.execute('INSERT OR REPLACE INTO folders VALUES (?, ?, ?, ?)',
+                                (folder_path, mtime_ns, json.dumps(subfolders), json.dumps(files)))
+
+    def get_files(self, file_paths):
+
+        """
+        Return stored sizes, modification times and headers of files.
+        :param file_paths: list of strings
+            Absolute paths to files.
+        :return: dict
+            Keys : absolute paths to stored files;
+            Values : tuples (size, mtime_ns, header record)
+                (See values of attribute records of class HeaderCatalog)
+        """
+
+        stored_files = {}
+        # query in chunks below SQLite's limit of bound parameters
+        for start in range(0, len(file_paths), 500):
+            chunk = file_paths[start:start + 500]
+            rows = self.connection.execute(
+                'SELECT path, size, mtime_ns, header FROM files WHERE path IN (%s)' % ','.join('?' * len(chunk)),
+                chunk)
+            for path, size, mtime_ns, header in rows:
+                stored_files.update({path: (size, mtime_ns, json.loads(header))})
+        return stored_files
+
+    def put_files(self, file_rows):
+
+        """
+        Store sizes, modification times and headers of files.
+        :param file_rows: list of tuples
+            (absolute path, size, mtime_ns, header record)
+        :return: nothing
+        """
+
+        self.connection.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                                    [(path, size, mtime_ns, json.dumps(record))
+                                     for path, size, mtime_ns, record in file_rows])
+        self.connection.commit()
+
+    def prune(self, root_folder, file_list):
+
+        """
+        Drop stored files below root_folder, that have not been found.
+        :param root_folder: string
+            Absolute path to scanned folder.
+        :param file_list: list of strings
+            Absolute paths to all found files.
+        :return: nothing
+        """
+
+        found_files = set(file_list)
+        stored_paths = [row[0] for row in self.connection.execute(
+            'SELECT path FROM files WHERE substr(path, 1, ?) = ?', (len(root_folder), root_folder))]
+        self.connection.executemany('DELETE FROM files WHERE path = ?',
+                                    [(path,) for path in stored_paths if path not in found_files])
+        self.connection.commit()
+
+    def close(self):
+
+        """
+        Commit changes and close the SQLite file.
+        :return: nothing
+        """
+
+        self.connection.commit()
+        self.connection.close()
+
+
+class PixelArrayCache:
+
+    """
+    Least-recently-used cache of decoded int16 pixel arrays
+    with a memory ceiling in bytes.
+
+    Arrays are keyed by path and modification time of the image file,
+    so a changed file is decoded again. Cached arrays are read-only.
+
+    Attributes
+    ----------
+    max_bytes : int
+        Memory ceiling of all cached arrays in bytes.
+    current_bytes : int
+        Memory currently occupied by cached arrays in bytes.
+    arrays : OrderedDict
+        Keys : tuples (absolute path to image, modification time);
+        Values : cached pixel arrays, least recently used first.
+    hits : int
+        Number of requests answered from the cache.
+    misses : int
+        Number of requests, that had to be decoded.
+
+    Methods
+    -------
+    get(self, image_file, mtime)
+        Return cached array or None.
+    put(self, image_file, mtime, array)
+        Store array and evict least recently used arrays above the ceiling.
+    stats(self)
+        Return hit/miss counters and occupied memory.
+    """
+
+    def __init__(self, max_megabytes):
+
+        """
+        :param max_megabytes: float
+            Memory ceiling in megabytes. Specified in init_dict.
+            0 switches the cache off.
+        """
+
+        self.max_bytes = int(max_megabytes * 1024 ** 2)
+        self.current_bytes = 0
+        self.arrays = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, image_file, mtime):
+
+        """
+        Return cached array of passed image or None.
+        :param image_file: string
+            Absolute path to image.
+        :param mtime: float
+            Modification time of image file.
+        :return: ndarray (2d) or None
+        """
+
+        key = (image_file, mtime)
+        array = self.arrays.get(key)
+        if array is None:
+            self.misses += 1
+            return None
+        # mark as most recently used
+        self.arrays.move_to_end(key)
+        self.hits += 1
+        return array
+
+    def put(self, image_file, mtime, array):
+
+        """
+        Store array and evict least recently used arrays above the ceiling.
+        :param image_file: string
+            Absolute path to image.
+        :param mtime: float
+            Modification time of image file.
+        :param array: ndarray (2d)
+            Decoded pixel array.
+        :return: ndarray (2d)
+            Passed array (read-only).
+        """
+
+        array.setflags(write=False)
+        # arrays larger than the whole budget are not cached
+        if array.nbytes > self.max_bytes:
+            return array
+        key = (image_file, mtime)
+        if key in self.arrays:
+            self.current_bytes -= self.arrays.pop(key).nbytes
+        # evict least recently used arrays
+        while self.arrays and self.current_bytes + array.nbytes > self.max_bytes:
+            _, evicted_array = self.arrays.popitem(last=False)
+            self.current_bytes -= evicted_array.nbytes
+        self.arrays[key] = array
+        self.current_bytes += array.nbytes
+        return array
+
+    def stats(self):
+
+        """
+        Return hit/miss counters and occupied memory.
+        :return: dict
+            Keys : 'hits', 'misses', 'megabytes', 'arrays'.
+        """
+
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'megabytes': self.current_bytes / 1024 ** 2,
+                'arrays': len(self.arrays)}
+
+
+class SeriesVolumeStore:
+
+    """
+    Contiguous int16 volumes (slices x rows x columns) of series folders
+    stored as .npy files and memory-mapped when used.
+
+    Each volume has a JSON sidecar with path, size and modification time
+    of each slice file as well as per-slice pixel spacing and metadata.
+    A volume is built again only if any of its files has changed,
+    so re-analysis of a series does not read its images at all.
+
+    Attributes
+    ----------
+    folder : string
+        Absolute path to folder with volumes and sidecars.
+    workers : int
+        Number of processes decoding images while a volume is built.
+    volumes : dict
+        Keys : absolute paths to series' folders;
+        Values : read-only memory-mapped volumes.
+    sidecars : dict
+        Keys : absolute paths to series' folders;
+        Values : dicts loaded from sidecars
+            ('files', 'pixel_spacing', 'metadata').
+    slice_index : dict
+        Keys : absolute paths to images;
+        Values : tuples (absolute path to series' folder, index of slice in volume).
+
+    Methods
+    -------
+    build(self, filedict, header_catalog)
+        Build missing or outdated volumes and memory-map all volumes.
+    write_volume(self, image_files, header_catalog, volume_path, pool)
+        Decode images of one series into new volume.
+    get(self, image_file)
+        Return slice of passed image (without copying) or None.
+    pixel_spacing(self, image_file)
+        Return pixel spacing of passed image or None.
+    """
+
+    def __init__(self, folder, workers):
+
+        """
+        :param folder: string
+            Absolute path to folder with volumes and sidecars.
+        :param workers: int
+            Number of processes decoding images (0 or 1: decoding in main process).
+        """
+
+        self.folder = folder
+        self.workers = workers
+        self.volumes = {}
+        self.sidecars = {}
+        self.slice_index = {}
+
+    @staticmethod
+    def file_stats(image_files):
+
+        """
+        Return path, size and modification time of passed files.
+        :param image_files: list of strings
+            Absolute paths to images.
+        :return: list of lists
+            [path, size in bytes, modification time in ns] for each file.
+        """
+
+        file_stats = []
+        for image_file in image_files:
+            file_stats.append([image_file] + list(ArchiveInput.stat(image_file)))
+        return file_stats
 
-        image_array = np.array(StartClass.norm_2d_array(arr_2d=arr_2d,
-                                                        value_min=0,
-                                                        value_max=255))
-        cv2.imwrite(filename=filename, img=image_array)
+    def build(self, filedict, header_catalog):
 
-        print('create_image_from_2d_array is done')
+        """
+        Build missing or outdated volumes and memory-map all volumes.
+        Series with images of different shapes get no volume.
+        :param filedict: dict of dicts
+            (See attribute filedict of class StartClass)
+        :param header_catalog: instance of class HeaderCatalog
+            Used to get shapes and metadata of images.
+        :return: nothing
+        """
 
-        return filename
+        print('SeriesVolumeStore.build is being executed')
+
+        num_built = 0
+        num_reused = 0
+        pool = mp.Pool(self.workers) if self.workers > 1 else None
+        try:
+            for study_folder in filedict:
+                for series in filedict[study_folder]:
+                    image_files = filedict[study_folder][series]
+                    if not image_files:
+                        continue
+                    series_folder = os.path.join(study_folder, series)
+                    shapes = set(header_catalog.shape(image_file) for image_file in image_files)
+                    if len(shapes) != 1 or (None in shapes) or (0 in list(shapes)[0]):
+                        print('Series %s has images of different shapes; no volume is built' % series_folder)
+                        continue
+                    # names of volume and sidecar derived from path of series folder
+                    base_name = hashlib.sha1(series_folder.encode('utf-8')).hexdigest()[:16]
+                    volume_path = os.path.join(self.folder, base_name + '.npy')
+                    sidecar_path = os.path.join(self.folder, base_name + '.json')
+                    file_stats = SeriesVolumeStore.file_stats(image_files)
+                    sidecar = None
+                    if os.path.isfile(volume_path) and os.path.isfile(sidecar_path):
+                        with open(sidecar_path, 'r') as file_to_read_info:
+                            sidecar = json.load(file_to_read_info)
+                        if sidecar['files'] != file_stats:
+                            sidecar = None
+                    if sidecar is None:
+                        # outdated sidecar must not survive an interrupted build
+                        if os.path.isfile(sidecar_path):
+                            os.remove(sidecar_path)
+                        sidecar = self.write_volume(image_files=image_files, header_catalog=header_catalog,
+                                                    volume_path=volume_path, pool=pool)
+                        if sidecar is None:
+                            continue
+                        sidecar['files'] = file_stats
+                        with open(sidecar_path, 'w') as file_to_write_info:
+                            json.dump(sidecar, file_to_write_info)
+                        num_built += 1
+                    else:
+                        num_reused += 1
+                    self.volumes[series_folder] = np.load(volume_path, mmap_mode='r')
+                    self.sidecars[series_folder] = sidecar
+                    for index, image_file in enumerate(image_files):
+                        self.slice_index[image_file] = (series_folder, index)
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+        print('%d series volumes have been built, %d are unchanged' % (num_built, num_reused))
+        print('SeriesVolumeStore.build is done')
+
+    def write_volume(self, image_files, header_catalog, volume_path, pool):
 
-    def create_png_image(self, key):
-        
         """
-        Create .png-image from current dicom-file.
-        :param key: string
-            Absolute path to dicom file
-        :return: string
-            Absolute path to created image.
+        Decode images of one series into new volume.
+        :param image_files: list of strings
+            Absolute paths to images of the series.
+        :param header_catalog: instance of class HeaderCatalog
+            Used to get shape and metadata of images.
+        :param volume_path: string
+            Absolute path to .npy file of the volume.
+        :param pool: multiprocessing Pool or None
+            Processes decoding images.
+        :return: dict or None
+            'pixel_spacing' and 'metadata' of each slice
+            (None if decoded images do not match the shape in the headers).
         """
 
-        print('create_png_image is being executed')
+        rows, columns = header_catalog.shape(image_files[0])
+        volume = np.lib.format.open_memmap(volume_path, mode='w+', dtype=np.int16,
+                                           shape=(len(image_files), rows, columns))
+        read_pixel_array = fut.partial(StartClass.read_pixel_array, keep_dataset=False)
+        if pool is not None:
+            decoded_files = pool.imap(read_pixel_array, image_files)
+        else:
+            decoded_files = map(read_pixel_array, image_files)
+        pixel_spacings = []
+        for index, decoded in enumerate(decoded_files):
+            if decoded['base_array'].shape != (rows, columns):
+                print('Shape of %s differs from its header; no volume is built' % image_files[index])
+                del volume
+                os.remove(volume_path)
+                return None
+            volume[index] = decoded['base_array']
+            pixel_spacings.append(decoded['pixel_spacing'])
+        volume.flush()
+        del volume
+
+        ret_dict = {'pixel_spacing': pixel_spacings,
+                    'metadata': [header_catalog.get(image_file)['metadata_subdict']
+                                 for image_file in image_files]}
 
-        # pixel array for current image
-        curr_array = self.create_base_array(key)['base_array']
-        # name of image file without extension
-        name_of_file_without_extension = os.path.basename(key)[:-4]
-        # create png-image
-        png_image_path = StartClass.create_image_from_2d_array(arr_2d=curr_array,
-                                                               filename='03.PNG_images/%s.png' %
-                                                               name_of_file_without_extension)
-        # store path to png image in list
-        # self.all_images.append(png_image_path)
-        # return self.all_images
+        return ret_dict
 
-        print('create_png_image is done')
+    def get(self, image_file):
 
-        return png_image_path
+        """
+        Return slice of passed image (without copying) or None.
+        :param image_file: string
+            Absolute path to image.
+        :return: ndarray (2d, int16, read-only) or None
+        """
 
-    @staticmethod
-    def create_aux_folder(folder_name):
+        if image_file not in self.slice_index:
+            return None
+        series_folder, index = self.slice_index[image_file]
+        return self.volumes[series_folder][index]
+
+    def pixel_spacing(self, image_file):
 
         """
-        Create auxiliary folder in the directory with executable py-file.
-        :param folder_name: string
-            Name of folder to be created (not path to it!)
-        :return: string
-            Absolute path to the created folder.
+        Return pixel spacing of passed image or None.
+        :param image_file: string
+            Absolute path to image.
+        :return: list of two floats or None
         """
-        # current folder with py-file
-        cur_fold = os.path.dirname(os.path.abspath(__file__))
-        # path to auxiliary folder
-        aux_folder = cur_fold + '/' + folder_name
-        # if the folder does not exist yet, create it
-        if not os.path.exists(aux_folder):
-            os.mkdir(aux_folder)
-        # return path to folder
-        return aux_folder
+
+        if image_file not in self.slice_index:
+            return None
+        series_folder, index = self.slice_index[image_file]
+        return self.sidecars[series_folder]['pixel_spacing'][index]
 
 
 class CreateFormMetaData(tk.Frame):
@@ -946,9 +2302,6 @@ class CreateForm(tk.Frame):
         For mode 'Fixed_ROI': width of ROI in pixels.
     fixed_roi_height : int
         For mode 'Fixed_ROI': height of ROI in pixels.
-    array : ndarray (2d)
-        Pixel array of a dcm-image. Used to get image's size.
-        (See attributes px_width and px_height of class CreateForm)
     px_width : int
         Width of dcm-image in pixels. Used for mode 'Array_ROIs' to draw ROIs on Canvas and
         to connect drawn ROIs with pixel array information from DICOMs.
@@ -1047,10 +2400,9 @@ class CreateForm(tk.Frame):
 
         if not self.program_start:
             # get measurements of image (assumed they are equal for all images)
-            self.array = self.object_arrays.create_base_array(self.object_arrays.filelist[0])['base_array']
-            # image measurements
-            self.px_height = self.array.shape[0]
-            self.px_width = self.array.shape[1]
+            # from the header catalog, no need to decode the pixel array
+            self.px_height, self.px_width = self.object_arrays.header_catalog.shape(
+                self.object_arrays.filelist[0])
 
         # if accept button has been already used, reuse data in the form
         if not self.program_start:
@@ -1454,11 +2806,12 @@ class GUI(tk.Frame):
     slice_img : tkinter's PhotoImage object
         This object is finally loaded on canvas widget of main window.
     array : ndarray (2d)
-        Pixel array of currently shown dcm-image.
+        Pixel array of the first dcm-image. Sliding does not decode
+        images, their sizes are taken from the header catalog.
     px_height : int
-        Number of rows in attribute array.
+        Number of rows of currently shown dcm-image.
     px_width : int
-        Number of columns in attribute array.
+        Number of columns of currently shown dcm-image.
     slider : tkinter's Slider object
         Slider to slide through images. Connected with method slide_images().
     label_name : tkinter's Label object
@@ -1767,8 +3120,6 @@ class GUI(tk.Frame):
         # dictionary for rectangle objects on each image
         self.rectangles_dict = {}
         self.image_rectangles = []
-        # ROIs for current image
-        self.image_roi = []
         # dictionary for ROIs of all images
         self.all_roi_dict = {}
         # collect all recorded rectangles
@@ -1915,15 +3266,9 @@ class GUI(tk.Frame):
 
         # change title of main window according to new image file
         self.master.title(os.path.basename(self.new_source))
-        # create array for current image
-        self.array = self.obj_arrays.create_base_array(self.new_source)['base_array']
+        # image measurements from header catalog (pixel data are not needed here)
+        self.px_height, self.px_width = self.obj_arrays.header_catalog.shape(self.new_source)
 
-        # image measurements
-        self.px_height = self.array.shape[0]
-        self.px_width = self.array.shape[1]
-
-        # self.px_width = self.obj_arrays.im_width_dict[self.new_source]
-        # self.px_height = self.obj_arrays.im_height_dict[self.new_source]
         # change label name
 
         # update name label's text
@@ -2165,12 +3510,6 @@ class GUI(tk.Frame):
                 x1 = x0 + 5
             if (y1 - y0) < 5:
                 y1 = y0 + 5
-            self.subarray_roi = self.array[y0:y1, x0:x1]
-            if len(self.subarray_roi) == 0:  # DEBUG
-                print('x0: ', x0)
-                print('x1: ', x1)
-                print('y0: ', y0)
-                print('y1: ', y1)
             # delete event coordinates
             del self.x_coord
             del self.y_coord
@@ -2237,10 +3576,6 @@ class GUI(tk.Frame):
             pass
         print('%d ROIs remain' % (len(self.image_rectangles)))  # DEBUG
 
-    def store_ROIs(self, *args):
-        self.image_roi.append(self.subarray_roi)
-        print(np.array(self.image_roi).shape)
-
     def update_roi_dict(self):
         """
         Update attribute all_roi_dict, when choosing
@@ -2403,6 +3738,627 @@ class GUI(tk.Frame):
         return aux_folder
 
 
+class FFTBackend:
+
+    """
+    2d FFTs of stacks of ROIs over the last two axes (3d FFTs of stacks
+    of cuboids over the last three axes) with selectable library.
+
+    Backends:
+        'numpy' : np.fft (single thread);
+        'scipy' : scipy.fft with workers threads;
+        'pyfftw' : pyFFTW (if installed) with threads; plans are built once
+                   per stack shape and FFTW wisdom is kept in a file between runs;
+        'auto' : for each observed stack shape all available backends are timed
+                 on the first stack and the fastest one is used afterwards.
+
+    Attributes
+    ----------
+    name : string
+        Selected backend ('numpy', 'scipy', 'pyfftw' or 'auto').
+    workers : int
+        Number of threads of scipy and pyfftw backends.
+    wisdom_file : string or None
+        Path to json-file with FFTW wisdom.
+    plans : dict
+        Keys : tuples (kind of transform 'rfft2', 'fft2' or 'rfftn', shape of stack,
+                       floating point type, shape of transform);
+        Values : pyFFTW's FFTW objects.
+    choices : dict
+        Keys : tuples (kind of transform, shape of ROI, shape of transform);
+        Values : names of backends chosen by timing (mode 'auto').
+
+    Methods
+    -------
+    available_backends()
+        Return names of usable backends.
+    rfft2(self, stack, shape=None)
+        Half spectra of real stack (as np.fft.rfft2 over axes 1 and 2).
+    fft2(self, stack, shape=None)
+        Whole spectra of stack (as np.fft.fft2 over axes 1 and 2).
+    rfftn(self, stack)
+        Half spectra of real stack of cuboids (as np.fft.rfftn over axes 1, 2 and 3).
+    backend_for(self, kind, stack, shape=None)
+        Return name of backend used for passed stack.
+    transform(self, kind, stack, backend, shape=None)
+        Apply transform with passed backend.
+    choose_backend(self, kind, stack, shape=None)
+        Time available backends on the stack and return the fastest one.
+    save_wisdom(self)
+        Store FFTW wisdom in wisdom_file.
+    """
+
+    def __init__(self, name, workers, wisdom_file=None):
+
+        """
+        :param name: string
+            'numpy', 'scipy', 'pyfftw' or 'auto'.
+        :param workers: int
+            Number of threads (-1: all cores).
+        :param wisdom_file: string or None
+            Path to json-file with FFTW wisdom (loaded if it exists).
+        """
+
+        if name not in ['numpy', 'scipy', 'pyfftw', 'auto']:
+            raise ValueError('Unknown FFT backend: %s' % name)
+        if name == 'pyfftw' and pyfftw is None:
+            print('pyfftw is not installed, scipy.fft is used instead')
+            name = 'scipy'
+        self.name = name
+        self.workers = mp.cpu_count() if workers < 1 else workers
+        self.wisdom_file = wisdom_file
+        self.plans = {}
+        self.choices = {}
+        if pyfftw is not None and self.wisdom_file is not None and os.path.exists(self.wisdom_file):
+            with open(self.wisdom_file, 'r') as file:
+                pyfftw.import_wisdom(tuple(item.encode('latin-1') for item in json.load(file)))
+
+    @staticmethod
+    def available_backends():
+
+        """
+        Return names of usable backends.
+        :return: list of strings
+        """
+
+        backends = ['numpy', 'scipy']
+        if pyfftw is not None:
+            backends.append('pyfftw')
+        return backends
+
+    def rfft2(self, stack, shape=None):
+
+        """
+        Half spectra of real stack (as np.fft.rfft2 over axes 1 and 2).
+        :param stack: ndarray (3d)
+            Real pixel arrays of ROIs of same shape (N, height, width).
+        :param shape: tuple of two ints or None
+            Shape of transform (ROIs are padded with zeros or cropped as in np.fft.rfft2);
+            None: shape of ROIs.
+        :return: ndarray (3d)
+            Complex spectra (N, height, width // 2 + 1).
+        """
+
+        return self.transform(kind='rfft2', stack=stack, shape=shape,
+                              backend=self.backend_for(kind='rfft2', stack=stack, shape=shape))
+
+    def fft2(self, stack, shape=None):
+
+        """
+        Whole spectra of stack (as np.fft.fft2 over axes 1 and 2).
+        :param stack: ndarray (3d)
+            Pixel arrays of ROIs of same shape (N, height, width).
+        :param shape: tuple of two ints or None
+            (See method rfft2)
+        :return: ndarray (3d)
+            Complex spectra (N, height, width), not shifted.
+        """
+
+        return self.transform(kind='fft2', stack=stack, shape=shape,
+                              backend=self.backend_for(kind='fft2', stack=stack, shape=shape))
+
+    def rfftn(self, stack):
+
+        """
+        Half spectra of real stack of cuboids (as np.fft.rfftn over axes 1, 2 and 3).
+        :param stack: ndarray (4d)
+            Real voxel arrays of cuboids of same shape (N, depth, height, width).
+        :return: ndarray (4d)
+            Complex spectra (N, depth, height, width // 2 + 1).
+        """
+
+        return self.transform(kind='rfftn', stack=stack,
+                              backend=self.backend_for(kind='rfftn', stack=stack))
+
+    def backend_for(self, kind, stack, shape=None):
+
+        """
+        Return name of backend used for passed stack.
+        :param kind: string
+            'rfft2', 'fft2' or 'rfftn'.
+        :param stack: ndarray (3d or 4d)
+        :param shape: tuple of two ints or None
+            (See method rfft2)
+        :return: string
+        """
+
+        if self.name != 'auto':
+            return self.name
+        key = (kind, stack.shape[1:], shape)
+        if key not in self.choices:
+            self.choices[key] = self.choose_backend(kind=kind, stack=stack, shape=shape)
+        return self.choices[key]
+
+    def transform(self, kind, stack, backend, shape=None):
+
+        """
+        Apply transform with passed backend.
+        :param kind: string
+            'rfft2', 'fft2' or 'rfftn'.
+        :param stack: ndarray (3d or 4d)
+        :param backend: string
+            'numpy', 'scipy' or 'pyfftw'.
+        :param shape: tuple of two ints or None
+            (See method rfft2)
+        :return: ndarray (3d)
+        """
+
+        # all axes except the first one (ROIs or cuboids)
+        axes = tuple(range(1, stack.ndim))
+        if backend == 'scipy':
+            return getattr(scipy.fft, kind)(stack, s=shape, axes=axes, workers=self.workers)
+        if backend == 'pyfftw':
+            key = (kind, stack.shape, stack.dtype.str, shape)
+            if key not in self.plans:
+                # planning overwrites the input array, so it is done on an empty copy
+                self.plans[key] = getattr(pyfftw.builders, kind)(pyfftw.empty_aligned(stack.shape, dtype=stack.dtype),
+                                                                s=shape, axes=axes, threads=self.workers,
+                                                                planner_effort='FFTW_MEASURE')
+            # output array of plan is reused, so it is copied
+            return self.plans[key](stack).copy()
+        return getattr(np.fft, kind)(stack, s=shape, axes=axes)
+
+    def choose_backend(self, kind, stack, shape=None):
+
+        """
+        Time available backends on the stack and return the fastest one.
+        Each backend is run twice, the second run is timed
+        (first run includes planning of pyfftw).
+        :param kind: string
+            'rfft2', 'fft2' or 'rfftn'.
+        :param stack: ndarray (3d or 4d)
+        :param shape: tuple of two ints or None
+            (See method rfft2)
+        :return: string
+            Name of the fastest backend.
+        """
+
+        times = {}
+        for backend in FFTBackend.available_backends():
+            self.transform(kind=kind, stack=stack, backend=backend, shape=shape)
+            start_time = time.perf_counter()
+            self.transform(kind=kind, stack=stack, backend=backend, shape=shape)
+            times[backend] = time.perf_counter() - start_time
+        fastest = min(times, key=times.get)
+        print('FFT backend for %s of ROIs %s px: %s (%s)' %
+              (kind, 'x'.join(str(size) for size in stack.shape[1:]), fastest,
+               ', '.join('%s %.2f ms' % (backend, times[backend] * 1000) for backend in times)))
+        return fastest
+
+    def save_wisdom(self):
+
+        """
+        Store FFTW wisdom in wisdom_file (if pyfftw has been used).
+        :return: nothing
+        """
+
+        if pyfftw is None or self.wisdom_file is None or not self.plans:
+            return
+        with open(self.wisdom_file, 'w') as file:
+            json.dump([item.decode('latin-1') for item in pyfftw.export_wisdom()], file)
+
+
+class PolynomialDetrender:
+
+    """
+    Removal of 2d polynomial background from stacks of ROIs by linear least squares.
+
+    Background of order n is sum of c_ab * y^a * x^b for a, b = 0..n
+    (order 1: plane with twist term x*y, order 2: 9 terms), with coordinates
+    normalized to [-1, 1] for good conditioning. Design matrix and its
+    pseudo-inverse are built once per ROI shape and order, then a whole stack
+    is fitted with two matrix multiplications.
+
+    Attributes
+    ----------
+    projectors : dict
+        Keys : tuples (shape of ROI, order, floating point type);
+        Values : dicts with keys
+            'basis' : ndarray (2d) - design matrix (height * width, num_of_terms),
+            'pinv' : ndarray (2d) - its pseudo-inverse (num_of_terms, height * width).
+
+    Methods
+    -------
+    get_projector(self, shape, order, dtype)
+        Return (and build if needed) design matrix and pseudo-inverse.
+    fit(self, stack, order)
+        Fitted backgrounds of stack of ROIs.
+    detrend(self, stack, order)
+        Stack of ROIs with fitted backgrounds subtracted.
+    """
+
+    def __init__(self):
+
+        self.projectors = {}
+
+    def get_projector(self, shape, order, dtype):
+
+        """
+        Return (and build if needed) design matrix and pseudo-inverse.
+        :param shape: tuple of two ints
+            (height, width) of ROI.
+        :param order: int
+            Order of polynomial (1 or 2).
+        :param dtype: numpy floating point type
+            Type of ROI stack.
+        :return: dict
+            (See values of attribute projectors)
+        """
+
+        key = (tuple(shape), order, np.dtype(dtype).str)
+        if key not in self.projectors:
+            image_height, image_width = shape
+            # normalized coordinates of pixels (a single row or column gets coordinate 0)
+            y = np.linspace(-1, 1, num=image_height) if image_height > 1 else np.zeros(1)
+            x = np.linspace(-1, 1, num=image_width) if image_width > 1 else np.zeros(1)
+            y_grid, x_grid = np.meshgrid(y, x, indexing='ij')
+            basis = np.stack([(y_grid ** a * x_grid ** b).ravel()
+                              for a, b in itertools.product(range(order + 1), range(order + 1))], axis=1)
+            self.projectors[key] = {'basis': basis.astype(dtype),
+                                    'pinv': np.linalg.pinv(basis).astype(dtype)}
+        return self.projectors[key]
+
+    def fit(self, stack, order):
+
+        """
+        Fitted backgrounds of stack of ROIs.
+        :param stack: ndarray (3d)
+            Pixel arrays of ROIs of same shape (N, height, width), floating point.
+        :param order: int
+            Order of polynomial (1 or 2).
+        :return: ndarray (3d)
+            Fitted background of each ROI (N, height, width).
+        """
+
+        projector = self.get_projector(shape=stack.shape[1:], order=order, dtype=stack.dtype)
+        flat_stack = stack.reshape(stack.shape[0], -1)
+        # coefficients of all ROIs at once
+        coefficients = flat_stack @ projector['pinv'].T
+        return (coefficients @ projector['basis'].T).reshape(stack.shape)
+
+    def detrend(self, stack, order):
+
+        """
+        Stack of ROIs with fitted backgrounds subtracted.
+        :param stack: ndarray (3d)
+            Pixel arrays of ROIs of same shape (N, height, width), floating point.
+        :param order: int
+            Order of polynomial (1 or 2).
+        :return: ndarray (3d)
+            Detrended ROIs.
+        """
+
+        return stack - self.fit(stack=stack, order=order)
+
+
+class RadialBinCache:
+
+    """
+    Ring labels of 2d spectra for radial averaging, built once per shape.
+
+    Ring r of bin width b contains radii r*b - b/2 <= R < r*b + b/2
+    (R in samples from zero frequency); rings up to max(height, width) // 2
+    are used. If pixel spacing is passed, R is the physical frequency radius
+    in samples of the finer frequency axis (axis of larger physical size). A radial profile is then one np.bincount of spectrum values
+    over the ring labels, also for stacks of spectra.
+    Alternatively rings are applied as sparse averaging matrix (rings x spectrum values),
+    so that a stack of spectra is reduced with one sparse matrix product:
+        'nearest' : each value belongs to its ring (same as bincount);
+        'linear' : value at radius R is shared by rings floor(R/b) and floor(R/b) + 1
+                   with linear weights.
+
+    Attributes
+    ----------
+    bins : dict
+        Keys : tuples (shape of ROI, bin width, whether half spectrum is used, pixel spacing or None);
+        Values : dicts with keys
+            'radii' : ndarray (1d) - radius of each spectrum value in bin widths,
+            'labels' : ndarray (1d) - ring of each spectrum value
+                (num_of_rings for values outside of all rings),
+            'weights' : ndarray (1d) or None - weights of values of half spectrum,
+            'counts' : ndarray (1d) - (weighted) number of values in each ring,
+            'num_of_rings' : int,
+            'center_index' : int - flat index of zero frequency.
+    operators : dict
+        Keys : tuples (shape of ROI, bin width, whether half spectrum is used,
+                       pixel spacing or None, scheme, floating point type);
+        Values : scipy.sparse CSR matrices (num_of_rings, number of spectrum values)
+            with averaging weights of each ring (empty rings have no entries).
+
+    Methods
+    -------
+    get_bins(self, shape, bin_width, half_spectrum, spacing=None)
+        Return (and build if needed) ring labels of passed shape.
+    get_operator(self, shape, bin_width, half_spectrum, scheme, dtype, spacing=None)
+        Return (and build if needed) sparse averaging matrix of passed shape.
+    radial_mean(self, stack, bin_width, half_spectrum=False, width=None, scheme='bincount', spacing=None)
+        Build radial means of stack of 2d spectra.
+    """
+
+    def __init__(self):
+
+        self.bins = {}
+        self.operators = {}
+
+    def get_bins(self, shape, bin_width, half_spectrum, spacing=None):
+
+        """
+        Return (and build if needed) ring labels of passed shape.
+        :param shape: tuple of two ints
+            (height, width) of ROI.
+        :param bin_width: float
+            Width of rings in samples of the spectrum.
+        :param half_spectrum: boolean
+            True: spectrum is half spectrum of rfft2 (not shifted);
+            False: spectrum is whole spectrum shifted with fftshift.
+        :param spacing: tuple of two floats or None
+            Pixel spacing in y and x direction.
+            None: rings in samples of the spectrum regardless of pixel spacing and of
+            different frequency steps of y and x axis (as it has always been).
+        :return: dict
+            (See values of attribute bins)
+        """
+
+        key = (tuple(shape), bin_width, half_spectrum, None if spacing is None else tuple(spacing))
+        if key not in self.bins:
+            image_height, image_width = shape
+            max_size = max(image_height, image_width)
+            num_of_rings = int((max_size // 2) / bin_width) + 1
+            # frequency steps of y and x axis in samples of the finer one
+            scale_y = 1
+            scale_x = 1
+            if spacing is not None:
+                larger_size = max(image_height * spacing[0], image_width * spacing[1])
+                scale_y = larger_size / (image_height * spacing[0])
+                scale_x = larger_size / (image_width * spacing[1])
+                num_of_rings = int(max((image_height // 2) * scale_y, (image_width // 2) * scale_x) / bin_width) + 1
+            if half_spectrum:
+                # frequencies of half spectrum in samples
+                ky = np.fft.fftfreq(image_height) * image_height
+                kx = np.arange(image_width // 2 + 1)
+                weights = np.broadcast_to(ProcessROI.half_spectrum_weights(image_width),
+                                          (image_height, image_width // 2 + 1)).ravel()
+                center_index = 0
+            else:
+                # distances from center of shifted spectrum
+                ky = np.arange(image_height) - image_height // 2
+                kx = np.arange(image_width) - image_width // 2
+                weights = None
+                center_index = (image_height // 2) * image_width + image_width // 2
+            R = np.sqrt((ky[:, np.newaxis] * scale_y) ** 2 + (kx[np.newaxis, :] * scale_x) ** 2).ravel()
+            labels = np.floor(R / bin_width + .5).astype(np.int64)
+            labels[labels > num_of_rings] = num_of_rings
+            counts = np.bincount(labels, weights=weights, minlength=num_of_rings + 1)[:num_of_rings]
+            self.bins[key] = {'radii': R / bin_width,
+                              'labels': labels,
+                              'weights': weights,
+                              'counts': counts,
+                              'num_of_rings': num_of_rings,
+                              'center_index': center_index}
+        return self.bins[key]
+
+    def get_operator(self, shape, bin_width, half_spectrum, scheme, dtype, spacing=None):
+
+        """
+        Return (and build if needed) sparse averaging matrix of passed shape.
+        :param shape: tuple of two ints
+            (height, width) of ROI.
+        :param bin_width: float
+            Width of rings in samples of the spectrum.
+        :param half_spectrum: boolean
+            (See method get_bins)
+        :param scheme: string
+            'nearest' or 'linear' (See class' docs).
+        :param dtype: numpy floating point type
+            Type of spectra.
+        :param spacing: tuple of two floats or None
+            (See method get_bins)
+        :return: scipy.sparse CSR matrix
+            (See values of attribute operators)
+        """
+
+        key = (tuple(shape), bin_width, half_spectrum, None if spacing is None else tuple(spacing),
+               scheme, np.dtype(dtype).str)
+        if key not in self.operators:
+            ring_bins = self.get_bins(shape=shape, bin_width=bin_width, half_spectrum=half_spectrum,
+                                      spacing=spacing)
+            num_of_rings = ring_bins['num_of_rings']
+            num_of_values = len(ring_bins['labels'])
+            weights = np.ones(num_of_values) if ring_bins['weights'] is None else ring_bins['weights']
+            value_indices = np.arange(num_of_values)
+            if scheme == 'nearest':
+                rows = ring_bins['labels']
+                columns = value_indices
+                entries = weights
+            elif scheme == 'linear':
+                lower_rings = np.floor(ring_bins['radii']).astype(np.int64)
+                fractions = ring_bins['radii'] - lower_rings
+                rows = np.concatenate((lower_rings, lower_rings + 1))
+                columns = np.concatenate((value_indices, value_indices))
+                entries = np.concatenate((weights * (1 - fractions), weights * fractions))
+            else:
+                raise ValueError('Unknown radial averaging scheme: %s' % scheme)
+            # values outside of all rings are dropped
+            inside = (rows < num_of_rings) & (entries > 0)
+            operator = scipy.sparse.csr_matrix((entries[inside], (rows[inside], columns[inside])),
+                                               shape=(num_of_rings, num_of_values))
+            # weights of each ring sum up to one
+            ring_sums = np.asarray(operator.sum(axis=1)).ravel()
+            with np.errstate(invalid='ignore', divide='ignore'):
+                operator = scipy.sparse.diags(np.where(ring_sums > 0, 1 / ring_sums, 0)) @ operator
+            self.operators[key] = operator.tocsr().astype(dtype)
+        return self.operators[key]
+
+    def radial_mean(self, stack, bin_width, half_spectrum=False, width=None, scheme='bincount', spacing=None):
+
+        """
+        Build radial means of stack of 2d spectra.
+        Value at zero frequency is added to each mean (as it has always been).
+        Empty rings give nan.
+
+        :param stack: ndarray (3d)
+            2d-NPS of ROIs (N, height, width) or (N, height, width // 2 + 1) for half spectra.
+        :param bin_width: float
+            Width of rings in samples of the spectrum.
+        :param half_spectrum: boolean
+            (See method get_bins)
+        :param width: int or None
+            Width of ROIs (needed for half spectra).
+        :param scheme: string
+            'bincount' (rings of ring labels with np.bincount),
+            'nearest' or 'linear' (sparse averaging matrix, See method get_operator).
+        :param spacing: tuple of two floats or None
+            (See method get_bins)
+        :return: ndarray (2d)
+            Radial mean of each 2d-NPS (N, num_of_rings).
+        """
+
+        num_of_rois = stack.shape[0]
+        if width is None:
+            width = stack.shape[2]
+        ring_bins = self.get_bins(shape=(stack.shape[1], width), bin_width=bin_width,
+                                  half_spectrum=half_spectrum, spacing=spacing)
+        num_of_rings = ring_bins['num_of_rings']
+        flat_stack = stack.reshape(num_of_rois, -1)
+        if scheme != 'bincount':
+            operator = self.get_operator(shape=(stack.shape[1], width), bin_width=bin_width,
+                                         half_spectrum=half_spectrum, scheme=scheme, dtype=stack.dtype,
+                                         spacing=spacing)
+            # one sparse product for all ROIs
+            mean = (operator @ flat_stack.T).T
+            # empty rings give nan
+            mean[:, np.diff(operator.indptr) == 0] = np.nan
+            return flat_stack[:, ring_bins['center_index']][:, np.newaxis] + mean
+        values = flat_stack if ring_bins['weights'] is None else np.multiply(flat_stack, ring_bins['weights'],
+                                                                             dtype=flat_stack.dtype)
+        # one bincount for all ROIs (labels of each ROI are shifted)
+        stack_labels = ring_bins['labels'][np.newaxis, :] + (num_of_rings + 1) * np.arange(num_of_rois)[:, np.newaxis]
+        sums = np.bincount(stack_labels.ravel(), weights=values.ravel(),
+                           minlength=(num_of_rings + 1) * num_of_rois).reshape(num_of_rois, num_of_rings + 1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = sums[:, :num_of_rings] / ring_bins['counts']
+        mean = flat_stack[:, ring_bins['center_index']][:, np.newaxis] + mean
+        # (np.bincount sums in float64, mean keeps floating point type of stack)
+        return mean.astype(stack.dtype, copy=False)
+
+
+class RunningStats:
+
+    """
+    Running mean and variance (Welford's algorithm) of scalars
+    or of 1d arrays (element-wise).
+
+    Arrays may differ in length; each element is averaged among
+    arrays reaching it.
+
+    Attributes
+    ----------
+    counts : ndarray (1d)
+        Number of added values of each element.
+    means : ndarray (1d)
+        Running mean of each element.
+    m2 : ndarray (1d)
+        Running sum of squared deviations from mean of each element.
+    scalar : boolean or None
+        Whether scalars are added (None before first value).
+
+    Methods
+    -------
+    add(self, value)
+        Update mean and variance with value.
+    mean(self)
+        Mean of added values.
+    variance(self)
+        Population variance of added values.
+    sd(self)
+        Population standard deviation of added values.
+    """
+
+    def __init__(self):
+
+        self.counts = np.zeros(0)
+        self.means = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.scalar = None
+
+    def add(self, value):
+
+        """
+        Update mean and variance with value.
+        :param value: float or list or ndarray (1d)
+        :return: nothing
+        """
+
+        if self.scalar is None:
+            self.scalar = np.ndim(value) == 0
+        value = np.atleast_1d(np.asarray(value, dtype=np.float64))
+        num_of_elements = len(value)
+        # elements beyond the previous length start with zero count
+        if num_of_elements > len(self.counts):
+            num_of_new = num_of_elements - len(self.counts)
+            self.counts = np.concatenate((self.counts, np.zeros(num_of_new)))
+            self.means = np.concatenate((self.means, np.zeros(num_of_new)))
+            self.m2 = np.concatenate((self.m2, np.zeros(num_of_new)))
+        self.counts[:num_of_elements] += 1
+        delta = value - self.means[:num_of_elements]
+        self.means[:num_of_elements] += delta / self.counts[:num_of_elements]
+        self.m2[:num_of_elements] += delta * (value - self.means[:num_of_elements])
+
+    def mean(self):
+
+        """
+        Mean of added values.
+        :return: float (scalars; nan if empty) or ndarray (1d)
+        """
+
+        if self.scalar:
+            return self.means[0]
+        if self.scalar is None:
+            return np.nan
+        return self.means.copy()
+
+    def variance(self):
+
+        """
+        Population variance of added values.
+        :return: float (scalars; nan if empty) or ndarray (1d)
+        """
+
+        if self.scalar is None:
+            return np.nan
+        variance = self.m2 / np.maximum(self.counts, 1)
+        return variance[0] if self.scalar else variance
+
+    def sd(self):
+
+        """
+        Population standard deviation of added values.
+        :return: float (scalars; nan if empty) or ndarray (1d)
+        """
+
+        return np.sqrt(self.variance())
+
+
 class ProcessROI:
 
     """
@@ -2432,6 +4388,10 @@ class ProcessROI:
     metadata_columns : list of strings
         List of Excel letetrs for columns containing metadata info in
         workbook_summary.
+    ensemble_columns : list of strings
+        List of Excel letters for columns containing ensemble NPS info
+        in workbook_summary (following metadata columns; empty if
+        useEnsembleNPS is False).
     all_roi_dict : dict of dict of lists of tuples
         (See attribute all_roi_dict of class GUI)
     sorted_all_roi_dict : dict of dicts
@@ -2495,6 +4455,45 @@ class ProcessROI:
                            sinks under 60% of peak NPS value when moving to left)
                'right_dev' (freq distance between peak freq and freq, at which NPS
                             sinks under 60% of peak NPS value when moving to right)
+    ensemble_nps_sums : dict of dicts
+        For current series folder.
+        Keys : tuples (shape of FFT of ROIs, shape of ROIs, pixel spacing in y and x direction)
+        Values : dict
+            'sum' : sum of 2d NPS of all ROIs of this shape
+            'count' : number of summed ROIs
+    ensemble_nps_dict : dict
+        1d NPS of current series folder built from the mean 2d NPS
+        (See return of method ensemble_nps).
+    peak_info_dict_ensemble : dict
+        Peak information of ensemble_nps_dict
+        (Same keys as peak_info_dict_ave).
+    series_stats : dict of RunningStats objects
+        For current series folder.
+        Keys : 'nps' (averaged NPS of images), 'AUC', 'integral_of_2d_NPS' (of ROIs),
+               'mean_HU', 'SD' (averaged among ROIs of images)
+    volume_rois : list
+        For current series folder. ROIs of its first image, which are
+        the sections of cuboid ROIs of 3d NPS (useVolumeNPS).
+    volume_rois_differ : bool
+        Whether ROIs of current series folder differ between images,
+        so that no cuboid ROIs are formed (See method set_volume_rois).
+    volume_buffer : deque of tuples
+        Slice positions and sections of cuboid ROIs of the last
+        volume_nps_depth slices of current series folder.
+    volume_slices_pending : int
+        Number of slices of volume_buffer added after the last computed chunk.
+    volume_dropped_slices : int
+        Number of slices of current series folder not covered by any chunk
+        (series with less than two slices).
+    volume_nps_sums : dict of dicts
+        For current series folder.
+        Keys : tuples (shape of cuboids, slice spacing, pixel spacing in y and x direction)
+        Values : dict
+            'sum' : sum of 3d NPS (half spectra) of all cuboids of this shape
+            'count' : number of summed cuboids
+    volume_nps_dicts : list of dicts
+        Axial and longitudinal profiles of 3d NPS of current series folder
+        (See return of method volume_nps).
 
 
     Methods
@@ -2506,7 +4505,11 @@ class ProcessROI:
                  crop_perc, useFitting, im_height_in_mm,
                  im_width_in_mm, extensions, trunc_percentage,
                  useCentralCropping, start_freq_range, end_freq_range, step,
-                 useTruncation, multipleFiles, pixel_size_in_mm, first_data_set):
+                 useTruncation, multipleFiles, pixel_size_in_mm, first_data_set,
+                 decode_workers, partial_pixel_reads, useHalfSpectrum, radial_bin_width,
+                 useEnsembleNPS, fft_backend, fft_workers, useSinglePrecision, single_precision_tolerance,
+                 summary_only, radial_scheme, roi_fft_size, subroi_size, subroi_overlap, roi_window,
+                 useVolumeNPS, volume_nps_depth, volume_nps_overlap):
 
         """
         Start initialiazation and sorting of all_roi_dict.
@@ -2567,6 +4570,66 @@ class ProcessROI:
         :param first_data_set: boolean
             Specify folder structure of dataset.
             Near description is to find in manual.
+        :param decode_workers: int
+            Number of processes decoding images of a series
+            ahead of the NPS computation (0 or 1: decoding in main process).
+        :param partial_pixel_reads: boolean
+            Whether only rows covered by ROIs are read from uncompressed dicoms
+            (see method read_pixel_rows of class StartClass).
+        :param useHalfSpectrum: boolean
+            Whether NPS is computed from the non-redundant half of the spectrum
+            of the real ROI data (rfft2) instead of the whole spectrum (fft2).
+            Results are the same.
+        :param radial_bin_width: float
+            Width of rings of radial average of 2d NPS in samples of the spectrum.
+        :param useEnsembleNPS: boolean
+            Whether 2d NPS of all equally shaped ROIs in series folder are averaged
+            and reduced to one 1d NPS in addition (see method ensemble_nps).
+            Results are written to own columns of summary and averaged worksheets.
+        :param fft_backend: string
+            Library computing FFTs of ROIs: 'numpy', 'scipy', 'pyfftw' or 'auto'
+            (See class FFTBackend).
+        :param fft_workers: int
+            Number of threads of FFTs (-1: all cores; not used by 'numpy').
+        :param useSinglePrecision: boolean
+            Whether NPS is computed in float32/complex64 instead of float64/complex128.
+            Deviations from float64 on the first image of each series are written
+            to file float32_accuracy_report.json (See method check_single_precision).
+        :param single_precision_tolerance: float
+            Largest accepted relative deviation of float32 NPS and peak frequency from float64;
+            larger deviations are flagged in the report and a warning is printed.
+        :param summary_only: boolean
+            Whether only averaged worksheets and summary are written.
+            NPS of single images and ROIs are not kept then, series results are
+            reduced with running means (See class RunningStats).
+        :param radial_scheme: string
+            How 2d NPS is reduced to rings of radial average (See method radial_mean of class RadialBinCache):
+            'bincount' or 'nearest' (same results), 'linear' (linear weighting between neighbouring rings).
+        :param roi_fft_size: None, string 'fast' or tuple of two ints
+            Shape of FFT of ROIs. None: shape of ROI;
+            'fast': next sizes with fast FFT (scipy.fft.next_fast_len), i.e. ROIs are padded with zeros;
+            (height, width): standard size, larger ROIs are cropped to their center, smaller are padded.
+            NPS is normalized to number of pixels of (cropped) ROI, so its values do not depend
+            on padding (integral of 2d NPS and AUC are rescaled to the finer frequency sampling).
+            If set, radial average and frequencies use separate frequency axes
+            of y and x direction from pixel spacing.
+        :param subroi_size: None or int
+            If int, each ROI is a region tiled into overlapping square sub-ROIs of this size,
+            NPS of the ROI is the average NPS of its sub-ROIs (Welch's method).
+            ROIs smaller than sub-ROIs are not tiled.
+        :param subroi_overlap: float
+            Overlap of neighbouring sub-ROIs as fraction of their size (0 <= overlap < 1).
+        :param roi_window: None or string
+            Window applied to each (sub-)ROI after background removal (name
+            of scipy.signal.get_window, e.g. 'hann'), NPS is normalized to sum of squared window.
+        :param useVolumeNPS: bool
+            Whether 3d NPS of cuboid ROIs (ROIs of first image of series over consecutive slices)
+            is computed additionally (axial and longitudinal profiles in worksheet '3D_NPS').
+        :param volume_nps_depth: int
+            Number of slices of cuboid ROIs (chunk of slices kept in memory); last slices
+            of series form a final chunk overlapping the previous one.
+        :param volume_nps_overlap: float
+            Overlap of neighbouring chunks as fraction of their depth (0 <= overlap < 1).
         """
 
         print('Constructor of class ProcessROI is being executed')
@@ -2626,6 +4689,53 @@ class ProcessROI:
         self.new_dict = {}
         # type of data set
         self.first_data_set = first_data_set
+        # number of decoding processes and their pool (created in execute_calc_nps_sorted)
+        self.decode_workers = decode_workers
+        self.decode_pool = None
+        # whether only rows covered by ROIs are read
+        self.partial_pixel_reads = partial_pixel_reads
+        # whether only half of the spectrum of ROIs is computed
+        self.useHalfSpectrum = useHalfSpectrum
+        # ring labels for radial average, built once per ROI shape
+        self.radial_bin_width = radial_bin_width
+        self.radial_scheme = radial_scheme
+        # shape of FFT of ROIs (padding/cropping)
+        self.roi_fft_size = roi_fft_size
+        # tiling of ROIs into overlapping sub-ROIs
+        self.subroi_size = subroi_size
+        self.subroi_overlap = subroi_overlap
+        # window of (sub-)ROIs, built once per ROI shape
+        self.roi_window = roi_window
+        self.windows = {}
+        # 3d NPS of cuboid ROIs streamed over overlapping chunks of slices
+        self.useVolumeNPS = useVolumeNPS
+        self.volume_nps_depth = volume_nps_depth
+        self.volume_nps_overlap = volume_nps_overlap
+        self.volume_rois = []
+        self.volume_rois_differ = False
+        self.volume_buffer = collections.deque(maxlen=self.volume_nps_depth)
+        self.volume_slices_pending = 0
+        self.volume_dropped_slices = 0
+        self.volume_nps_sums = {}
+        self.volume_nps_dicts = []
+        self.radial_bins = RadialBinCache()
+        # background polynomials of ROIs (useFitting), projections built once per ROI shape
+        self.detrender = PolynomialDetrender()
+        # whether 2d NPS are averaged before radial average (ensemble NPS)
+        self.useEnsembleNPS = useEnsembleNPS
+        # sums of 2d NPS of current series for each ROI shape and pixel spacing
+        self.ensemble_nps_sums = {}
+        # library computing FFTs of ROIs (FFTW wisdom is kept in cwd)
+        self.fftw_wisdom_name = 'fftw_wisdom.json'
+        self.fft = FFTBackend(name=fft_backend, workers=fft_workers, wisdom_file=self.fftw_wisdom_name)
+        # floating point type of NPS computation and deviations of float32 from float64
+        self.useSinglePrecision = useSinglePrecision
+        self.compute_dtype = np.float32 if useSinglePrecision else np.float64
+        self.single_precision_tolerance = single_precision_tolerance
+        self.precision_report_name = 'float32_accuracy_report.json'
+        self.precision_report = []
+        # whether only averaged worksheets and summary are written
+        self.summary_only = summary_only
         self.object_roi = obj_roi
         self.object_arr = obj_arr
         self.fit_order = fit_order
@@ -2688,6 +4798,15 @@ class ProcessROI:
         for col in self.metadata_columns:
             self.worksheet_summary.column_dimensions[col].width = 33.00
 
+        # columns of ensemble NPS follow metadata columns
+        self.ensemble_headers = []
+        if self.useEnsembleNPS:
+            self.ensemble_headers = ['ens_peak_freq', 'ens_peak_value', 'ens_left_dev',
+                                     'ens_right_dev', 'ens_area', 'ens_Integral', 'ens_num_ROIs']
+        self.headers_list += self.ensemble_headers
+        self.ensemble_columns = [opxl.utils.get_column_letter(i + 12 + len(self.metadata_headers)) for i
+                                 in range(len(self.ensemble_headers))]
+
         # name of xlsx-file
         self.name_xlsx = 'NPS_ranged_GUI.xlsx'
         # letters as column names in excel
@@ -2718,93 +4837,205 @@ class ProcessROI:
         """
         Main method of the class ProcessROI.
 
-        Calculate NPS by iterating over pixel array of each ROI.
-        Create xlsx-files with results.
-        :return: nothing
+        Calculate NPS by iterating over pixel array of each ROI.
+        Create xlsx-files with results.
+        :return: nothing
+        """
+
+        ave_folder = GUI.create_aux_folder(cur_fold=os.getcwd(), folder_name='Only_averaged_sheets')
+
+        # pool of processes decoding images ahead of NPS computation
+        if self.decode_workers > 1:
+            self.decode_pool = mp.Pool(self.decode_workers)
+        try:
+            self.process_all_folders(ave_folder=ave_folder)
+        finally:
+            if self.decode_pool is not None:
+                self.decode_pool.terminate()
+                self.decode_pool = None
+            self.fft.save_wisdom()
+            if self.precision_report:
+                with open(self.precision_report_name, 'w') as file:
+                    json.dump(self.precision_report, file, indent=2)
+        self.workbook_summary.save(self.name_workbook_summary)
+        if init_dict['destroy_main_window']:
+            self.object_roi.master.destroy()
+
+    def process_all_folders(self, ave_folder):
+
+        """
+        Iterate over study and series folders and calculate NPS for each series.
+        :param ave_folder: string
+            Path to folder for workbooks with only averaged sheets.
+        :return: nothing
+        """
+
+        try:
+            # iterate over keys of the passed dict, i.e. folder paths
+            for self.num_folder, self.folder in enumerate(self.sorted_all_roi_dict):
+                # log the process
+                print('\n\nFolder %s is been processed: %d of %d\n\n' % (os.path.basename(self.folder), self.num_folder + 1,
+                                                                         len(self.sorted_all_roi_dict)))
+
+                if self.first_data_set:
+                    self.folder_part = os.path.basename(self.folder)
+                else:
+                    self.folder_part = ProcessROI.drop_part_of_name(
+                        name=os.path.basename(self.folder),
+                        pattern_of_dropped_part=r' \- \d+',
+                        dropped_from_end=True)
+
+                # create workbook for only averaged sheets
+                name_averaged_workbook = ave_folder + '/' + self.folder_part + '.xlsx'
+                self.workbook_averaged = xlsx.Workbook(name_averaged_workbook)
+
+                # iterate over series
+                for self.num_series, series in enumerate(self.sorted_all_roi_dict[self.folder]):
+
+                    global start_time_series
+                    start_time_series = time.time()
+
+                    if self.first_data_set:
+                            self.serie_part = serie
+                            self.folder_part = os.path.basename(self.folder)
+                    else:
+                        # series split from a folder (See method group_series of class HeaderCatalog) keep
+                        # their suffix '_S<n>' after the trimmed folder name, so their names stay unique
+                        series_folder = os.path.basename(os.path.dirname(next(iter(
+                            self.sorted_all_roi_dict[self.folder][series]))))
+                        self.serie_part = ProcessROI.drop_part_of_name(
+                            name=series_folder,
+                            pattern_of_dropped_part=r'\w*\d*_',
+                            dropped_from_end=False)[1:] + series[len(series_folder):]
+                        self.folder_part = ProcessROI.drop_part_of_name(
+                            name=os.path.basename(self.folder),
+                            pattern_of_dropped_part=r' \- \d+',
+                            dropped_from_end=True)
+                    # log the process
+                    print('\nseries %s: %d of %d\nFolder %d of %d\n' % (series, self.num_series + 1, len(self.sorted_all_roi_dict[self.folder]),
+                                                                     self.num_folder + 1,
+                                                                     len(self.sorted_all_roi_dict)
+                                                                     ))
+                    # if len(series) > 3:
+                    #     print('This is not a folder with images. Skip')
+                    #     continue
+                    # create folder Results
+                    # GUI.create_aux_folder(cur_fold=folder, folder_name='Results')
+
+
+
+                    # create worksheet to write averaged data into
+                    self.worksheet_averaged = self.workbook_averaged.add_worksheet(name=self.serie_part)
+
+                    # workbook of series is not written in summary_only mode
+                    if not self.summary_only:
+                        # results of folders inside archives are written next to the archive
+                        results_folder = ArchiveInput.output_folder(self.folder)
+                        GUI.create_aux_folder(cur_fold=results_folder, folder_name='Results_%s' % self.folder_part)
+
+                        name_for_xlsx = results_folder \
+                                        + '/Results_%s/' % (self.folder_part) \
+                                        + self.folder_part +\
+                                        self.serie_part + '.xlsx'
+                        # open new workbook in Excel
+                        self.workbook_series = xlsx.Workbook(name_for_xlsx)
+                    self.execute_nps_comp(all_roi_dict=self.sorted_all_roi_dict[self.folder][series])
+                    print('++++++++++\n'
+                          'execution time per series: %f seconds\n' % (time.time() - start_time_series))
+                    # self.execute_nps_comp(all_roi_dict=self.sorted_all_roi_dict[self.folder][series])
+                    num_remaining_folders = len(self.sorted_all_roi_dict) - self.num_folder
+                    num_rem_series_in_folder = len(self.sorted_all_roi_dict[self.folder]) - self.num_series - 1
+                    time_for_one_series = time.time() - start_time_series
+                    remaining_time = ((num_remaining_folders - 1) * len(self.sorted_all_roi_dict[self.folder]) +
+                                      num_rem_series_in_folder) * time_for_one_series
+                    remaining_hours = remaining_time // 3600
+                    remaining_minutes = (remaining_time - remaining_hours * 3600) // 60
+                    remaining_seconds = remaining_time - remaining_minutes * 60
+                    print(
+                        '%d hours, %d minutes, %f seconds remain' % (remaining_hours, remaining_minutes, remaining_seconds))
+                self.workbook_averaged.close()
+                # increment start row for summary workbook
+                self.start_row += self.num_series + 2
+        finally:
+            # release archives and members extracted from compressed archives
+            ArchiveInput.close_archives()
+
+    @staticmethod
+    def decode_image(file_and_row_span):
+
+        """
+        Decode one image in worker process of method decode_series.
+        :param file_and_row_span: tuple
+            Absolute path to image and row span to be read
+            (None: whole image is decoded).
+        :return: dict
+            (See method read_pixel_rows of class StartClass)
         """
 
-        ave_folder = GUI.create_aux_folder(cur_fold=os.getcwd(), folder_name='Only_averaged_sheets')
-
-        # iterate over keys of the passed dict, i.e. folder paths
-        for self.num_folder, self.folder in enumerate(self.sorted_all_roi_dict):
-            # log the process
-            print('\n\nFolder %s is been processed: %d of %d\n\n' % (os.path.basename(self.folder), self.num_folder + 1,
-                                                                     len(self.sorted_all_roi_dict)))
+        image_file, row_span = file_and_row_span
+        if row_span is None:
+            ret_dict = StartClass.read_pixel_array(image_file, keep_dataset=False)
+            ret_dict['partial'] = False
+        else:
+            ret_dict = StartClass.read_pixel_rows(image_file, row_span=row_span)
 
-            if self.first_data_set:
-                self.folder_part = os.path.basename(self.folder)
-            else:
-                self.folder_part = ProcessROI.drop_part_of_name(
-                    name=os.path.basename(self.folder),
-                    pattern_of_dropped_part=r' \- \d+',
-                    dropped_from_end=True)
+        return ret_dict
 
-            # create workbook for only averaged sheets
-            name_averaged_workbook = ave_folder + '/' + self.folder_part + '.xlsx'
-            self.workbook_averaged = xlsx.Workbook(name_averaged_workbook)
+    def decode_series(self, image_files, row_spans=None):
 
-            # iterate over series
-            for self.num_series, series in enumerate(self.sorted_all_roi_dict[self.folder]):
+        """
+        Yield pixel arrays of passed images in their order.
+        Slices of series volumes of StartClass are returned without decoding.
+        Other images, which are not in the pixel cache of StartClass, are decoded
+        by the pool of processes ahead of the consumer, i.e. while NPS of
+        previous images is being calculated; decoded arrays are put into the cache.
+        :param image_files: list of strings
+            Absolute paths to images of current series.
+        :param row_spans: list of tuples or None
+            Row spans covering all ROIs of respective image.
+            If passed, only these rows are read from uncompressed dicoms;
+            such partially read arrays are not cached.
+        :return: generator of dicts
+            Key: 'base_array' : Value: pixel array of the image (int16);
+            Key: 'pixel_spacing' : Value: list of two floats (None if not available).
+        """
 
-                global start_time_series
-                start_time_series = time.time()
+        pixel_cache = self.object_arr.pixel_cache
+        header_catalog = self.object_arr.header_catalog
+        series_volumes = self.object_arr.series_volumes
+        if row_spans is None:
+            row_spans = [None] * len(image_files)
+        # serve slices of series volumes without decoding
+        if series_volumes is not None and all(image_file in series_volumes.slice_index
+                                              for image_file in image_files):
+            for image_file in image_files:
+                yield {'base_array': series_volumes.get(image_file),
+                       'pixel_spacing': series_volumes.pixel_spacing(image_file)}
+            return
+        # look up cached arrays of current versions of the files
+        mtimes = [ArchiveInput.getmtime(image_file) for image_file in image_files]
+        cached_arrays = [pixel_cache.get(image_file, mtime) for image_file, mtime in zip(image_files, mtimes)]
+        items_to_decode = [(image_file, row_span) for image_file, row_span, array
+                           in zip(image_files, row_spans, cached_arrays) if array is None]
+        # decode not cached files (in order of their appearance)
+        if self.decode_pool is not None and len(items_to_decode) > 1:
+            decoded_files = self.decode_pool.imap(ProcessROI.decode_image, items_to_decode)
+        else:
+            decoded_files = map(ProcessROI.decode_image, items_to_decode)
 
-                if self.first_data_set:
-                        self.serie_part = serie
-                        self.folder_part = os.path.basename(self.folder)
+        for image_file, mtime, array in zip(image_files, mtimes, cached_arrays):
+            if array is None:
+                decoded = next(decoded_files)
+                if decoded['partial']:
+                    array = decoded['base_array']
                 else:
-                    self.serie_part = ProcessROI.drop_part_of_name(
-                        name=series,
-                        pattern_of_dropped_part=r'\w*\d*_',
-                        dropped_from_end=False)[1:]
-                    self.folder_part = ProcessROI.drop_part_of_name(
-                        name=os.path.basename(self.folder),
-                        pattern_of_dropped_part=r' \- \d+',
-                        dropped_from_end=True)
-                # log the process
-                print('\nseries %s: %d of %d\nFolder %d of %d\n' % (series, self.num_series + 1, len(self.sorted_all_roi_dict[self.folder]),
-                                                                 self.num_folder + 1,
-                                                                 len(self.sorted_all_roi_dict)
-                                                                 ))
-                # if len(series) > 3:
-                #     print('This is not a folder with images. Skip')
-                #     continue
-                # create folder Results
-                # GUI.create_aux_folder(cur_fold=folder, folder_name='Results')
-
-
-
-                GUI.create_aux_folder(cur_fold=self.folder, folder_name='Results_%s' % self.folder_part)
-
-                # create worksheet to write averaged data into
-                self.worksheet_averaged = self.workbook_averaged.add_worksheet(name=self.serie_part)
-
-                name_for_xlsx = self.folder \
-                                + '/Results_%s/' % (self.folder_part) \
-                                + self.folder_part +\
-                                self.serie_part + '.xlsx'
-                # open new workbook in Excel
-                self.workbook_series = xlsx.Workbook(name_for_xlsx)
-                self.execute_nps_comp(all_roi_dict=self.sorted_all_roi_dict[self.folder][series])
-                print('++++++++++\n'
-                      'execution time per series: %f seconds\n' % (time.time() - start_time_series))
-                # self.execute_nps_comp(all_roi_dict=self.sorted_all_roi_dict[self.folder][series])
-                num_remaining_folders = len(self.sorted_all_roi_dict) - self.num_folder
-                num_rem_series_in_folder = len(self.sorted_all_roi_dict[self.folder]) - self.num_series - 1
-                time_for_one_series = time.time() - start_time_series
-                remaining_time = ((num_remaining_folders - 1) * len(self.sorted_all_roi_dict[self.folder]) +
-                                  num_rem_series_in_folder) * time_for_one_series
-                remaining_hours = remaining_time // 3600
-                remaining_minutes = (remaining_time - remaining_hours * 3600) // 60
-                remaining_seconds = remaining_time - remaining_minutes * 60
-                print(
-                    '%d hours, %d minutes, %f seconds remain' % (remaining_hours, remaining_minutes, remaining_seconds))
-            self.workbook_averaged.close()
-            # increment start row for summary workbook
-            self.start_row += self.num_series + 2
-        self.workbook_summary.save(self.name_workbook_summary)
-        if init_dict['destroy_main_window']:
-            self.object_roi.master.destroy()
+                    array = pixel_cache.put(image_file, mtime, decoded['base_array'])
+                yield {'base_array': array,
+                       'pixel_spacing': decoded['pixel_spacing']}
+            else:
+                # pixel spacing of cached arrays is taken from the header catalog
+                yield {'base_array': array,
+                       'pixel_spacing': header_catalog.pixel_spacing(image_file)}
 
     def execute_nps_comp(self, all_roi_dict):
         
@@ -2825,34 +5056,53 @@ class ProcessROI:
         self.all_SD_dict = {}
         self.integral_2d_nps_dict = {}
         self.auc_dict = {}
+        self.ensemble_nps_sums = {}
+        # running means and variances of series (averaged NPS of images, AUC and
+        # integral of 2d NPS of ROIs, mean HU and SD of images)
+        self.series_stats = {'nps': RunningStats(),
+                             'AUC': RunningStats(),
+                             'integral_of_2d_NPS': RunningStats(),
+                             'mean_HU': RunningStats(),
+                             'SD': RunningStats()}
+        # cuboid ROIs of 3d NPS
+        self.set_volume_rois(all_roi_dict=all_roi_dict)
+        self.volume_buffer = collections.deque(maxlen=self.volume_nps_depth)
+        self.volume_slices_pending = 0
+        self.volume_dropped_slices = 0
+        self.volume_nps_sums = {}
+        # rows covered by ROIs of each image
+        row_spans = None
+        if self.partial_pixel_reads:
+            row_spans = [(min(roi[1] for roi in list(all_roi_dict[key]) + self.volume_rois),
+                          max(roi[3] for roi in list(all_roi_dict[key]) + self.volume_rois))
+                         if list(all_roi_dict[key]) + self.volume_rois else (0, 0) for key in all_roi_dict]
+        # pixel arrays of the images, decoded ahead by the pool
+        decoded_images = self.decode_series(image_files=list(all_roi_dict), row_spans=row_spans)
         # iterate through all images
-        for num_of_image, self.key_image in enumerate(all_roi_dict):
+        for num_of_image, (self.key_image, decoded) in enumerate(zip(all_roi_dict, decoded_images)):
 
             # initialize list of image ROIs' AUC
             image_auc_list = []
             # initialize list of image ROI's integral of 2d NPS
             image_integral_2d_nps_list = []
 
-            data_from_dicom = self.object_arr.create_base_array(self.key_image)
-            metadata_from_dicom = data_from_dicom['whole_dcm']
-            try:
-                pixel_spacing = [float(i) for i in metadata_from_dicom['0x0028', '0x0030'].value]
-            except ValueError:
-                pixel_spacing = self.pixel_size_in_mm
-                print('There is no property \'Pixel Spacing\'')
-            except TypeError:
-                pixel_spacing = [0.378, 0.378]
-            pixel_array_image = data_from_dicom['base_array']
+            pixel_spacing = decoded['pixel_spacing']
+            if pixel_spacing is None:
+                if os.path.basename(self.key_image)[-4:] == '.dcm':
+                    pixel_spacing = [self.pixel_size_in_mm, self.pixel_size_in_mm]
+                    print('There is no property \'Pixel Spacing\'')
+                else:
+                    pixel_spacing = [0.378, 0.378]
+            pixel_array_image = decoded['base_array']
 
             # if new series begins
             if num_of_image == 0:
-                self.metadata = data_from_dicom['metadata_subdict']
-
-            # build dict of mean HU and SD
+                # metadata of the series are taken from the header catalog
+                if os.path.basename(self.key_image)[-4:] == '.dcm':
+                    self.metadata = self.object_arr.header_catalog.get(self.key_image)['metadata_subdict']
+                else:
+                    self.metadata = {'undefined': 'undefined'}
 
-            self.build_all_mean_HU_SD_dict(array_to_operate=pixel_array_image,
-                                           all_roi_dict=all_roi_dict,
-                                           key=self.key_image)
             print('ROIs on image %s are being processed: %d of %d; '
                   'Folder %d of %d; '
                   'series %d of %d ' % (os.path.basename(self.key_image),
@@ -2868,30 +5118,42 @@ class ProcessROI:
             # collect lengths of one d nps of rois in image
             self.lengths = []
             self.image_roi_sizes = []
+            # basename of image without extensions
+            self.basename = os.path.basename(self.key_image)[:-4]
+            # basename of image with extension
+            self.basename_w_ext = os.path.basename(self.key_image)
+            # pixel arrays of all ROIs of the image
+            roi_arrays = [pixel_array_image[item_roi[1]:item_roi[3], item_roi[0]:item_roi[2]]
+                          for item_roi in all_roi_dict[self.key_image]]
+            # NPS of all ROIs (ROIs of same shape are processed as one stack)
+            roi_nps_dicts = self.compute_nps_of_rois(roi_arrays=roi_arrays, pixel_spacing=pixel_spacing)
+            # build dict of mean HU and SD (computed along with NPS)
+            if not self.summary_only:
+                self.build_all_mean_HU_SD_dict(roi_nps_dicts=roi_nps_dicts, key=self.key_image)
+            self.series_stats['mean_HU'].add(np.mean([roi_nps_dict['mean_HU'] for roi_nps_dict in roi_nps_dicts]))
+            self.series_stats['SD'].add(np.mean([roi_nps_dict['SD'] for roi_nps_dict in roi_nps_dicts]))
+            if self.volume_rois:
+                self.add_slice_to_volume_nps(pixel_array_image=pixel_array_image, pixel_spacing=pixel_spacing)
+            # compare float32 NPS of first image of series with float64 NPS
+            if self.useSinglePrecision and num_of_image == 0:
+                self.precision_report.append(self.check_single_precision(roi_arrays=roi_arrays,
+                                                                         pixel_spacing=pixel_spacing,
+                                                                         roi_nps_dicts=roi_nps_dicts))
             # iterate through all rois inside one image
             for num_of_roi, self.item_roi in enumerate(all_roi_dict[self.key_image]):
-                subarray = pixel_array_image[self.item_roi[1]:self.item_roi[3], self.item_roi[0]:self.item_roi[2]]
                 # print progress
                 print('ROI is being processed: %d of %d' % (num_of_roi + 1, len(all_roi_dict[self.key_image])))
-                # basename of image without extensions
-                self.basename = os.path.basename(self.key_image)[:-4]
-                # basename of image with extension
-                self.basename_w_ext = os.path.basename(self.key_image)
-                # array from the image
-                array_to_operate = subarray
-                # get shape of the ROI
-                shape_of_roi = array_to_operate.shape
-                # store the shape in list
-                self.image_roi_sizes.append(shape_of_roi)
-                # # apply fitting of the image
-                # self.create_pol_fit(array_to_operate)
-                # create dictionary of nps and respective frequencies (unranged)
-                dict = self.compute_nps(array=array_to_operate, pixel_spacing=pixel_spacing)
+                # store the shape of ROI in list
+                self.image_roi_sizes.append(roi_arrays[num_of_roi].shape)
+                # dictionary of nps and respective frequencies (unranged)
+                dict = roi_nps_dicts[num_of_roi]
                 AUC = dict['AUC']
                 integral_of_2d_NPS = dict['integral_of_2d_NPS']
                 # append ROI's AUC und integral of 2d NPS to resp. lists
                 image_auc_list.append(dict['AUC'])
                 image_integral_2d_nps_list.append(dict['integral_of_2d_NPS'])
+                self.series_stats['AUC'].add(dict['AUC'])
+                self.series_stats['integral_of_2d_NPS'].add(dict['integral_of_2d_NPS'])
                 if self.useTruncation:  # setting in init_dict
                     # truncate lower nps and respective frequencies
                     self.new_dict = self.truncate_nps_freq(dict=dict)
@@ -2902,28 +5164,12 @@ class ProcessROI:
                 # self.all_xlsx.append(self.create_xlsx_file_nps(dict=self.new_dict, prefix='One_D_NPS_'))
                 # create nps range
 
-                # get equations of lines connecting each two points of nps array
-                eqs_prop = ProcessROI.nps_equation(self.new_dict['values'])
-                # initialize empty list for ranged NPS (with specified s´distance
-                # between samples)
-                nps_range = []
-                # we need this array because freq_range is restricted through
-                # size of ROI, frequencies beyond the last available freq
-                # should be truncated (dropped)
-                new_freq_range = []
-                # iterate through frequencies in freq_range
-                for item_freq in self.freq_range:
-                    try:
-                        nps_range.append(self.get_current_nps(freq_array=self.new_dict['frequencies'],
-                                                              freq_value=item_freq))
-                        new_freq_range.append(item_freq)
-                    except ValueError:
-                        # if there are no more frequencies available
-                        # print('finished')
-                        # print('nps range: ', len(nps_range))
-                        break
-                # nps_range = list(map(fut.partial(self.get_current_nps, freq_array=self.new_dict['frequencies'],
-                #                                                            eqs=eqs_prop), self.freq_range))
+                # interpolate NPS at frequencies of freq_range
+                # (frequencies beyond the last available freq are dropped)
+                interpolated_dict = self.interpolate_nps(values=self.new_dict['values'],
+                                                         frequencies=self.new_dict['frequencies'])
+                nps_range = interpolated_dict['values']
+                new_freq_range = interpolated_dict['frequencies']
                 range_dict = {'values': nps_range,
                               'frequencies': new_freq_range,
                               'AUC': AUC,
@@ -2935,24 +5181,26 @@ class ProcessROI:
                 self.lengths.append(len(range_dict['values']))
                 # print('continued:  ', self.lengths)
 
+            # average stored nps
+            averaged_dict = self.average_roi_nps(list_of_dict=self.nps_image)
+            self.series_stats['nps'].add(averaged_dict['values'])
+            # only running means are kept for summary
+            if self.summary_only:
+                continue
+
             # update dict for AUC and integral of 2d NPS
             self.auc_dict.update({self.key_image: image_auc_list})
             self.integral_2d_nps_dict.update({self.key_image: image_integral_2d_nps_list})
-
-            # average stored nps
-            averaged_dict = self.average_roi_nps(list_of_dict=self.nps_image)
             self.all_average_nps.update({self.key_image: averaged_dict})
             self.roi_size_dict.update({self.key_image: self.image_roi_sizes})
 
-            # recognize all peaks in nps-array
-            peaks = ProcessROI.collect_all_max_peaks_nps(averaged_dict)
-            # handle peak info
-            peak_info_dict = self.handle_peak_info(peak_dict=peaks,
-                                                   all_val_arr=averaged_dict['values'],
-                                                   all_freq_arr=averaged_dict['frequencies'])
-            self.all_nps_peak_info.update({self.key_image: peak_info_dict})
-
             self.all_nps_dict.update({self.key_image: self.nps_image})
+        # peak info of averaged nps of all images at once
+        if not self.summary_only:
+            image_peak_info_dicts = self.peak_info_batch(curves=[self.all_average_nps[key]['values']
+                                                                 for key in self.all_average_nps],
+                                                         frequencies=self.freq_range)
+            self.all_nps_peak_info.update(zip(self.all_average_nps, image_peak_info_dicts))
         # create mean HU and SD info dictionaries
         # self.build_all_mean_HU_SD_dict(all_roi_dict=all_roi_dict)
         # self.build_all_sd_dict(all_roi_dict=all_roi_dict,
@@ -2960,25 +5208,45 @@ class ProcessROI:
         # print('SD:  ', self.all_SD_dict)
         # print('mean HU:  ', self.all_mean_HU_dict)
         # calculate mean of averaged nps
-        self.mean_of_averaged_nps_dict = ProcessROI.mean_of_ave_nps(all_average_nps=self.all_average_nps)
-        # recognize all peaks in nps-array
-        peaks_ave = ProcessROI.collect_all_max_peaks_nps(self.mean_of_averaged_nps_dict)
-        # handle peak info
-        self.peak_info_dict_ave = self.handle_peak_info(peak_dict=peaks_ave,
-                                                        all_val_arr=self.mean_of_averaged_nps_dict['values'],
-                                                        all_freq_arr=self.mean_of_averaged_nps_dict['frequencies'])
+        mean_of_averaged_nps = self.series_stats['nps'].mean()
+        self.mean_of_averaged_nps_dict = {'values': mean_of_averaged_nps,
+                                          'frequencies': self.freq_range[:len(mean_of_averaged_nps)]}
+        series_curves = [self.mean_of_averaged_nps_dict['values']]
+        if self.useEnsembleNPS:
+            # one 1d NPS from 2d NPS averaged among all ROIs of series
+            self.ensemble_nps_dict = self.ensemble_nps()
+            series_curves.append(self.ensemble_nps_dict['values'])
+        # peak info of averaged nps (and of ensemble nps)
+        series_peak_info_dicts = self.peak_info_batch(curves=series_curves, frequencies=self.freq_range)
+        self.peak_info_dict_ave = series_peak_info_dicts[0]
         # self.all_nps_peak_info_ave.update({self.key_image: self.peak_info_dict_ave})
-        # calculate SD of mean HU
-        self.sd_of_mean_HU_dict = ProcessROI.sd_of_dictionary(dict=self.all_mean_HU_dict)
-        # calculate SD of SD
-        self.sd_of_sd_dict = ProcessROI.sd_of_dictionary(dict=self.all_SD_dict)
+        if self.useEnsembleNPS:
+            self.peak_info_dict_ensemble = series_peak_info_dicts[1]
+        if self.useVolumeNPS:
+            # last slices of series (and short series) form a final chunk
+            self.finish_volume_nps(pixel_spacing=pixel_spacing)
+            # axial and longitudinal profiles of 3d NPS
+            self.volume_nps_dicts = self.volume_nps()
         # get total mean values for mean_HU and SD
-        self.total_mean_HU = ProcessROI.mean_of_mean(all_values_dict=self.all_mean_HU_dict)
-        self.total_mean_sd = ProcessROI.mean_of_mean(all_values_dict=self.all_SD_dict)
-        # create workbook for displaying results
-        # self.workbook_series = xlsx.Workbook(self.name_xlsx)
-        self.create_xlsx_file_nps(all_nps_dict=self.all_nps_dict)
-        self.workbook_series.close()
+        self.total_mean_HU = self.series_stats['mean_HU'].mean()
+        self.total_mean_sd = self.series_stats['SD'].mean()
+        if self.summary_only:
+            # only averaged worksheet and summary row are written
+            self.write_averaged_results()
+            if self.useVolumeNPS:
+                self.write_volume_nps(worksheet=self.workbook_averaged.add_worksheet(('3D_' + self.serie_part)[:31]))
+        else:
+            # calculate SD of mean HU
+            self.sd_of_mean_HU_dict = ProcessROI.sd_of_dictionary(dict=self.all_mean_HU_dict)
+            # calculate SD of SD
+            self.sd_of_sd_dict = ProcessROI.sd_of_dictionary(dict=self.all_SD_dict)
+            # create workbook for displaying results
+            # self.workbook_series = xlsx.Workbook(self.name_xlsx)
+            self.create_xlsx_file_nps(all_nps_dict=self.all_nps_dict)
+            self.workbook_series.close()
+        # log usage of cache of decoded pixel arrays
+        print('pixel cache: %(hits)d hits, %(misses)d misses, '
+              '%(arrays)d arrays, %(megabytes).1f MB' % self.object_arr.pixel_cache.stats())
         pass
         return
 
@@ -3010,108 +5278,40 @@ class ProcessROI:
         print('sort_all_roi_dict is being executed')
         # empty dict for sorted ROIs
         sorted_all_roi_dict = {}
-        total_files = len(all_roi_dict.keys())
-        # iterate over keys of all_roi_dict, i.e. file names
-        for numf, file_name_prim in enumerate(natsorted(all_roi_dict.keys(), key=lambda f: f.split('_')[-1])):
-            local_start_time = time.time()
-            print('Progress: file %d of %d' % ((numf + 1), total_files))
-            # iterate over the keys of directories_dict
-            for classdirname in natsorted(directories_dict.keys(), key=lambda f: f.split('_')[-1]):
-                # update dict
-                # sorted_all_roi_dict.update({classdirname: {}})
-                # iterate over keys of subdict
-                subdict = directories_dict[classdirname]
-                for serie_name in natsorted(subdict.keys(), key=lambda f: f.split('_')[-1]):
-                    # update dict
-                    # sorted_all_roi_dict[classdirname].update({serie_name: {}})
-                    # iterate over the files in file list
-                    for file_name_second in subdict[serie_name]:
-                        # compare key of all_roi_dict and filename
-                        if file_name_prim in file_name_second:
-                            try:
-                                temp_dict_prim = sorted_all_roi_dict[classdirname]
-                            except KeyError:
-                                sorted_all_roi_dict.update({classdirname: {}})
-                                temp_dict_prim = sorted_all_roi_dict[classdirname]
-
-                            try:
-                                temp_dict = temp_dict_prim[serie_name]
-                            except KeyError:
-                                temp_dict_prim.update({serie_name: {}})
-                                temp_dict = temp_dict_prim[serie_name]
-
-                            temp_dict.update({file_name_prim: all_roi_dict[file_name_prim]})
-                            sorted_all_roi_dict[classdirname].update({serie_name: temp_dict})
-            duration_for_loop = time.time() - local_start_time
+        # files are taken in order of directories_dict, i.e. order of studies, series and slices
+        for classdirname in directories_dict:
+            subdict = directories_dict[classdirname]
+            for serie_name in subdict:
+                temp_dict = {file_name: all_roi_dict[file_name] for file_name in subdict[serie_name]
+                             if file_name in all_roi_dict}
+                if temp_dict:
+                    sorted_all_roi_dict.setdefault(classdirname, {}).update({serie_name: temp_dict})
         print('sort_all_roi_dict is done')
 
         return sorted_all_roi_dict
 
-    def build_all_mean_HU_SD_dict(self, all_roi_dict, array_to_operate, key):
+    def build_all_mean_HU_SD_dict(self, roi_nps_dicts, key):
 
         """
-        Calculate mean HU and standard deviation for each ROI
-        on the current image and update respective dictionaries
-        all_mean_HU_dict and all_SD_dict (See description in class' docs)
+        Update dictionaries all_mean_HU_dict and all_SD_dict
+        (See description in class' docs) with mean HU and
+        standard deviation of each ROI on the current image.
 
-        :param all_roi_dict: dict
-            (See description of attribute sorted_all_roi_dict).
-        :param array_to_operate: ndarray (2d)
-            Current ROI's pixel array.
+        :param roi_nps_dicts: list of dicts
+            NPS dicts of ROIs of current image with keys 'mean_HU' and 'SD'
+            (See return of method compute_nps_of_rois).
         :param key: string
             Path to current dcm-image file.
         :return: nothing
         """
 
         # all mean HU for the current image
-        roi_image_mean_HU = []
+        roi_image_mean_HU = [roi_nps_dict['mean_HU'] for roi_nps_dict in roi_nps_dicts]
         # all mean sd for current image
-        image_sd = []
-        # iterate through all rois in image
-        for coord in all_roi_dict[key]:
-            # get pixel array of current roi
-            roi_array = array_to_operate[coord[1]:coord[3], coord[0]:coord[2]]
-
-            # calculate mean HU
-            mean_HU = np.mean(roi_array)
-            roi_image_mean_HU.append(mean_HU)
-
-            # calculate SD
-            # build homogen mean matrix
-            mean_matrix = np.ones(shape=np.array(roi_array).shape) * mean_HU
-            # calculate difference between roi image and mean image
-            diff_matrix = roi_array - mean_matrix
-            # flatten diff matrix to access all its elements easier
-            diff_flattened = diff_matrix.ravel()
-            # calculate SD for current ROI
-            sd_roi = np.sqrt(np.mean([i ** 2 for i in diff_flattened]))
-            image_sd.append(sd_roi)
+        image_sd = [roi_nps_dict['SD'] for roi_nps_dict in roi_nps_dicts]
         self.all_mean_HU_dict.update({key: roi_image_mean_HU})
         self.all_SD_dict.update({key: image_sd})
 
-        pass
-
-    @staticmethod
-    def mean_of_ave_nps(all_average_nps):
-        """
-        Averaging of passed nps values dict
-        among all images in current series folder.
-        :param all_average_nps: dict of lists of dicts
-            Keys : paths to images in current series folder.
-            Values : list range_dict attribute for each ROI.
-                (See attribute range_dict)
-        :return: dict
-            (Key :) 'values' : (Value :) nps list averaged
-        """
-        averaged_nps_as_list = []
-        for key in all_average_nps:
-            averaged_nps_as_list.append(all_average_nps[key]['values'])
-            frequens = all_average_nps[key]['frequencies']
-        mean_of_averaged_nps = np.mean(np.array(averaged_nps_as_list), axis=0)
-        mean_of_averaged_nps_dict = {'values': mean_of_averaged_nps,
-                                     'frequencies': frequens}
-        return mean_of_averaged_nps_dict
-
     @staticmethod
     def sd_of_dictionary(dict):
         """
@@ -3187,97 +5387,681 @@ class ProcessROI:
                          'frequencies': averaged_freqs}
         return averaged_dict
 
-    # method is used to get total average values from all_mean_HU_dict and all_sd_dict
+    def compute_nps_of_rois(self, roi_arrays, pixel_spacing, accumulate=True):
+
+        """
+        Compute 2d and 1d NPS of all ROIs of current image.
+        ROIs (or sub-ROIs, See method tiles_of_roi) of same shape
+        are stacked and processed by method compute_nps_stack at once.
+        2d NPS of the last ROI is saved as image.
+
+        :param roi_arrays: list of ndarrays (2d)
+            Pixel arrays of ROIs of current image.
+        :param pixel_spacing: tuple of two floats
+            Pixel spacing of dcm-image in y and
+            x direction.
+        :param accumulate: bool
+            Whether 2d NPS are added to ensemble NPS
+            and 2d NPS of the last ROI is saved.
+        :return: list of dicts
+            NPS dict of each ROI in order of roi_arrays
+            (See return of method compute_nps_stack;
+            of tiled ROIs averaged among sub-ROIs).
+        """
+
+        roi_nps_dicts = [None] * len(roi_arrays)
+        # sub-ROIs of each ROI (views into ROI)
+        roi_tiles = [self.tiles_of_roi(roi_array=roi_array) for roi_array in roi_arrays]
+        # indices of ROIs of each shape of (sub-)ROIs
+        rois_of_shape = {}
+        for num_of_roi, tiles in enumerate(roi_tiles):
+            rois_of_shape.setdefault(tiles.shape[-2:], []).append(num_of_roi)
+        for shape_of_roi, roi_indices in rois_of_shape.items():
+            # number of sub-ROIs of each ROI
+            tile_counts = [int(np.prod(roi_tiles[num_of_roi].shape[:-2])) for num_of_roi in roi_indices]
+            tile_starts = np.concatenate([[0], np.cumsum(tile_counts)])
+            # (sub-)ROIs are copied only once into the stack
+            stack = np.empty((tile_starts[-1],) + shape_of_roi, dtype=self.compute_dtype)
+            for num_of_roi, start, end in zip(roi_indices, tile_starts[:-1], tile_starts[1:]):
+                stack[start:end].reshape(roi_tiles[num_of_roi].shape)[...] = roi_tiles[num_of_roi]
+            stack_result = self.compute_nps_stack(stack=stack, pixel_spacing=pixel_spacing)
+            if self.useEnsembleNPS and accumulate:
+                self.accumulate_ensemble_nps(nps_2d_stack=stack_result['nps_2d'], fft_shape=stack_result['fft_shape'],
+                                             roi_shape=stack_result['roi_shape'], pixel_spacing=pixel_spacing)
+            for num_of_roi, start, end in zip(roi_indices, tile_starts[:-1], tile_starts[1:]):
+                if end - start == 1:
+                    roi_nps_dicts[num_of_roi] = stack_result['nps_dicts'][start]
+                else:
+                    roi_nps_dicts[num_of_roi] = ProcessROI.average_tile_nps(
+                        tile_nps_dicts=stack_result['nps_dicts'][start:end], roi_array=roi_arrays[num_of_roi])
+            # create file of 2d-NPS-image of the last ROI (average of its sub-ROIs)
+            if accumulate and roi_indices[-1] == len(roi_arrays) - 1:
+                nps_2d = stack_result['nps_2d'][tile_starts[-2]:].mean(axis=0)
+                if self.useHalfSpectrum:
+                    nps_2d = ProcessROI.full_from_half_spectrum(half_spectrum=nps_2d,
+                                                                width=stack_result['fft_shape'][1])
+                StartClass.create_image_from_2d_array(arr_2d=nps_2d,
+                                                      filename='01.2d_NPS_images/NPS_2D__' +
+                                                               self.basename + '__.jpg')
+        return roi_nps_dicts
+
+    def tiles_of_roi(self, roi_array):
+
+        """
+        Overlapping square sub-ROIs of ROI (See attributes subroi_size and subroi_overlap)
+        as strided view into ROI. Sub-ROIs not fitting into ROI entirely are omitted.
+
+        :param roi_array: ndarray (2d)
+            Pixel array of ROI.
+        :return: ndarray (3d or 4d)
+            ROI itself (1, height, width) if it is not tiled,
+            otherwise sub-ROIs (rows, columns, subroi_size, subroi_size).
+        """
+
+        size = self.subroi_size
+        if size is None or roi_array.shape[0] < size or roi_array.shape[1] < size:
+            return roi_array[np.newaxis]
+        # shift between neighbouring sub-ROIs
+        step = max(1, int(round(size * (1 - self.subroi_overlap))))
+        return np.lib.stride_tricks.sliding_window_view(roi_array, (size, size))[::step, ::step]
+
     @staticmethod
-    def mean_of_mean(all_values_dict):
+    def average_tile_nps(tile_nps_dicts, roi_array):
 
         """
-        Build mean value of numerical values of given dictionary.
-        :param all_values_dict: dict
-            Keys : Any
-            Values : single numerical values
-        :return: mean value of the values
+        Average NPS dicts of sub-ROIs of one ROI.
+
+        :param tile_nps_dicts: list of dicts
+            NPS dicts of sub-ROIs (See return of method compute_nps_stack).
+        :param roi_array: ndarray (2d)
+            Pixel array of ROI, mean HU and SD are computed of the whole ROI.
+        :return: dict
+            NPS dict of ROI (See return of method compute_nps_stack).
         """
 
-        mean_of_mean_list = []
-        for key in all_values_dict:
-            mean_of_mean_list.append(np.mean(all_values_dict[key]))
-        mean_of_mean_value = np.mean(mean_of_mean_list)
-        return mean_of_mean_value
+        ret_dict = {'values': np.mean([tile_dict['values'] for tile_dict in tile_nps_dicts], axis=0),
+                    'frequencies': tile_nps_dicts[0]['frequencies'],
+                    'integral_of_2d_NPS': np.mean([tile_dict['integral_of_2d_NPS'] for tile_dict in tile_nps_dicts]),
+                    'AUC': np.mean([tile_dict['AUC'] for tile_dict in tile_nps_dicts]),
+                    'mean_HU': roi_array.mean(dtype=np.float64),
+                    'SD': roi_array.std(dtype=np.float64)}
+
+        return ret_dict
+
+    def window_of(self, shape_of_roi):
 
-    def compute_nps(self, array, pixel_spacing):
-        
         """
-        Compute 2d and 1d NPS of given pixel array.
-        
-        :param array: ndarray (2d)
-            Pixel array of current ROI. 
+        2d window of ROIs of passed shape (See attribute roi_window),
+        built once per shape and floating point type.
+
+        :param shape_of_roi: tuple of two ints
+            Height and width of ROIs.
+        :return: ndarray (2d)
+            Window.
+        """
+
+        key = (tuple(shape_of_roi), np.dtype(self.compute_dtype).str)
+        if key not in self.windows:
+            window_y = scipy.signal.get_window(self.roi_window, shape_of_roi[0])
+            window_x = scipy.signal.get_window(self.roi_window, shape_of_roi[1])
+            self.windows[key] = np.outer(window_y, window_x).astype(self.compute_dtype)
+        return self.windows[key]
+
+    def compute_nps_stack(self, stack, pixel_spacing):
+
+        """
+        Compute 2d and 1d NPS of stack of equally shaped ROIs
+        with one FFT over the last two axes.
+
+        :param stack: ndarray (3d)
+            Pixel arrays of ROIs of same shape (N, height, width).
         :param pixel_spacing: tuple of two floats
-            Pixel spacing of dcm-image in y and 
+            Pixel spacing of dcm-image in y and
             x direction.
         :return: dict
-            Keys : 'values' - 1d NPS of ROI (not interpolated),
+            Keys : 'nps_2d' - ndarray (3d), 2d NPS of each ROI
+                   (only non-negative x frequencies, not shifted, if attribute useHalfSpectrum is True),
+                   'fft_shape' - tuple, shape of FFT of ROIs (See method fft_shape_of),
+                   'roi_shape' - tuple, shape of ROIs entering FFT (cropped to fft_shape),
+                   'nps_dicts' - list of dicts for each ROI with keys
+                   'values' - 1d NPS of ROI (not interpolated),
                    'frequencies' - respective frequencies,
                    'AUC' - area under 1d NPS profile,
-                   'integral_of_2d_nps' - as in the name.       
+                   'integral_of_2d_NPS' - as in the name,
+                   'mean_HU' - mean pixel value of ROI,
+                   'SD' - population standard deviation of pixel values of ROI.
         """
-        
+
         # if image measurements in mm are undefined
         # the default image sizing is applied
         if self.im_width_in_mm == 'undefined':
             self.im_width_in_mm = self.px_width * self.pixel_size_in_mm
         if self.im_height_in_mm == 'undefined':
             self.im_height_in_mm = self.px_height * self.pixel_size_in_mm
-        # mean pixel value of whole image
-        mean_value = np.mean(array)
-        # transform list into numpy array
-        # to access the array's properties
-        np_arr = np.array(array)
-        # get ROI size
-        roi_width = np_arr.shape[0]
-        roi_height = np_arr.shape[1]
-        # maximal size of the array (height or width)
-        max_size = max(np_arr.shape)
-        # building mean value array (background)
-        mean_arr = mean_value * np.ones(np_arr.shape)
+        stack = np.asarray(stack, dtype=self.compute_dtype)
+        # mean HU and (population) standard deviation of each ROI in float64
+        roi_means = stack.mean(axis=(1, 2), dtype=np.float64)
+        centered_stack = stack - roi_means[:, np.newaxis, np.newaxis]
+        roi_sds = np.sqrt((centered_stack ** 2).mean(axis=(1, 2)))
+        # shape of FFT, ROIs larger than it are cropped to their center
+        fft_shape = self.fft_shape_of(shape_of_roi=stack.shape[1:])
+        if stack.shape[1] > fft_shape[0] or stack.shape[2] > fft_shape[1]:
+            top = max(stack.shape[1] - fft_shape[0], 0) // 2
+            left = max(stack.shape[2] - fft_shape[1], 0) // 2
+            stack = stack[:, top:top + fft_shape[0], left:left + fft_shape[1]]
+            centered_stack = stack - stack.mean(axis=(1, 2), dtype=np.float64, keepdims=True)
+        # get ROI size (of pixels entering FFT)
+        roi_height = stack.shape[1]
+        roi_width = stack.shape[2]
         # if 2d fitting should be used
         if self.useFitting:
-            # self.polyfit is the 2d-fit of the image
-            detrended_arr = array - self.pol_fit
+            # subtract 2d polynomial fit of order fit_order of each ROI (background)
+            detrended_stack = self.detrender.detrend(stack, order=self.fit_order)
         else:
-            detrended_arr = array - mean_arr
-        # create file of detrended image
-        # StartClass.create_image_from_2d_array(arr_2d=detrended_arr,
-        #                             filename='09.Detrended_images/Detrended_image__' +
-        #                                      self.basename + '__.png')
-        # apply FFT to detrended image
-        DFT_list = np.fft.fftshift(np.fft.fft2(detrended_arr))
-        # calculate 2d-NPS
-        # nps = 1 / self.px_width / self.px_height * np.abs(DFT_list)**2
-        # nps = (self.pixel_size_in_mm ** 2) / self.px_width / self.px_height * np.abs(DFT_list) ** 2
-        nps = 1 / roi_height**2 / roi_width**2 * np.abs(DFT_list) ** 2
-        integral_of_2d_NPS = np.sum(nps)
-
-        # create file of 2d-NPS-image
-        StartClass.create_image_from_2d_array(arr_2d=nps,
-                                        filename='01.2d_NPS_images/NPS_2D__' + 
-                                                 self.basename + '__.jpg')
+            # subtract mean pixel value of each ROI (background)
+            detrended_stack = centered_stack.astype(self.compute_dtype, copy=False)
+        if self.roi_window is not None:
+            window = self.window_of(shape_of_roi=(roi_height, roi_width))
+            detrended_stack = detrended_stack * window
+            # normalization to energy of window instead of number of pixels
+            window_energy = float(np.sum(window.astype(np.float64) ** 2))
+        # smaller ROIs are padded with zeros (after background removal) by FFT
+        fft_size = None if fft_shape == (roi_height, roi_width) else fft_shape
+        if self.useHalfSpectrum:
+            # apply FFT for real data to detrended ROIs (half of spectrum)
+            DFT_stack = self.fft.rfft2(detrended_stack, shape=fft_size)
+        else:
+            # apply FFT to detrended ROIs
+            DFT_stack = np.fft.fftshift(self.fft.fft2(detrended_stack, shape=fft_size), axes=(1, 2))
+        # calculate 2d-NPS (normalized to number of ROI pixels, so that padding does not change its values)
+        if self.roi_window is None:
+            nps_stack = np.abs(DFT_stack) ** 2 / roi_height / roi_width / roi_height / roi_width
+        else:
+            nps_stack = np.abs(DFT_stack) ** 2 / roi_height / roi_width / window_energy
         # building 1d-NPS from 2d_NPS using radial average
-        nps_1d = ProcessROI.radial_mean(nps)
-        AUC = np.sum(nps_1d)
-        # self.nps_norm = self.norm_array(arr_to_normalize=nps_1d,
-        #                                 all_val_array=nps_1d)
-        # freqs = np.fft.fftfreq(max_size, self.im_width_in_mm/10/self.px_width)[:max_size // 2]
-        # calculate respective frequencies (line pairs per cm)
-        # freqs = np.fft.fftfreq(max_size, self.im_width_in_mm/10/self.px_width)[:max_size // 2]
-        freqs = np.fft.fftfreq(max_size, pixel_spacing[0] / 10)[:max_size // 2]
-        # dictionary with all NPS- and freq-values, that will be
+        radial_dict = self.radial_profile(nps_stack=nps_stack, fft_shape=fft_shape, pixel_spacing=pixel_spacing,
+                                          roi_shape=(roi_height, roi_width))
+        nps_1d_stack = radial_dict['nps_1d']
+        integrals_of_2d_NPS = radial_dict['integrals_of_2d_NPS']
+        freqs = radial_dict['frequencies']
+        AUCs = radial_dict['AUCs']
+        # dictionaries with all NPS- and freq-values, that will be
         # truncated afterwards
-        nps_dict = {'values': nps_1d,
-                    'frequencies': freqs,
-                    'integral_of_2d_NPS': integral_of_2d_NPS,
-                    'AUC': AUC}
-        return nps_dict
+        nps_dicts = [{'values': nps_1d_stack[num_in_stack],
+                      'frequencies': freqs,
+                      'integral_of_2d_NPS': integrals_of_2d_NPS[num_in_stack],
+                      'AUC': AUCs[num_in_stack],
+                      'mean_HU': roi_means[num_in_stack],
+                      'SD': roi_sds[num_in_stack]} for num_in_stack in range(stack.shape[0])]
+
+        ret_dict = {'nps_2d': nps_stack,
+                    'fft_shape': fft_shape,
+                    'roi_shape': (roi_height, roi_width),
+                    'nps_dicts': nps_dicts}
+
+        return ret_dict
+
+    def fft_shape_of(self, shape_of_roi):
+
+        """
+        Shape of FFT of ROIs of passed shape (See attribute roi_fft_size).
+
+        :param shape_of_roi: tuple of two ints
+            Height and width of ROIs.
+        :return: tuple of two ints
+            Height and width of FFT.
+        """
+
+        if self.roi_fft_size is None:
+            return tuple(shape_of_roi)
+        if self.roi_fft_size == 'fast':
+            return tuple(scipy.fft.next_fast_len(int(size), real=self.useHalfSpectrum) for size in shape_of_roi)
+        return tuple(self.roi_fft_size)
+
+    def radial_profile(self, nps_stack, fft_shape, pixel_spacing, half_spectrum=None, roi_shape=None):
+
+        """
+        Build 1d NPS of stack of 2d NPS by radial average.
+
+        Without attribute roi_fft_size rings are counted in samples of the spectrum
+        and frequencies are based on larger side of ROI and pixel spacing in y direction
+        (as it has always been); otherwise rings and frequencies are based on separate
+        frequency axes of y and x direction given by pixel spacing.
+
+        :param nps_stack: ndarray (3d)
+            2d NPS of ROIs (See key 'nps_2d' of return of method compute_nps_stack).
+        :param fft_shape: tuple of two ints
+            Height and width of FFT.
+        :param pixel_spacing: tuple of two floats
+            Pixel spacing of dcm-image in y and
+            x direction.
+        :param half_spectrum: bool or None
+            Whether nps_stack holds half spectra (not shifted);
+            None: attribute useHalfSpectrum.
+        :param roi_shape: tuple of two ints or None
+            Height and width of (cropped) ROIs, if they are padded
+            with zeros to fft_shape; None: fft_shape.
+        :return: dict
+            Keys : 'nps_1d' - ndarray (2d), 1d NPS of each 2d NPS,
+                   'frequencies' - ndarray (1d), respective frequencies (line pairs per cm),
+                   'integrals_of_2d_NPS' - ndarray (1d), integral of each 2d NPS,
+                   'AUCs' - ndarray (1d), area under each 1d NPS.
+        """
+
+        fft_height, fft_width = fft_shape
+        roi_height, roi_width = fft_shape if roi_shape is None else roi_shape
+        spacing = None
+        # frequency step between rings (line pairs per cm) of padded and not padded ROIs
+        # (centers of all rings except the last one, as np.fft.fftfreq for bin width 1)
+        freq_step = self.radial_bin_width / (max(fft_height, fft_width) * (pixel_spacing[0] / 10))
+        roi_freq_step = self.radial_bin_width / (max(roi_height, roi_width) * (pixel_spacing[0] / 10))
+        if self.roi_fft_size is not None:
+            spacing = (float(pixel_spacing[0]), float(pixel_spacing[1]))
+            freq_step = self.radial_bin_width / (max(fft_height * spacing[0], fft_width * spacing[1]) / 10)
+            roi_freq_step = self.radial_bin_width / (max(roi_height * spacing[0], roi_width * spacing[1]) / 10)
+        if half_spectrum is None:
+            half_spectrum = self.useHalfSpectrum
+        if half_spectrum:
+            # columns, which stand for two columns of the whole spectrum, are counted twice
+            column_weights = ProcessROI.half_spectrum_weights(width=fft_width)
+            integrals_of_2d_NPS = (nps_stack * column_weights).sum(axis=(1, 2))
+            # weighted radial average
+            nps_1d_stack = self.radial_bins.radial_mean(nps_stack, bin_width=self.radial_bin_width,
+                                                        half_spectrum=True, width=fft_width,
+                                                        scheme=self.radial_scheme, spacing=spacing)
+        else:
+            integrals_of_2d_NPS = nps_stack.sum(axis=(1, 2))
+            nps_1d_stack = self.radial_bins.radial_mean(nps_stack, bin_width=self.radial_bin_width,
+                                                        scheme=self.radial_scheme, spacing=spacing)
+
+        # padded spectra are sampled finer, so sums are rescaled to sampling of ROI
+        if (roi_height, roi_width) != (fft_height, fft_width):
+            integrals_of_2d_NPS = integrals_of_2d_NPS * (roi_height * roi_width / (fft_height * fft_width))
+            AUCs = nps_1d_stack.sum(axis=1) * (freq_step / roi_freq_step)
+        else:
+            AUCs = nps_1d_stack.sum(axis=1)
+
+        ret_dict = {'nps_1d': nps_1d_stack,
+                    'frequencies': np.arange(nps_1d_stack.shape[1] - 1) * freq_step,
+                    'integrals_of_2d_NPS': integrals_of_2d_NPS,
+                    'AUCs': AUCs}
+
+        return ret_dict
+
+    def check_single_precision(self, roi_arrays, pixel_spacing, roi_nps_dicts):
+
+        """
+        Compute NPS of passed ROIs in float64 once more and compare
+        it with NPS computed in float32.
+
+        :param roi_arrays: list of ndarrays (2d)
+            Pixel arrays of ROIs of current image.
+        :param pixel_spacing: tuple of two floats
+            Pixel spacing of dcm-image in y and
+            x direction.
+        :param roi_nps_dicts: list of dicts
+            NPS dicts of ROIs computed in float32 (See return of method compute_nps_of_rois).
+        :return: dict
+            Keys : 'image' - path to current image,
+                   'num_of_rois' - number of compared ROIs,
+                   'max_rel_dev_nps' - max deviation of 1d NPS (not interpolated) relative
+                                       to the maximum of float64 NPS of the ROI,
+                   'max_rel_dev_peak_freq' - max relative deviation of peak frequency
+                                             of interpolated 1d NPS,
+                   'max_abs_dev_peak_freq' - max deviation of peak frequency (line pairs per cm),
+                   'exceeds_tolerance' - whether a relative deviation exceeds
+                                         attribute single_precision_tolerance.
+        """
+
+        max_rel_dev_nps = 0.
+        max_rel_dev_peak_freq = 0.
+        max_abs_dev_peak_freq = 0.
+        self.compute_dtype = np.float64
+        try:
+            # interpolated 1d NPS of ROIs in float32 and float64
+            interpolated_pairs = []
+            roi_nps_dicts_64 = self.compute_nps_of_rois(roi_arrays=roi_arrays, pixel_spacing=pixel_spacing,
+                                                        accumulate=False)
+            for nps_dict_32, nps_dict_64 in zip(roi_nps_dicts, roi_nps_dicts_64):
+                values_64 = np.asarray(nps_dict_64['values'])
+                # deviations relative to the maximum of the curve (values near DC are close to zero)
+                abs_dev = np.abs(np.asarray(nps_dict_32['values'], dtype=np.float64) - values_64)
+                max_value_64 = np.nanmax(np.abs(values_64)) if values_64.size else 0.
+                if max_value_64 > 0:
+                    max_rel_dev_nps = max(max_rel_dev_nps, float(np.nanmax(abs_dev) / max_value_64))
+                interpolated_pair = [self.interpolate_nps(values=nps_dict['values'],
+                                                          frequencies=nps_dict['frequencies'])['values']
+                                     for nps_dict in [nps_dict_32, nps_dict_64]]
+                if interpolated_pair[0] and interpolated_pair[1]:
+                    interpolated_pairs.append(interpolated_pair)
+        finally:
+            self.compute_dtype = np.float32
+        # peak frequency of all interpolated 1d NPS
+        peak_info_dicts = self.peak_info_batch(curves=[curve for pair in interpolated_pairs for curve in pair],
+                                               frequencies=self.freq_range)
+        for peak_info_32, peak_info_64 in zip(peak_info_dicts[0::2], peak_info_dicts[1::2]):
+            abs_dev_peak_freq = abs(peak_info_32['mean_freq'] - peak_info_64['mean_freq'])
+            max_abs_dev_peak_freq = max(max_abs_dev_peak_freq, abs_dev_peak_freq)
+            if peak_info_64['mean_freq'] != 0:
+                max_rel_dev_peak_freq = max(max_rel_dev_peak_freq, abs_dev_peak_freq / abs(peak_info_64['mean_freq']))
+        print('float32 vs float64: max rel. deviation of NPS %.2e, of peak frequency %.2e' %
+              (max_rel_dev_nps, max_rel_dev_peak_freq))
+        exceeds_tolerance = max(max_rel_dev_nps, max_rel_dev_peak_freq) > self.single_precision_tolerance
+        if exceeds_tolerance:
+            print('Warning: float32 NPS of %s deviates from float64 by more than %.1e, '
+                  'consider useSinglePrecision=False' % (self.key_image, self.single_precision_tolerance))
+
+        ret_dict = {'image': self.key_image,
+                    'num_of_rois': len(roi_arrays),
+                    'max_rel_dev_nps': max_rel_dev_nps,
+                    'max_rel_dev_peak_freq': max_rel_dev_peak_freq,
+                    'max_abs_dev_peak_freq': float(max_abs_dev_peak_freq),
+                    'exceeds_tolerance': bool(exceeds_tolerance)}
+
+        return ret_dict
+
+    def accumulate_ensemble_nps(self, nps_2d_stack, fft_shape, roi_shape, pixel_spacing):
+
+        """
+        Add 2d NPS of stack of equally shaped ROIs to the sums
+        of attribute ensemble_nps_sums.
+
+        :param nps_2d_stack: ndarray (3d)
+            2d NPS of ROIs (See key 'nps_2d' of return of method compute_nps_stack).
+        :param fft_shape: tuple of two ints
+            Height and width of FFT of ROIs.
+        :param roi_shape: tuple of two ints
+            Height and width of ROIs entering FFT.
+        :param pixel_spacing: tuple of two floats
+            Pixel spacing of dcm-image in y and
+            x direction.
+        :return: nothing
+        """
+
+        key = (tuple(fft_shape), tuple(roi_shape), (float(pixel_spacing[0]), float(pixel_spacing[1])))
+        if key not in self.ensemble_nps_sums:
+            self.ensemble_nps_sums[key] = {'sum': np.zeros(nps_2d_stack.shape[1:], dtype=nps_2d_stack.dtype),
+                                           'count': 0}
+        self.ensemble_nps_sums[key]['sum'] += nps_2d_stack.sum(axis=0)
+        self.ensemble_nps_sums[key]['count'] += nps_2d_stack.shape[0]
+
+    def ensemble_nps(self):
+
+        """
+        Build 1d NPS of current series folder from 2d NPS averaged
+        among all ROIs of same shape (attribute ensemble_nps_sums).
+        Mean 2d NPS of each ROI shape is radially averaged and interpolated once,
+        1d NPS of different shapes are averaged weighted by their numbers of ROIs
+        (at each frequency among the shapes, whose range reaches the frequency).
+
+        :return: dict
+            Keys : 'values' - ensemble 1d NPS (interpolated at frequencies of freq_range),
+                   'frequencies' - respective frequencies,
+                   'AUC' - area under not interpolated 1d NPS profile (weighted mean of shapes),
+                   'integral_of_2d_NPS' - integral of mean 2d NPS (weighted mean of shapes),
+                   'num_of_rois' - number of averaged ROIs.
+        """
+
+        # interpolated 1d NPS and number of ROIs for each shape
+        shape_values = []
+        shape_counts = []
+        AUC = 0
+        integral_of_2d_NPS = 0
+        for (fft_shape, roi_shape, pixel_spacing), sum_dict in self.ensemble_nps_sums.items():
+            mean_nps_2d = sum_dict['sum'] / sum_dict['count']
+            radial_dict = self.radial_profile(nps_stack=mean_nps_2d[np.newaxis], fft_shape=fft_shape,
+                                              pixel_spacing=pixel_spacing, roi_shape=roi_shape)
+            integral = radial_dict['integrals_of_2d_NPS'][0]
+            nps_1d = radial_dict['nps_1d'][0]
+            freqs = radial_dict['frequencies']
+            AUC += radial_dict['AUCs'][0] * sum_dict['count']
+            integral_of_2d_NPS += integral * sum_dict['count']
+            nps_dict = {'values': nps_1d, 'frequencies': freqs}
+            if self.useTruncation:
+                nps_dict = self.truncate_nps_freq(dict=nps_dict)
+            interpolated_dict = self.interpolate_nps(values=nps_dict['values'],
+                                                     frequencies=nps_dict['frequencies'])
+            shape_values.append(interpolated_dict['values'])
+            shape_counts.append(sum_dict['count'])
+        num_of_rois = sum(shape_counts)
+        # all interpolated NPS start at first frequency of freq_range
+        num_of_freqs = max([len(values) for values in shape_values], default=0)
+        weighted_sum = np.zeros(num_of_freqs)
+        weights = np.zeros(num_of_freqs)
+        for values, count in zip(shape_values, shape_counts):
+            weighted_sum[:len(values)] += np.asarray(values) * count
+            weights[:len(values)] += count
+        ensemble_values = weighted_sum / np.maximum(weights, 1)
+
+        ret_dict = {'values': ensemble_values.tolist(),
+                    'frequencies': self.freq_range[:num_of_freqs].tolist(),
+                    'AUC': AUC / max(num_of_rois, 1),
+                    'integral_of_2d_NPS': integral_of_2d_NPS / max(num_of_rois, 1),
+                    'num_of_rois': num_of_rois}
+
+        return ret_dict
+
+    def set_volume_rois(self, all_roi_dict):
+
+        """
+        Set ROIs of first image of current series folder as sections of cuboid ROIs
+        (attribute volume_rois). Cuboids need the same ROIs on all slices, series whose
+        ROIs differ between images get no cuboid ROIs (attribute volume_rois_differ).
+
+        :param all_roi_dict: dict
+            ROIs of images of current series folder (See attribute all_roi_dict).
+        :return: nothing
+        """
+
+        self.volume_rois = []
+        self.volume_rois_differ = False
+        if not self.useVolumeNPS or not all_roi_dict:
+            return
+        rois_of_images = [[tuple(item_roi) for item_roi in all_roi_dict[key]] for key in all_roi_dict]
+        if all(rois == rois_of_images[0] for rois in rois_of_images):
+            self.volume_rois = rois_of_images[0]
+        else:
+            self.volume_rois_differ = True
+            print('ROIs differ between images of series, 3d NPS is not computed')
+
+    def add_slice_to_volume_nps(self, pixel_array_image, pixel_spacing):
+
+        """
+        Add sections of cuboid ROIs of current image to attribute volume_buffer.
+        When volume_buffer holds volume_nps_depth slices and the shift between
+        neighbouring (overlapping) chunks is reached, 3d NPS of this chunk is computed,
+        so that at most one chunk of cuboid ROIs is kept in memory.
+
+        :param pixel_array_image: ndarray (2d)
+            Pixel array of current image.
+        :param pixel_spacing: tuple of two floats
+            Pixel spacing of dcm-image in y and
+            x direction.
+        :return: nothing
+        """
+
+        position = self.object_arr.header_catalog.slice_position(self.key_image)
+        sections = [np.asarray(pixel_array_image[item_roi[1]:item_roi[3], item_roi[0]:item_roi[2]],
+                               dtype=self.compute_dtype) for item_roi in self.volume_rois]
+        self.volume_buffer.append((position, sections))
+        self.volume_slices_pending += 1
+        # shift between neighbouring chunks
+        step = max(1, int(round(self.volume_nps_depth * (1 - self.volume_nps_overlap))))
+        if len(self.volume_buffer) == self.volume_nps_depth and self.volume_slices_pending >= step:
+            self.compute_volume_nps_chunk(pixel_spacing=pixel_spacing)
+            self.volume_slices_pending = 0
+
+    def finish_volume_nps(self, pixel_spacing):
+
+        """
+        Compute 3d NPS of final chunk of current series folder from its last
+        volume_nps_depth slices (overlapping the previous chunk), if slices
+        at the end of the series are not covered by a chunk yet.
+        Series with less than volume_nps_depth slices form one shorter chunk,
+        series with less than two slices are counted in attribute volume_dropped_slices.
+
+        :param pixel_spacing: tuple of two floats
+            Pixel spacing of dcm-image in y and
+            x direction.
+        :return: nothing
+        """
+
+        if not self.volume_slices_pending:
+            return
+        if len(self.volume_buffer) < 2:
+            self.volume_dropped_slices += self.volume_slices_pending
+        else:
+            self.compute_volume_nps_chunk(pixel_spacing=pixel_spacing)
+        self.volume_slices_pending = 0
+
+    def compute_volume_nps_chunk(self, pixel_spacing):
+
+        """
+        Compute 3d NPS of cuboid ROIs of chunk of slices in attribute volume_buffer
+        (cuboids of same shape with one FFT over the last three axes)
+        and add it to the sums of attribute volume_nps_sums.
+        3d NPS is given in HU^2 mm^3, so that its integral over
+        frequencies is variance of cuboid.
+
+        :param pixel_spacing: tuple of two floats
+            Pixel spacing of dcm-image in y and
+            x direction.
+        :return: nothing
+        """
+
+        depth = len(self.volume_buffer)
+        positions = [position for position, _ in self.volume_buffer]
+        # mean distance between slices (mm)
+        slice_spacing = None
+        if None not in positions:
+            slice_spacing = abs(positions[-1] - positions[0]) / (depth - 1)
+        if not slice_spacing:
+            slice_spacing = float(pixel_spacing[0])
+            if not self.volume_nps_sums:
+                print('There is no property \'Image Position (Patient)\', pixel spacing is used as slice spacing')
+        pixel_spacing = (float(pixel_spacing[0]), float(pixel_spacing[1]))
+        # indices of cuboids of each shape
+        rois_of_shape = {}
+        for num_of_roi, section in enumerate(self.volume_buffer[0][1]):
+            rois_of_shape.setdefault(section.shape, []).append(num_of_roi)
+        for shape_of_roi, roi_indices in rois_of_shape.items():
+            stack = np.empty((len(roi_indices), depth) + shape_of_roi, dtype=self.compute_dtype)
+            for num_of_slice, (_, sections) in enumerate(self.volume_buffer):
+                for num_in_stack, num_of_roi in enumerate(roi_indices):
+                    stack[num_in_stack, num_of_slice] = sections[num_of_roi]
+            # subtract mean voxel value of each cuboid (background)
+            stack -= stack.mean(axis=(1, 2, 3), dtype=np.float64, keepdims=True).astype(self.compute_dtype)
+            # apply FFT for real data to cuboids (half of spectrum)
+            DFT_stack = self.fft.rfftn(stack)
+            # calculate 3d-NPS
+            voxel_volume = slice_spacing * pixel_spacing[0] * pixel_spacing[1]
+            nps_stack = np.abs(DFT_stack) ** 2 * (voxel_volume / stack[0].size)
+            key = ((depth,) + shape_of_roi, round(slice_spacing, 3), pixel_spacing)
+            sum_dict = self.volume_nps_sums.setdefault(key, {'sum': 0, 'count': 0})
+            sum_dict['sum'] = sum_dict['sum'] + nps_stack.sum(axis=0)
+            sum_dict['count'] += nps_stack.shape[0]
+
+    def volume_nps(self):
+
+        """
+        Build axial and longitudinal profiles of mean 3d NPS of current series
+        for each shape of cuboids (See attribute volume_nps_sums).
+        Axial profile is radial average of plane fz = 0,
+        longitudinal profile is average along fz of
+        3 x 3 frequencies fx, fy around zero without fx = fy = 0
+        (fluctuations of slice means, i.e. no noise texture).
+
+        :return: list of dicts
+            Keys : 'shape' - shape of cuboids (depth, height, width),
+                   'slice_spacing' - distance between slices (mm),
+                   'num_of_cuboids' - number of averaged cuboids,
+                   'axial_values' - axial 1d NPS (HU^2 mm^3),
+                   'axial_frequencies' - respective frequencies (line pairs per cm),
+                   'longitudinal_values' - longitudinal 1d NPS (HU^2 mm^3),
+                   'longitudinal_frequencies' - respective frequencies (line pairs per cm),
+                   'integral_of_3d_NPS' - integral of 3d NPS (HU^2).
+            (cuboids of final chunk of short series have less slices and form own dict)
+        """
+
+        volume_nps_dicts = []
+        for (shape_of_cuboid, slice_spacing, pixel_spacing), sum_dict in self.volume_nps_sums.items():
+            mean_nps_3d = sum_dict['sum'] / sum_dict['count']
+            depth, height, width = shape_of_cuboid
+            column_weights = ProcessROI.half_spectrum_weights(width=width)
+            # axial NPS: plane fz = 0
+            axial_dict = self.radial_profile(nps_stack=mean_nps_3d[:1], fft_shape=(height, width),
+                                             pixel_spacing=pixel_spacing, half_spectrum=True)
+            # longitudinal NPS: rows ky = 0, 1, -1 of columns kx = 0 (without element ky = 0) and kx = 1
+            rows = sorted({0, 1 % height, (height - 1) % height})
+            band_sum = mean_nps_3d[:, rows[1:], 0].sum(axis=1)
+            num_of_elements = len(rows) - 1
+            if width > 1:
+                band_sum = band_sum + mean_nps_3d[:, rows, 1].sum(axis=1)
+                num_of_elements += len(rows)
+            if column_weights[1:2].sum() == 2:
+                # column kx = -1 of whole spectrum is column kx = 1 at -fz, -fy (rows are symmetric)
+                band_sum = band_sum + mean_nps_3d[(-np.arange(depth)) % depth][:, rows, 1].sum(axis=1)
+                num_of_elements += len(rows)
+            longitudinal_values = band_sum / num_of_elements
+            # non-negative frequencies of z direction
+            num_of_freqs = depth // 2 + 1
+            volume_of_cuboid = depth * slice_spacing * height * pixel_spacing[0] * width * pixel_spacing[1]
+            volume_nps_dicts.append({'shape': shape_of_cuboid,
+                                     'slice_spacing': slice_spacing,
+                                     'num_of_cuboids': sum_dict['count'],
+                                     'axial_values': axial_dict['nps_1d'][0],
+                                     'axial_frequencies': axial_dict['frequencies'],
+                                     'longitudinal_values': longitudinal_values[:num_of_freqs],
+                                     'longitudinal_frequencies': np.arange(num_of_freqs) / (depth * slice_spacing / 10),
+                                     'integral_of_3d_NPS': (mean_nps_3d * column_weights).sum() / volume_of_cuboid})
+        return volume_nps_dicts
+
+    def write_volume_nps(self, worksheet):
+
+        """
+        Write axial and longitudinal profiles of 3d NPS of current series folder
+        (See attribute volume_nps_dicts) into passed worksheet,
+        one block of columns for each shape of cuboids.
+
+        :param worksheet: XlsxWriter's Worksheet object
+        :return: nothing
+        """
+
+        worksheet.write(0, 0, '3D NPS (HU^2 mm^3)')
+        worksheet.write(0, 2, 'dropped slices')
+        worksheet.write(0, 3, self.volume_dropped_slices)
+        if self.volume_rois_differ:
+            worksheet.write(1, 0, 'ROIs differ between slices, no cuboid ROIs')
+            return
+        if not self.volume_nps_dicts:
+            worksheet.write(1, 0, 'Series has less than 2 slices')
+            return
+        for num_of_dict, volume_dict in enumerate(self.volume_nps_dicts):
+            col = 5 * num_of_dict
+            worksheet.write(1, col, 'Cuboids %dx%dx%d px' % volume_dict['shape'])
+            worksheet.write(2, col, 'number of cuboids')
+            worksheet.write(2, col + 1, volume_dict['num_of_cuboids'])
+            worksheet.write(3, col, 'slice spacing (mm)')
+            worksheet.write(3, col + 1, volume_dict['slice_spacing'])
+            worksheet.write(4, col, 'Int of 3d-NPS')
+            worksheet.write(4, col + 1, volume_dict['integral_of_3d_NPS'])
+            # headers of the table
+            worksheet.write(6, col, 'Lp (fx, fy)')
+            worksheet.write(6, col + 1, 'NPS axial')
+            worksheet.write(6, col + 2, 'Lp (fz)')
+            worksheet.write(6, col + 3, 'NPS longitudinal')
+            row = 7
+            for frequency, value_nps in zip(volume_dict['axial_frequencies'], volume_dict['axial_values']):
+                worksheet.write(row, col, frequency)
+                worksheet.write(row, col + 1, value_nps)
+                row += 1  # next row
+            row = 7
+            for frequency, value_nps in zip(volume_dict['longitudinal_frequencies'],
+                                            volume_dict['longitudinal_values']):
+                worksheet.write(row, col + 2, frequency)
+                worksheet.write(row, col + 3, value_nps)
+                row += 1  # next row
+            worksheet.set_column(first_col=col, last_col=col, width=18)
 
     @staticmethod
     def drop_part_of_name(name, pattern_of_dropped_part, dropped_from_end):
@@ -3482,140 +6266,129 @@ class ProcessROI:
                             np.mean(self.sd_of_mean_HU_dict[image_key]))
             worksheet.write(row_mean_HU_SD_info + 2, col_SD,
                             np.mean(self.sd_of_sd_dict[image_key]))
-        worksheet_ave = self.workbook_series.add_worksheet('averaged')
+        self.write_averaged_results(worksheet_ave=self.workbook_series.add_worksheet('averaged'))
+        if self.useVolumeNPS:
+            self.write_volume_nps(worksheet=self.workbook_series.add_worksheet('3D_NPS'))
+
+    def write_averaged_results(self, worksheet_ave=None):
+
+        """
+        Write NPS info averaged among all images of current series folder
+        into worksheet 'averaged' of workbook_series (if passed),
+        into worksheet_averaged and into summary row of worksheet_summary.
+
+        :param worksheet_ave: XlsxWriter's Worksheet object or None
+            Worksheet 'averaged' of workbook_series
+            (None: workbook_series is not written, see option summary_only).
+        :return: nothing
+        """
+
+        # worksheets with same content
+        worksheets = [self.worksheet_averaged]
+        if worksheet_ave is not None:
+            worksheets.append(worksheet_ave)
         val_arr = self.mean_of_averaged_nps_dict['values']
         freq_arr = self.mean_of_averaged_nps_dict['frequencies']
+        # mean of AUC and of integral of 2d NPS among all ROIs
+        AUC = self.series_stats['AUC'].mean()
+        integral_of_2d_NPS = self.series_stats['integral_of_2d_NPS'].mean()
+
+        for worksheet in worksheets:
+            # headers of the table
+            worksheet.write(0, 0, 'Total average')
+            worksheet.write(1, 0, 'Lp')
+            worksheet.write(1, 0 + 1, 'NPS')
+
+            # initialization of cells in worksheet
+            row = 2
+            col = 0
+            for frequency, value_nps in zip(freq_arr, val_arr):
+                worksheet.write(row, col, frequency)
+                worksheet.write(row, col + 1, value_nps)
+                row += 1  # next row
 
-        # initialization of cells in worksheet
-        row = 2
-        col = 0
-
-        # headers of the table
-        worksheet_ave.write(0, 0, 'Total average')
-        worksheet_ave.write(1, 0, 'Lp')
-        worksheet_ave.write(1, 0 + 1, 'NPS')
-
-        self.worksheet_averaged.write(0, 0, 'Total average')
-        self.worksheet_averaged.write(1, 0, 'Lp')
-        self.worksheet_averaged.write(1, 0 + 1, 'NPS')
-        # worksheet.write(0, 1, 'ROI_%d' % (1 // 2 + 1))
-        # worksheet.write(0, 1 + 1,
-        #                 '%dx%d px' % (self.roi_size_dict[image_key][1 // 2][0],
-        #                               self.roi_size_dict[image_key][1 // 2][1]))
-
-        for frequency, value_nps in zip(freq_arr, val_arr):
-            worksheet_ave.write(row, col, frequency)
-            worksheet_ave.write(row, col + 1, value_nps)
-
-            self.worksheet_averaged.write(row, col, frequency)
-            self.worksheet_averaged.write(row, col + 1, value_nps)
-            row += 1  # next row
-
-
-        # additional information about size of cropped image
-        # and characteristics of nps curve
-
-        worksheet_ave.write(19 - 4, 1 + 3, 'max_peak_nps')
-        worksheet_ave.write(20 - 4, 1 + 3, 'max_peak_freq')
-        worksheet_ave.write(19 - 4, 1 + 4, self.peak_info_dict_ave['mean_value'])
-        worksheet_ave.write(20 - 4, 1 + 4, self.peak_info_dict_ave['mean_freq'])
-        worksheet_ave.write(21 - 4, 1 + 3, 'left_dev')
-        worksheet_ave.write(22 - 4, 1 + 3, 'right_dev')
-        worksheet_ave.write(21 - 4, 1 + 4, self.peak_info_dict_ave['left_dev'])
-        worksheet_ave.write(22 - 4, 1 + 4, self.peak_info_dict_ave['right_dev'])
-
-        self.worksheet_averaged.write(19 - 4, 1 + 3, 'max_peak_nps')
-        self.worksheet_averaged.write(20 - 4, 1 + 3, 'max_peak_freq')
-        self.worksheet_averaged.write(19 - 4, 1 + 4, self.peak_info_dict_ave['mean_value'])
-        self.worksheet_averaged.write(20 - 4, 1 + 4, self.peak_info_dict_ave['mean_freq'])
-        self.worksheet_averaged.write(21 - 4, 1 + 3, 'left_dev')
-        self.worksheet_averaged.write(22 - 4, 1 + 3, 'right_dev')
-        self.worksheet_averaged.write(21 - 4, 1 + 4, self.peak_info_dict_ave['left_dev'])
-        self.worksheet_averaged.write(22 - 4, 1 + 4, self.peak_info_dict_ave['right_dev'])
-
-        # writing info averaged Mean_HU, averaged SD, and area
-        worksheet_ave.write(24 - 4, 1 + 3, 'Int of 2d-NPS')
-        worksheet_ave.write(26 - 4, 1 + 3, 'averaged Mean_HU')
-        worksheet_ave.write(27 - 4, 1 + 3, 'averaged SD')
-
-        worksheet_ave.write(24 - 4, 1 + 4, np.mean(
-            [self.integral_2d_nps_dict[key] for key in self.integral_2d_nps_dict]
-        ))
-        worksheet_ave.write(26 - 4, 1 + 4, self.total_mean_HU)
-        worksheet_ave.write(27 - 4, 1 + 4, self.total_mean_sd)
-
-        self.worksheet_averaged.write(24 - 4, 1 + 3, 'Int of 2d-NPS')
-        self.worksheet_averaged.write(26 - 4, 1 + 3, 'averaged Mean_HU')
-        self.worksheet_averaged.write(27 - 4, 1 + 3, 'averaged SD')
-
-        self.worksheet_averaged.write(24 - 4, 1 + 4, np.mean(
-            [self.integral_2d_nps_dict[key] for key in self.integral_2d_nps_dict]
-        ))
-        self.worksheet_averaged.write(26 - 4, 1 + 4, self.total_mean_HU)
-        self.worksheet_averaged.write(27 - 4, 1 + 4, self.total_mean_sd)
-
-
-        # make column wider
-        worksheet_ave.set_column(first_col=4, last_col=4, width=20)
-        self.worksheet_averaged.set_column(first_col=4, last_col=4, width=20)
-
-
-        # info about averaged mean_HU and SD
-        worksheet_ave.write(19 - 4, 1 + 7, 'mean_HU')
-        worksheet_ave.write(19 - 4, 1 + 8, 'SD')
-        worksheet_ave.write(20 - 4, 1 + 6, 'averaged')
-        worksheet_ave.write(20 - 4, 1 + 7, self.total_mean_HU)
-        worksheet_ave.write(20 - 4, 1 + 8, self.total_mean_sd)
-
-        self.worksheet_averaged.write(19 - 4, 1 + 7, 'mean_HU')
-        self.worksheet_averaged.write(19 - 4, 1 + 8, 'SD')
-        self.worksheet_averaged.write(20 - 4, 1 + 6, 'averaged')
-        self.worksheet_averaged.write(20 - 4, 1 + 7, self.total_mean_HU)
-        self.worksheet_averaged.write(20 - 4, 1 + 8, self.total_mean_sd)
-
-        # create a new Chart object
-        chart_ave = self.workbook_series.add_chart({'type': 'line'})
-        chart_averaged = self.workbook_averaged.add_chart({'type': 'line'})
-        # configure the chart
-        chart_ave.add_series({'values': '=%s!$%s$3:$%s$%d' % ('averaged',
-                                                          'B',
-                                                          'B',
-                                                          len(self.mean_of_averaged_nps_dict['frequencies']) + 2),
-                          'categories': '%s!$%s$3:$%s$%d' % ('averaged',
-                                                             'A',
-                                                             'A',
-                                                             len(self.mean_of_averaged_nps_dict['frequencies']) + 2),
-                          'name': 'Total Average',
-                          'legend': False,
-                          'trendline': {'type': 'polynomial',
-                                        'order': 3,
-                                        'line': {
-                                            'color': 'red',
-                                            'width': 1,
-                                            'dash_type': 'long_dash',
-                                        },
-                                        'display_equation': False,
-                                        }})
+            # additional information about size of cropped image
+            # and characteristics of nps curve
+            worksheet.write(19 - 4, 1 + 3, 'max_peak_nps')
+            worksheet.write(20 - 4, 1 + 3, 'max_peak_freq')
+            worksheet.write(19 - 4, 1 + 4, self.peak_info_dict_ave['mean_value'])
+            worksheet.write(20 - 4, 1 + 4, self.peak_info_dict_ave['mean_freq'])
+            worksheet.write(21 - 4, 1 + 3, 'left_dev')
+            worksheet.write(22 - 4, 1 + 3, 'right_dev')
+            worksheet.write(21 - 4, 1 + 4, self.peak_info_dict_ave['left_dev'])
+            worksheet.write(22 - 4, 1 + 4, self.peak_info_dict_ave['right_dev'])
+
+            # writing info averaged Mean_HU, averaged SD, and area
+            worksheet.write(24 - 4, 1 + 3, 'Int of 2d-NPS')
+            worksheet.write(26 - 4, 1 + 3, 'averaged Mean_HU')
+            worksheet.write(27 - 4, 1 + 3, 'averaged SD')
+
+            worksheet.write(24 - 4, 1 + 4, integral_of_2d_NPS)
+            worksheet.write(26 - 4, 1 + 4, self.total_mean_HU)
+            worksheet.write(27 - 4, 1 + 4, self.total_mean_sd)
+
+            # make column wider
+            worksheet.set_column(first_col=4, last_col=4, width=20)
+
+            # info about averaged mean_HU and SD
+            worksheet.write(19 - 4, 1 + 7, 'mean_HU')
+            worksheet.write(19 - 4, 1 + 8, 'SD')
+            worksheet.write(20 - 4, 1 + 6, 'averaged')
+            worksheet.write(20 - 4, 1 + 7, self.total_mean_HU)
+            worksheet.write(20 - 4, 1 + 8, self.total_mean_sd)
+
+            # ensemble NPS (2d NPS averaged before radial average)
+            if self.useEnsembleNPS:
+                worksheet.write(0, 11, 'Ensemble (%d ROIs)' % self.ensemble_nps_dict['num_of_rois'])
+                worksheet.write(1, 11, 'Lp')
+                worksheet.write(1, 12, 'NPS')
+                row = 2
+                for frequency, value_nps in zip(self.ensemble_nps_dict['frequencies'],
+                                                self.ensemble_nps_dict['values']):
+                    worksheet.write(row, 11, frequency)
+                    worksheet.write(row, 12, value_nps)
+                    row += 1  # next row
 
+        if worksheet_ave is not None:
+            # create a new Chart object
+            chart_ave = self.workbook_series.add_chart({'type': 'line'})
+            # configure the chart
+            chart_ave.add_series({'values': '=%s!$%s$3:$%s$%d' % ('averaged',
+                                                              'B',
+                                                              'B',
+                                                              len(freq_arr) + 2),
+                              'categories': '%s!$%s$3:$%s$%d' % ('averaged',
+                                                                 'A',
+                                                                 'A',
+                                                                 len(freq_arr) + 2),
+                              'name': 'Total Average',
+                              'legend': False,
+                              'trendline': {'type': 'polynomial',
+                                            'order': 3,
+                                            'line': {
+                                                'color': 'red',
+                                                'width': 1,
+                                                'dash_type': 'long_dash',
+                                            },
+                                            'display_equation': False,
+                                            }})
+            chart_ave.set_x_axis({'name': 'Line pairs per cm'})
+            chart_ave.set_y_axis({'name': 'NPS_1D_averaged'})
+            # Insert the chart into the worksheet.
+            worksheet_ave.insert_chart('C1', chart_ave)
+
+        chart_averaged = self.workbook_averaged.add_chart({'type': 'line'})
         chart_averaged.add_series({'values': '=%s!$%s$3:$%s$%d' % (self.serie_part,
                                                                    'B',
                                                                    'B',
-                                                                   len(self.mean_of_averaged_nps_dict['frequencies']) +
-                                                                   2),
+                                                                   len(freq_arr) + 2),
                                    'categories': '%s!$%s$3:$%s$%d' % (self.serie_part,
                                                                       'A',
                                                                       'A',
-                                                                      len(self.mean_of_averaged_nps_dict[
-                                                                              'frequencies']) + 2),
+                                                                      len(freq_arr) + 2),
                                    'name': 'Total Average',
                                    'legend': False,
                                    })
-
-        chart_ave.set_x_axis({'name': 'Line pairs per cm'})
-        chart_ave.set_y_axis({'name': 'NPS_1D_averaged'})
-        # Insert the chart into the worksheet.
-        worksheet_ave.insert_chart('C1', chart_ave)
-
         chart_averaged.set_x_axis({'name': 'Line pairs per cm'})
         chart_averaged.set_y_axis({'name': 'NPS_1D_averaged'})
         # Insert the chart into the worksheet.
@@ -3640,12 +6413,8 @@ class ProcessROI:
         self.worksheet_summary['%s%d' % (self.col_peak_value, row_to_write)] = self.peak_info_dict_ave['mean_value']
         self.worksheet_summary['%s%d' % (self.col_left_dev, row_to_write)] = self.peak_info_dict_ave['left_dev']
         self.worksheet_summary['%s%d' % (self.col_right_dev, row_to_write)] = self.peak_info_dict_ave['right_dev']
-        self.worksheet_summary['%s%d' % (self.col_area, row_to_write)] = np.mean(
-            [self.auc_dict[key] for key in self.auc_dict]
-        )
-        self.worksheet_summary['%s%d' % (self.col_int_2d_nps, row_to_write)] = np.mean(
-            [self.integral_2d_nps_dict[key] for key in self.integral_2d_nps_dict]
-        )
+        self.worksheet_summary['%s%d' % (self.col_area, row_to_write)] = AUC
+        self.worksheet_summary['%s%d' % (self.col_int_2d_nps, row_to_write)] = integral_of_2d_NPS
         self.worksheet_summary['%s%d' % (self.col_ave_m_HU, row_to_write)] = self.total_mean_HU
         self.worksheet_summary['%s%d' % (self.col_ave_SD, row_to_write)] = self.total_mean_sd
 
@@ -3654,6 +6423,17 @@ class ProcessROI:
         ):
             self.worksheet_summary['%s%d' % (col_metadata, row_to_write)] = self.metadata[metadata_tag]
 
+        if self.useEnsembleNPS:
+            ensemble_values = [self.peak_info_dict_ensemble['mean_freq'],
+                               self.peak_info_dict_ensemble['mean_value'],
+                               self.peak_info_dict_ensemble['left_dev'],
+                               self.peak_info_dict_ensemble['right_dev'],
+                               self.ensemble_nps_dict['AUC'],
+                               self.ensemble_nps_dict['integral_of_2d_NPS'],
+                               self.ensemble_nps_dict['num_of_rois']]
+            for col_ensemble, value in zip(self.ensemble_columns, ensemble_values):
+                self.worksheet_summary['%s%d' % (col_ensemble, row_to_write)] = value
+
     @staticmethod
     def radial_mean(array):
         
@@ -3666,165 +6446,84 @@ class ProcessROI:
         :return: ndarray (1d)
             Radial mean of the 2d-NPS.
         """
-        
-        image = array
-        image_height = array.shape[0]
-        image_width = array.shape[1]
-        center_x = image_width // 2
-        center_y = image_height // 2
-        max_size = max(image_height, image_width)
-        # create array of radii
-        x, y = np.meshgrid(np.arange(image.shape[1]), np.arange(image.shape[0]))
-        R = np.sqrt((x - center_x) ** 2 + (y - center_y) ** 2)
-
-        # calculate the mean
-        f = lambda r: image[(R >= r - .5) & (R < r + .5)].mean()
-        # r = np.linspace(1, 302, num=302)
-        r = np.linspace(0, max_size//2, num=max_size//2+1)
-        mean = np.vectorize(f)(r)
-        mean = [array[center_y][center_x]] + mean
-        return mean
-
-    def polyfit2d(self, x, y, z):
-        """2d-fitting of 2d-array. Used for background extraction"""
-        size_x = np.array(x).shape[0]
-        size_y = np.array(y).shape[0]
-        if size_x > size_y:
-            y = np.concatenate((y, [y[-1]]*(size_x - size_y)))
+
+        return RadialBinCache().radial_mean(array[np.newaxis], bin_width=1)[0]
+
+    def interpolate_nps(self, values, frequencies):
+
+        """
+        Interpolate NPS linearly at frequencies of attribute freq_range.
+        Frequencies of freq_range beyond the last available frequency are dropped,
+        negative NPS values are set to zero.
+
+        :param values: list or ndarray (1d)
+            Not interpolated NPS values.
+        :param frequencies: list or ndarray (1d)
+            Respective frequencies (ascending).
+        :return: dict
+            Keys : 'values' - list of interpolated NPS values,
+                   'frequencies' - list of respective frequencies of freq_range.
+        """
+
+        # values and frequencies of same length
+        num_of_samples = min(len(values), len(frequencies))
+        values = np.asarray(values[:num_of_samples], dtype=np.float64)
+        frequencies = np.asarray(frequencies[:num_of_samples], dtype=np.float64)
+        # frequencies of freq_range inside of available frequencies
+        if num_of_samples == 0 or self.freq_range[0] < frequencies[0]:
+            num_in_range = 0
         else:
-            x = np.concatenate((x, [x[-1]] * (size_y - size_x)))
-        order = self.fit_order
-        ncols = (order + 1) ** 2
-        G = np.zeros((x.size, ncols))
-        ij = itertools.product(range(order + 1), range(order + 1))
-        for k, (i, j) in enumerate(ij):
-            G[:, k] = x ** i * y ** j
-        try:
-            m, _, _, _ = np.linalg.lstsq(G, z, rcond=None)
-        except:
-            print('There is a problem in file (fitting):   ', file)
-        return m
+            num_in_range = np.searchsorted(self.freq_range, frequencies[-1], side='right')
+        new_freq_range = self.freq_range[:num_in_range]
+        nps_range = np.zeros(0)
+        if num_in_range > 0:
+            nps_range = np.maximum(np.interp(new_freq_range, frequencies, values), 0)
+
+        ret_dict = {'values': nps_range.tolist(),
+                    'frequencies': new_freq_range.tolist()}
+
+        return ret_dict
 
     @staticmethod
-    def polyval2d(self, x, y, m):
-        """Auxiliar function for 2d-fitting"""
-        size_x = np.array(x).shape[0]
-        size_y = np.array(y).shape[0]
-        if size_x > size_y:
-            y = np.concatenate((y, [y[-1]]*(size_x - size_y)))
-        else:
-            x = np.concatenate((x, [x[-1]] * (size_y - size_x)))
-        order = int(np.sqrt(len(m))) - 1
-        ij = itertools.product(range(order + 1), range(order + 1))
-        z = np.zeros_like(x)
-        for a, (i, j) in zip(m, ij):
-            z += a * x ** i * y ** j
-        return z
-
-    def prepare_f_1(self, xy, a, b, c, d):
-        """Auxiliar function for 2d-fitting"""
-        i = xy // self.image_width_1  # reconstruct y coordinates
-        j = xy % self.image_width_1  # reconstruct x coordinates
-        out = i * a + j * b + i * j * c + d
-        return out
+    def half_spectrum_weights(width):
+
+        """
+        Weights of columns of half spectrum (rfft2) of real data.
+        Column of each frequency 0 < kx < width / 2 stands for itself and
+        for its mirrored column -kx of the whole spectrum; columns kx = 0
+        and kx = width / 2 (for even width) exist only once.
+
+        :param width: int
+            Width of ROI.
+        :return: ndarray (1d)
+            Weight of each column (width // 2 + 1).
+        """
+
+        kx = np.arange(width // 2 + 1)
+        return np.where((kx > 0) & (2 * kx < width), 2.0, 1.0)
 
     @staticmethod
-    def nps_equation(nps_array):
-        """Input: not ranged nps array (with larger distance between
-        samples). Return list of tuples, containing slope and bias of
-        line connecting each two points of nps array"""
-        line_equations = []
-        for s in range(len(nps_array) - 1):
-            line_equations.append(ProcessROI.determine_line_equation(point_index_1=s,
-                                                                     point_index_2=s+1,
-                                                                     point_val_1=nps_array[s],
-                                                                     point_val_2=nps_array[s+1]))
-        return line_equations
-
-    def get_current_nps(self, freq_value, freq_array):
-
-        """
-        Get NPS value respective to frequency in freq range.
-
-        :param freq_value: float
-            Current frequency value of freq_range.
-        :param freq_array: list of floats
-            Not interpolated list of NPS frequencies.
-        :return: float
-            Interpolated value of NPS respective to given freq_value.
-        """
-
-        """
-        using equations of lines between points of unranged NPS array"""
-        # all frequencies, that less than freq_value
-        less_values = [i for i in freq_array if i <= freq_value]
-        # all frequencies, that greater than freq_value
-        greater_values = [i for i in freq_array if i >= freq_value]
-        # lower boundary freq value
-        min_bound_val = max(less_values)
-        # upper boundary freq value
-        max_bound_val = min(greater_values)
-        # lower boundary index
-        min_bound_idx = list(freq_array).index(min_bound_val)
-        max_bound_idx = list(freq_array).index(max_bound_val)
-        line_prop = ProcessROI.determine_line_equation(point_index_1=min_bound_val,
-                                                       point_index_2=max_bound_val,
-                                                       point_val_1=self.new_dict['values'][min_bound_idx],
-                                                       point_val_2=self.new_dict['values'][max_bound_idx])
-        if min_bound_val == max_bound_val:
-            current_nps = self.new_dict['values'][min_bound_idx]
-        else:
-            current_nps = line_prop[0] * freq_value + line_prop[1]
-        # print('min bound value: ', self.new_dict['values'][min_bound_idx],
-        #       '  freq_value:  ', self.new_dict['values'][max_bound_idx],
-        #       'min bound index: ', min_bound_idx, '\n',
-        #       'max bound value: ', max_bound_val, 'max bound index:  ', max_bound_idx)
-        if current_nps < 0:
-            current_nps = 0
-        return current_nps
-
-    def prepare_f_2(self, xy, a, b, c, d, e, f, g, h, k):
-        """Auxiliar function for 2d-fitting"""
-        i = xy // self.image_width_1  # reconstruct y coordinates
-        j = xy % self.image_width_1  # reconstruct x coordinates
-        out = i * a + j * b + i * j * c + i * j ** 2 * d + \
-            i ** 2 * j * e + i ** 2 * j ** 2 * f + \
-            i ** 2 * g + j ** 2 * h + k
-        return out
-
-    def create_pol_fit(self, array):
-        
+    def full_from_half_spectrum(half_spectrum, width):
+
         """
-        Create 2d fit of current ROI, either of first or of second order.
-        
-        :param array: ndarray (2d)
-            Pixel array of current ROI.
+        Build whole shifted 2d-NPS from its half (rfft2) using its symmetry
+        NPS(ky, kx) = NPS(-ky, -kx).
+
+        :param half_spectrum: ndarray (2d)
+            Half 2d-NPS (height, width // 2 + 1), not shifted.
+        :param width: int
+            Width of ROI.
         :return: ndarray (2d)
-            Fitted pixel array.
+            Whole 2d-NPS with zero frequency in the center (as fftshift).
         """
-        
-        self.pol_fit = []
-        self.image_width_1 = array.shape[1]
-        self.image_height_1 = array.shape[0]
-        x = np.linspace(0, self.image_width_1 - 1, num=self.image_width_1)
-        y = np.linspace(0, self.image_height_1 - 1, num=self.image_height_1)
-        z = array[0: self.image_height_1, 0: self.image_width_1]
-        xy = np.arange(z.size)  
-        if self.fit_order == 1:
-            mvfs = np.ravel(z)
-            res = opt.curve_fit(self.prepare_f_1, xy, np.ravel(z))
-            z_est = self.prepare_f_1(xy, *res[0])
-        else:
-            mvfs = np.ravel(z)
-            res = opt.curve_fit(self.prepare_f_2, xy, np.ravel(z))
-            z_est = self.prepare_f_2(xy, *res[0])
 
-        self.pol_fit = z_est.reshape(self.image_height_1, self.image_width_1)
-        # self.fitting = np.array(self.polyfit2d(x, y, z))
-        # for item_fit_ind in range(self.fitting.shape[1]):
-        #     self.pol_fit_sub = self.polyval2d(x, y, self.fitting[:, item_fit_ind])
-        #     self.pol_fit.append(self.pol_fit_sub)
-        return self.pol_fit
+        image_height = half_spectrum.shape[0]
+        whole_spectrum = np.empty((image_height, width))
+        whole_spectrum[:, :width // 2 + 1] = half_spectrum
+        # columns of negative frequencies are mirrored columns of positive ones
+        negative_columns = np.arange(width // 2 + 1, width)
+        whole_spectrum[:, negative_columns] = half_spectrum[(-np.arange(image_height)) % image_height][:, width - negative_columns]
+        return np.fft.fftshift(whole_spectrum)
 
     def truncate_nps_freq(self, *, dict):
         
@@ -3857,39 +6556,6 @@ class ProcessROI:
                     'frequencies': truncated_freqs}
         return new_dict
 
-    @staticmethod
-    def determine_line_equation(*,
-                                point_val_1,
-                                point_index_1,
-                                point_val_2,
-                                point_index_2):
-        
-        """
-        Find slope and bias (shift) of the line containing two passed points.
-        
-        :param point_val_1: float
-            y value of first point.
-        :param point_index_1: float
-            x value of first point.
-        :param point_val_2: float
-            y value of second point.
-        :param point_index_2: float
-            x value of second point.
-        :return: tuple of floats
-            Slope and bias of the aforementioned line.
-        """
-        
-        # determination of line equation
-        # based on two points of the line
-        if point_index_1 == point_index_2:
-            slope = 1
-            shift = 0
-        else:
-            slope = (point_val_2 - point_val_1) / (point_index_2 - point_index_1)
-            shift = point_val_1 - slope * point_index_1
-
-        return slope, shift
-
     @staticmethod
     def collect_all_max_peaks_nps(dict):
         
@@ -4046,6 +6712,92 @@ class ProcessROI:
                           }
         return peak_info_dict
 
+    def peak_info_batch(self, curves, frequencies):
+
+        """
+        Peak information of several NPS curves at once
+        (same results as methods collect_all_max_peaks_nps and handle_peak_info).
+
+        Curves are stacked into NaN-padded 2d array (curves x frequency bins).
+        Peak is global max of curve (first occurrence), if the curve falls below it
+        afterwards; deviations are found with threshold searches at 60% of the peak.
+        Curves, for which the peak is not the global max (max at the end of the
+        curve after an earlier drop), curves with NaN or negative values and
+        empty curves are handled by the element-wise methods.
+
+        :param curves: list of lists or ndarrays (1d), or ndarray (2d) padded with NaN
+            NPS values of curves.
+        :param frequencies: list or ndarray (1d)
+            Frequencies common to all curves (at least as many as values of the longest curve).
+        :return: list of dicts
+            Peak information of each curve (See return of method handle_peak_info).
+        """
+
+        if isinstance(curves, np.ndarray) and curves.ndim == 2:
+            values = np.asarray(curves, dtype=np.float64)
+        else:
+            num_of_bins = max([len(curve) for curve in curves], default=0)
+            values = np.full((len(curves), num_of_bins), np.nan)
+            for num_of_curve, curve in enumerate(curves):
+                values[num_of_curve, :len(curve)] = curve
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        num_of_curves, num_of_bins = values.shape
+        indices = np.arange(num_of_bins)
+        valid = ~np.isnan(values)
+        # length of each curve up to its last value (NaN after it is padding)
+        lengths = np.where(np.any(valid, axis=1), num_of_bins - np.argmax(valid[:, ::-1], axis=1), 0)
+        # curves handled element-wise: empty, NaN inside, negative values
+        use_scalar_path = (lengths == 0) | np.any(valid != (indices < lengths[:, np.newaxis]), axis=1) | \
+            np.any(values < 0, axis=1)
+        masked = np.where(valid, values, -np.inf)
+        # global max and its first index
+        index_max = np.argmax(masked, axis=1)
+        mean_distr = masked[np.arange(num_of_curves), index_max]
+        threshold = 0.6 * mean_distr[:, np.newaxis]
+        after_max = valid & (indices > index_max[:, np.newaxis])
+        # max is recognized as peak, if the curve falls below it afterwards
+        max_is_peak = np.any(after_max & (masked < mean_distr[:, np.newaxis]), axis=1)
+        # curve without any peak does not fall anywhere
+        no_peaks = ~np.any(valid[:, 1:] & (masked[:, 1:] < masked[:, :-1]), axis=1)
+        use_scalar_path |= ~max_is_peak & ~no_peaks
+        # left deviation only if some value before max is not above 60% of max
+        before_max = indices < index_max[:, np.newaxis]
+        only_right_dev = no_peaks | np.all(~before_max | (masked > threshold), axis=1)
+        # first value under 60% of max from max on (its first occurrence in the curve is used)
+        right_candidates = valid & ~before_max & (masked < threshold)
+        has_right_dev = np.any(right_candidates, axis=1)
+        right_value = masked[np.arange(num_of_curves), np.argmax(right_candidates, axis=1)]
+        right_index = np.argmax(valid & (masked == right_value[:, np.newaxis]), axis=1)
+        # first value above 60% of max before max
+        left_candidates = before_max & (masked > threshold)
+        has_left_dev = np.any(left_candidates, axis=1) & ~only_right_dev
+        left_index = np.argmax(left_candidates, axis=1)
+
+        peak_info_dicts = []
+        for num_of_curve in range(num_of_curves):
+            if use_scalar_path[num_of_curve]:
+                all_val_arr = list(values[num_of_curve, :lengths[num_of_curve]])
+                all_freq_arr = list(frequencies[:lengths[num_of_curve]])
+                peaks = ProcessROI.collect_all_max_peaks_nps({'values': all_val_arr, 'frequencies': all_freq_arr})
+                peak_info_dicts.append(self.handle_peak_info(peak_dict=peaks, all_val_arr=all_val_arr,
+                                                             all_freq_arr=all_freq_arr))
+                continue
+            if no_peaks[num_of_curve]:
+                mean_freq = self.start_freq
+            else:
+                mean_freq = frequencies[index_max[num_of_curve]]
+            right_dev = 'undefined'
+            if has_right_dev[num_of_curve]:
+                right_dev = frequencies[right_index[num_of_curve]] - mean_freq
+            left_dev = 'undefined'
+            if has_left_dev[num_of_curve]:
+                left_dev = mean_freq - frequencies[left_index[num_of_curve]]
+            peak_info_dicts.append({'mean_value': mean_distr[num_of_curve],
+                                    'mean_freq': mean_freq,
+                                    'left_dev': left_dev,
+                                    'right_dev': right_dev})
+        return peak_info_dicts
+
 
 if __name__ == '__main__':
     init_dict = {
@@ -4075,7 +6827,61 @@ if __name__ == '__main__':
                  'left_upper_corner_x_md': 30,
                  'left_upper_corner_y_md': 30,
                  'destroy_main_window': True,
-                 'first_data_set': False
+                 'first_data_set': False,
+                 # number of processes reading DICOM headers (0 or 1: no parallel reading)
+                 'header_workers': max(1, mp.cpu_count() - 1),
+                 # memory ceiling of cache of decoded pixel arrays in MB (0: no caching)
+                 'pixel_cache_max_mb': 1024,
+                 # reuse folder listings and headers of previous scans (scan_catalog.sqlite)
+                 'use_scan_catalog': False,
+                 # number of processes decoding images of a series ahead of NPS computation
+                 'decode_workers': max(1, mp.cpu_count() - 1),
+                 # read only rows covered by ROIs from uncompressed dicoms (arrays are not cached then)
+                 'partial_pixel_reads': False,
+                 # stack series into memory-mapped int16 volumes (folder 04.Series_volumes;
+                 # a full copy of each analysed series is kept there until deleted by hand)
+                 'use_series_volumes': False,
+                 # compute NPS from half of the spectrum of real ROI data (rfft2), same results as fft2
+                 'useHalfSpectrum': False,
+                 # width of rings of radial average of 2d NPS (in samples of the spectrum)
+                 'radial_bin_width': 1,
+                 # average 2d NPS of all equally shaped ROIs of series before radial average
+                 # (additional results 'ens_...' in summary and averaged worksheets)
+                 'useEnsembleNPS': False,
+                 # library computing FFTs of ROIs: 'numpy', 'scipy', 'pyfftw' (if installed; FFTW wisdom
+                 # is kept in fftw_wisdom.json) or 'auto' (fastest one for each ROI shape, timed on first ROIs)
+                 'fft_backend': 'numpy',
+                 # number of threads of FFTs (-1: all cores)
+                 'fft_workers': -1,
+                 # compute NPS in float32/complex64 (deviations from float64 on first image of each series
+                 # are written to float32_accuracy_report.json)
+                 'useSinglePrecision': False,
+                 # largest accepted relative deviation of float32 NPS from float64 (larger ones are flagged
+                 # in float32_accuracy_report.json and printed as warning)
+                 'single_precision_tolerance': 1e-4,
+                 # write only averaged worksheets and summary (no workbooks with NPS of single images)
+                 'summary_only': False,
+                 # reduction of 2d NPS to rings: 'bincount', 'nearest' (sparse averaging matrix, same results),
+                 # 'linear' (values shared by neighbouring rings with linear weights)
+                 'radial_scheme': 'bincount',
+                 # shape of FFT of ROIs: None (shape of ROI), 'fast' (zero padding to fast FFT sizes) or
+                 # (height, width) (standard size: padding or cropping to center); NPS values do not depend
+                 # on padding, frequencies are built from separate y and x axes of pixel spacing
+                 'roi_fft_size': None,
+                 # size of overlapping square sub-ROIs each ROI is tiled into (None: no tiling),
+                 # NPS of ROI is average NPS of its sub-ROIs
+                 'subroi_size': None,
+                 # overlap of neighbouring sub-ROIs (fraction of subroi_size)
+                 'subroi_overlap': 0.5,
+                 # window applied to (sub-)ROIs: None or name of scipy.signal.get_window (e.g. 'hann')
+                 'roi_window': None,
+                 # compute 3d NPS of cuboid ROIs (ROIs of first image of series over consecutive slices,
+                 # slice spacing from Image Position (Patient)); results in worksheet '3D_NPS'
+                 'useVolumeNPS': False,
+                 # number of slices of cuboid ROIs
+                 'volume_nps_depth': 16,
+                 # overlap of neighbouring chunks of slices (fraction of volume_nps_depth)
+                 'volume_nps_overlap': 0.5
                  }
 
     # create base array dictionary for each image
@@ -4132,7 +6938,25 @@ if __name__ == '__main__':
                                  end_freq_range=init_dict['end_freq_range'],
                                  step=init_dict['step'],
                                  multipleFiles=init_dict['multipleFiles'],
-                                 first_data_set=init_dict['first_data_set']
+                                 first_data_set=init_dict['first_data_set'],
+                                 decode_workers=init_dict['decode_workers'],
+                                 partial_pixel_reads=init_dict['partial_pixel_reads'],
+                                 useHalfSpectrum=init_dict['useHalfSpectrum'],
+                                 radial_bin_width=init_dict['radial_bin_width'],
+                                 useEnsembleNPS=init_dict['useEnsembleNPS'],
+                                 fft_backend=init_dict['fft_backend'],
+                                 fft_workers=init_dict['fft_workers'],
+                                 useSinglePrecision=init_dict['useSinglePrecision'],
+                                 single_precision_tolerance=init_dict['single_precision_tolerance'],
+                                 summary_only=init_dict['summary_only'],
+                                 radial_scheme=init_dict['radial_scheme'],
+                                 roi_fft_size=init_dict['roi_fft_size'],
+                                 subroi_size=init_dict['subroi_size'],
+                                 subroi_overlap=init_dict['subroi_overlap'],
+                                 roi_window=init_dict['roi_window'],
+                                 useVolumeNPS=init_dict['useVolumeNPS'],
+                                 volume_nps_depth=init_dict['volume_nps_depth'],
+                                 volume_nps_overlap=init_dict['volume_nps_overlap']
                                  )
     # menu option to start calculation
     obj_gui.menu.add_cascade(label='Final', menu=obj_gui.file)
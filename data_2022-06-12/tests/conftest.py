@@ -0,0 +1,125 @@
+"""
+Shared fixtures of the tests of nps_tool.
+
+Run from folder data_2022-06-12:  python -m pytest -q tests
+"""
+
+import importlib
+import os
+import sys
+import types
+
+import matplotlib
+import numpy as np
+import pydicom
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# nps_tool selects the TkAgg backend on import, which needs a display
+_matplotlib_use = matplotlib.use
+matplotlib.use = lambda *args, **kwargs: None
+try:
+    nps_tool = importlib.import_module('nps_tool')
+finally:
+    matplotlib.use = _matplotlib_use
+
+
+@pytest.fixture
+def write_dicom():
+
+    """
+    Factory writing a CT dicom with passed pixel array (2d, or 3d for several frames)
+    and header values; returns the dataset read back from the file.
+    """
+
+    def write(path, pixel_array, transfer_syntax=ExplicitVRLittleEndian, signed=True, bits_stored=16,
+              series_uid=None, series_number=1, instance_number=1, position=0.0):
+        file_meta = FileMetaDataset()
+        file_meta.TransferSyntaxUID = transfer_syntax
+        file_meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.2'
+        file_meta.MediaStorageSOPInstanceUID = generate_uid()
+        dataset = Dataset()
+        dataset.file_meta = file_meta
+        dataset.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+        dataset.SeriesInstanceUID = series_uid or generate_uid()
+        dataset.SeriesNumber = series_number
+        dataset.InstanceNumber = instance_number
+        dataset.ImagePositionPatient = [0, 0, position]
+        dataset.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+        if pixel_array.ndim == 3:
+            dataset.NumberOfFrames = pixel_array.shape[0]
+        dataset.Rows, dataset.Columns = pixel_array.shape[-2:]
+        dataset.PixelSpacing = [0.5, 0.6]
+        dataset.BitsAllocated = 16
+        dataset.BitsStored = bits_stored
+        dataset.HighBit = bits_stored - 1
+        dataset.PixelRepresentation = 1 if signed else 0
+        dataset.SamplesPerPixel = 1
+        dataset.PhotometricInterpretation = 'MONOCHROME2'
+        dataset.RescaleSlope = 1
+        dataset.RescaleIntercept = -1024
+        dataset.PixelData = pixel_array.astype('<i2' if signed else '<u2').tobytes()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        dataset.save_as(path, enforce_file_format=True)
+        return pydicom.dcmread(path)
+
+    return write
+
+
+# arguments of ProcessROI (settings of init_dict), single tests override some of them
+PROCESS_ROI_SETTINGS = {'fit_order': 2,
+                        'crop_perc': 38,
+                        'useFitting': False,
+                        'im_height_in_mm': 'undefined',
+                        'im_width_in_mm': 'undefined',
+                        'extensions': ['.dcm'],
+                        'trunc_percentage': 1,
+                        'useCentralCropping': True,
+                        'start_freq_range': 0,
+                        'end_freq_range': 20,
+                        'step': 0.01,
+                        'useTruncation': False,
+                        'multipleFiles': True,
+                        'pixel_size_in_mm': 0.781,
+                        'first_data_set': False,
+                        'decode_workers': 1,
+                        'partial_pixel_reads': False,
+                        'useHalfSpectrum': False,
+                        'radial_bin_width': 1,
+                        'useEnsembleNPS': False,
+                        'fft_backend': 'numpy',
+                        'fft_workers': 1,
+                        'useSinglePrecision': False,
+                        'single_precision_tolerance': 1e-4,
+                        'summary_only': False,
+                        'radial_scheme': 'bincount',
+                        'roi_fft_size': None,
+                        'subroi_size': None,
+                        'subroi_overlap': 0.5,
+                        'roi_window': None,
+                        'useVolumeNPS': False,
+                        'volume_nps_depth': 16,
+                        'volume_nps_overlap': 0.5}
+
+
+@pytest.fixture
+def make_process_roi(tmp_path, monkeypatch):
+
+    """
+    Factory of ProcessROI objects built by the constructor from PROCESS_ROI_SETTINGS
+    and passed settings, with stand-ins of GUI (no ROIs) and StartClass (no files).
+    Files written by ProcessROI go into tmp_path.
+    """
+
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('01.2d_NPS_images')
+
+    def make(header_catalog=None, **settings):
+        object_roi = types.SimpleNamespace(all_roi_dict={}, array=np.zeros((512, 512)), image_rect_coord=[],
+                                           image_rect_coord_record=[], master=None)
+        object_arr = types.SimpleNamespace(filedict={}, metadata_subdict={}, header_catalog=header_catalog)
+        return nps_tool.ProcessROI(obj_roi=object_roi, obj_arr=object_arr, **dict(PROCESS_ROI_SETTINGS, **settings))
+
+    return make
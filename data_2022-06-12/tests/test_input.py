@@ -0,0 +1,223 @@
+"""
+Tests of reading of input: scanning of folders and archives,
+catalogs of headers, decoding and caching of pixel arrays.
+"""
+
+import os
+import tarfile
+import zipfile
+
+import numpy as np
+import pydicom
+import pytest
+from pydicom.uid import ExplicitVRLittleEndian, ImplicitVRLittleEndian, RLELossless, generate_uid
+
+import nps_tool
+
+
+def test_pixel_cache_evicts_least_recently_used():
+
+    arrays = {name: np.full((64, 64), num, dtype=np.int16) for num, name in enumerate('abcde')}
+    # memory ceiling of three arrays
+    pixel_cache = nps_tool.PixelArrayCache(max_megabytes=3 * arrays['a'].nbytes / 1024 ** 2)
+    for name in 'abc':
+        pixel_cache.put(name, 1.0, arrays[name])
+    # 'a' becomes most recently used, so 'b' is evicted by 'd'
+    assert pixel_cache.get('a', 1.0) is arrays['a']
+    pixel_cache.put('d', 1.0, arrays['d'])
+    assert pixel_cache.get('b', 1.0) is None
+    assert all(pixel_cache.get(name, 1.0) is arrays[name] for name in 'acd')
+    assert pixel_cache.current_bytes == 3 * arrays['a'].nbytes == pixel_cache.max_bytes
+    # changed file (other modification time) is decoded again
+    assert pixel_cache.get('a', 2.0) is None
+    # cached arrays are read-only, arrays larger than the ceiling are not cached
+    assert not arrays['a'].flags.writeable
+    pixel_cache.put('e', 1.0, np.zeros((128, 128), dtype=np.int16))
+    assert pixel_cache.get('e', 1.0) is None and pixel_cache.get('c', 1.0) is arrays['c']
+    assert pixel_cache.stats()['hits'] == 5 and pixel_cache.stats()['misses'] == 3
+
+
+def scan_folder(folder, scan_catalog=None):
+
+    """
+    Files with suffix .dcm below folder (StartClass.scan_folder does not use
+    attributes of StartClass, whose constructor opens dialogs).
+    """
+
+    return nps_tool.StartClass.scan_folder(None, pathtoFiles=folder, suffix_array=['.dcm'],
+                                           scan_catalog=scan_catalog)
+
+
+def build_header_catalog(file_list, scan_catalog=None):
+
+    header_catalog = nps_tool.HeaderCatalog(metadata_tags_list=[], workers=1)
+    header_catalog.build(file_list, scan_catalog=scan_catalog)
+    return header_catalog
+
+
+def test_scan_catalog_reuses_unchanged_folders_and_headers(tmp_path, write_dicom, monkeypatch):
+
+    folder = tmp_path / 'Ct - 001' / 'ser_1'
+    image_files = [str(folder / ('img_%d.dcm' % num)) for num in range(3)]
+    for num, image_file in enumerate(image_files):
+        write_dicom(image_file, np.full((4, 4), num), instance_number=num + 1)
+    db_path = str(tmp_path / 'scan_catalog.sqlite')
+    scan_catalog = nps_tool.ScanCatalog(db_path, ['.dcm'], [])
+    assert scan_folder(str(tmp_path), scan_catalog)['file_list'] == image_files
+    records = build_header_catalog(image_files, scan_catalog).records
+    scan_catalog.close()
+
+    # new file in the folder, the folder keeps its modification time
+    folder_stat = os.stat(folder)
+    write_dicom(str(folder / 'img_3.dcm'), np.zeros((4, 4)), instance_number=4)
+    os.utime(folder, ns=(folder_stat.st_atime_ns, folder_stat.st_mtime_ns))
+    # changed modification time of one file and changed size of another one
+    os.utime(image_files[0], ns=(os.stat(image_files[0]).st_atime_ns, os.stat(image_files[0]).st_mtime_ns + 10 ** 9))
+    file_stat = os.stat(image_files[1])
+    write_dicom(image_files[1], np.ones((6, 6)), instance_number=2)
+    os.utime(image_files[1], ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+    # headers read in the next run
+    read_files = []
+    read_header = nps_tool.HeaderCatalog.read_header
+
+    def recording_read_header(image_file, *args, **kwargs):
+        read_files.append(image_file)
+        return read_header(image_file, *args, **kwargs)
+
+    monkeypatch.setattr(nps_tool.HeaderCatalog, 'read_header', staticmethod(recording_read_header))
+    scan_catalog = nps_tool.ScanCatalog(db_path, ['.dcm'], [])
+    # stored listing of unchanged folder is used
+    assert scan_folder(str(tmp_path), scan_catalog)['file_list'] == image_files
+    header_catalog = build_header_catalog(image_files, scan_catalog)
+    assert sorted(read_files) == image_files[:2]
+    assert header_catalog.records[image_files[2]] == records[image_files[2]]
+    assert header_catalog.shape(image_files[1]) == (6, 6)
+    # changed folder is listed again
+    os.utime(folder, ns=(folder_stat.st_atime_ns, folder_stat.st_mtime_ns + 10 ** 9))
+    assert scan_folder(str(tmp_path), scan_catalog)['file_list'] == image_files + [str(folder / 'img_3.dcm')]
+    scan_catalog.close()
+
+
+def test_scan_catalog_prunes_missing_files(tmp_path, write_dicom):
+
+    folder = tmp_path / 'Ct - 001' / 'ser_1'
+    image_files = [str(folder / ('img_%d.dcm' % num)) for num in range(3)]
+    for image_file in image_files:
+        write_dicom(image_file, np.zeros((4, 4)))
+    db_path = str(tmp_path / 'scan_catalog.sqlite')
+    scan_catalog = nps_tool.ScanCatalog(db_path, ['.dcm'], [])
+    build_header_catalog(scan_folder(str(tmp_path), scan_catalog)['file_list'], scan_catalog)
+    os.remove(image_files[0])
+    file_list = scan_folder(str(tmp_path), scan_catalog)['file_list']
+    scan_catalog.prune(str(tmp_path), file_list)
+    assert sorted(scan_catalog.get_files(image_files)) == image_files[1:]
+    scan_catalog.close()
+    # catalog built with other settings is dropped
+    scan_catalog = nps_tool.ScanCatalog(db_path, ['.dcm', '.png'], [])
+    assert scan_catalog.get_files(image_files) == {} and scan_catalog.get_folder(str(folder)) is None
+    scan_catalog.close()
+
+
+@pytest.mark.parametrize('transfer_syntax', [ExplicitVRLittleEndian, ImplicitVRLittleEndian])
+@pytest.mark.parametrize('signed', [True, False])
+@pytest.mark.parametrize('bits_stored', [12, 16])
+def test_read_pixel_rows_matches_pixel_array(tmp_path, write_dicom, transfer_syntax, signed, bits_stored):
+
+    # all bit patterns (bits above BitsStored are not part of pixel values)
+    stored_values = np.random.default_rng(10).integers(0, 1 << 16, (24, 20))
+    image_file = str(tmp_path / 'img_1.dcm')
+    pixel_array = write_dicom(image_file, stored_values, transfer_syntax=transfer_syntax, signed=signed,
+                              bits_stored=bits_stored).pixel_array.astype(np.int16)
+    for row_span in [(5, 12), (0, 24), (20, 99), (7, 7)]:
+        decoded = nps_tool.StartClass.read_pixel_rows(image_file, row_span=row_span)
+        first_row, last_row = row_span[0], min(row_span[1], 24)
+        assert decoded['partial'] and decoded['base_array'].dtype == np.int16
+        np.testing.assert_array_equal(decoded['base_array'][first_row:last_row], pixel_array[first_row:last_row])
+        # rows outside of the span are left zero
+        assert not decoded['base_array'][:first_row].any() and not decoded['base_array'][last_row:].any()
+        assert decoded['pixel_spacing'] == [0.5, 0.6]
+
+
+def test_read_pixel_rows_decodes_other_files_completely(tmp_path, write_dicom):
+
+    stored_values = np.random.default_rng(11).integers(-1000, 1000, (2, 24, 20))
+    # compressed file
+    image_file = str(tmp_path / 'compressed.dcm')
+    dataset = write_dicom(image_file, stored_values[0])
+    dataset.compress(RLELossless)
+    dataset.save_as(image_file)
+    decoded = nps_tool.StartClass.read_pixel_rows(image_file, row_span=(5, 12))
+    assert not decoded['partial']
+    np.testing.assert_array_equal(decoded['base_array'], stored_values[0])
+    # file with several frames
+    image_file = str(tmp_path / 'multiframe.dcm')
+    write_dicom(image_file, stored_values)
+    decoded = nps_tool.StartClass.read_pixel_rows(image_file, row_span=(5, 12))
+    assert not decoded['partial']
+    np.testing.assert_array_equal(decoded['base_array'], pydicom.dcmread(image_file).pixel_array)
+
+
+@pytest.mark.parametrize('archive_name', ['study.zip', 'study.tar', 'study.tar.gz'])
+def test_archive_members_are_read_like_files(tmp_path, write_dicom, archive_name):
+
+    rng = np.random.default_rng(12)
+    member_names = ['Ct - 001/ser_1/img_%d.dcm' % num for num in range(3)]
+    pixel_arrays = {}
+    for member_name in member_names:
+        pixel_arrays[member_name] = rng.integers(-1000, 1000, (8, 6))
+        write_dicom(str(tmp_path / 'source' / member_name), pixel_arrays[member_name])
+    os.makedirs(tmp_path / 'exports')
+    archive_path = str(tmp_path / 'exports' / archive_name)
+    if archive_name.endswith('.zip'):
+        with zipfile.ZipFile(archive_path, 'w') as archive:
+            for member_name in member_names:
+                archive.write(tmp_path / 'source' / member_name, member_name)
+    else:
+        with tarfile.open(archive_path, 'w:gz' if archive_name.endswith('.gz') else 'w') as archive:
+            for member_name in member_names:
+                archive.add(tmp_path / 'source' / member_name, member_name)
+
+    # archive is listed like a folder
+    image_files = [os.path.join(archive_path, member_name) for member_name in member_names]
+    found_files = scan_folder(str(tmp_path / 'exports'))
+    assert found_files['file_list'] == image_files
+    assert found_files['file_dict'] == {os.path.join(archive_path, 'Ct - 001'): {'ser_1': image_files}}
+    header_catalog = build_header_catalog(image_files)
+    for member_name, image_file in zip(member_names, image_files):
+        assert header_catalog.shape(image_file) == (8, 6)
+        np.testing.assert_array_equal(nps_tool.StartClass.read_pixel_array(image_file)['base_array'],
+                                      pixel_arrays[member_name])
+        assert nps_tool.ArchiveInput.stat(image_file)[1] == os.stat(archive_path).st_mtime_ns
+    # results of folders in the archive are written next to it
+    assert nps_tool.ArchiveInput.output_folder(os.path.join(archive_path, 'Ct - 001')) == \
+        os.path.join(str(tmp_path / 'exports'), archive_name.replace('.', '_'), 'Ct - 001')
+    # folder is looked up once, compressed archive is extracted once into a temporary folder
+    assert nps_tool.ArchiveInput.archive_folders[os.path.join(archive_path, 'Ct - 001', 'ser_1')] == archive_path
+    extracted_archive = nps_tool.ArchiveInput.extracted_archives.get(archive_path)
+    assert (extracted_archive is not None) == archive_name.endswith('.gz')
+    # handles and temporary folders are released, archive is opened again when read
+    nps_tool.ArchiveInput.close_archives()
+    assert nps_tool.ArchiveInput.open_archives == {} and nps_tool.ArchiveInput.extracted_archives == {}
+    assert extracted_archive is None or not os.path.exists(extracted_archive['folder'])
+    np.testing.assert_array_equal(nps_tool.StartClass.read_pixel_array(image_files[0])['base_array'],
+                                  pixel_arrays[member_names[0]])
+    nps_tool.ArchiveInput.close_archives()
+
+
+def test_group_series_splits_mixed_folder(tmp_path, write_dicom):
+
+    folder = tmp_path / 'Ct - 001' / 'ser_1'
+    series_uids = {3: generate_uid(), 5: generate_uid()}
+    # slices of two series in one folder, file names not in order of slices
+    slices = [(5, 3), (3, 2), (5, 1), (3, 3), (5, 2), (3, 1)]
+    image_files = [str(folder / ('img_%d.dcm' % num)) for num in range(len(slices))]
+    for image_file, (series_number, instance_number) in zip(image_files, slices):
+        write_dicom(image_file, np.zeros((4, 4)), series_uid=series_uids[series_number],
+                    series_number=series_number, instance_number=instance_number, position=-2.5 * instance_number)
+    file_list = scan_folder(str(tmp_path))['file_list']
+    grouped = build_header_catalog(file_list).group_series(file_list)
+    series_files = {'ser_1_S3': [image_files[5], image_files[1], image_files[3]],
+                    'ser_1_S5': [image_files[2], image_files[4], image_files[0]]}
+    assert grouped['file_dict'] == {os.path.dirname(folder): series_files}
+    assert list(grouped['file_dict'][os.path.dirname(folder)]) == ['ser_1_S3', 'ser_1_S5']
+    assert grouped['file_list'] == series_files['ser_1_S3'] + series_files['ser_1_S5']
@@ -0,0 +1,491 @@
+"""
+Tests of NPS computations of nps_tool, mostly against
+the original (per ROI, loop-based) implementations.
+"""
+
+import os
+import types
+import warnings
+
+import numpy as np
+import pytest
+import scipy.optimize
+
+import nps_tool
+
+
+def baseline_radial_mean(array):
+
+    """
+    Radial mean of shifted 2d-NPS as originally computed (one mask per ring).
+    """
+
+    image_height, image_width = array.shape
+    center_x = image_width // 2
+    center_y = image_height // 2
+    max_size = max(image_height, image_width)
+    x, y = np.meshgrid(np.arange(image_width), np.arange(image_height))
+    R = np.sqrt((x - center_x) ** 2 + (y - center_y) ** 2)
+    r = np.linspace(0, max_size // 2, num=max_size // 2 + 1)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean = np.vectorize(lambda radius: array[(R >= radius - .5) & (R < radius + .5)].mean())(r)
+    return array[center_y][center_x] + mean
+
+
+def baseline_nps(array, pixel_spacing):
+
+    """
+    NPS dict of one ROI as originally computed (fft2 of each ROI).
+    """
+
+    detrended_arr = array - np.mean(array)
+    nps = np.abs(np.fft.fftshift(np.fft.fft2(detrended_arr))) ** 2 / array.shape[0] ** 2 / array.shape[1] ** 2
+    nps_1d = baseline_radial_mean(nps)
+    max_size = max(array.shape)
+    return {'values': nps_1d,
+            'frequencies': np.fft.fftfreq(max_size, pixel_spacing[0] / 10)[:max_size // 2],
+            'integral_of_2d_NPS': np.sum(nps),
+            'AUC': np.sum(nps_1d)}
+
+
+def assert_nps_equal(nps_dict, reference_dict):
+
+    # values close to zero (zero frequency after background removal) are compared absolutely
+    np.testing.assert_allclose(nps_dict['values'], reference_dict['values'], rtol=1e-12,
+                               atol=1e-12 * np.nanmax(reference_dict['values']))
+    np.testing.assert_array_equal(nps_dict['frequencies'], reference_dict['frequencies'])
+    np.testing.assert_allclose(nps_dict['integral_of_2d_NPS'], reference_dict['integral_of_2d_NPS'], rtol=1e-12)
+    np.testing.assert_allclose(nps_dict['AUC'], reference_dict['AUC'], rtol=1e-12)
+
+
+def test_batched_nps_matches_baseline(make_process_roi):
+
+    rng = np.random.default_rng(0)
+    image = rng.normal(40, 20, (128, 128)).astype(np.int16)
+    # ROIs of three shapes (two ROIs share a shape and are processed as one stack)
+    rois = [(10, 10, 42, 42), (50, 10, 82, 42), (0, 60, 40, 97), (90, 90, 111, 125)]
+    roi_arrays = [image[roi[1]:roi[3], roi[0]:roi[2]] for roi in rois]
+    process_roi = make_process_roi()
+    process_roi.basename = 'img_1'
+    nps_dicts = process_roi.compute_nps_of_rois(roi_arrays=roi_arrays, pixel_spacing=(0.7, 0.7))
+    assert len(nps_dicts) == len(roi_arrays)
+    for roi_array, nps_dict in zip(roi_arrays, nps_dicts):
+        assert_nps_equal(nps_dict, baseline_nps(roi_array.astype(np.float64), (0.7, 0.7)))
+    # 2d NPS of the last ROI is saved as image
+    assert os.path.isfile('01.2d_NPS_images/NPS_2D__img_1__.jpg')
+
+
+@pytest.mark.parametrize('shape', [(32, 32), (31, 33), (20, 45), (64, 17), (3, 3)])
+def test_half_spectrum_nps_matches_baseline(make_process_roi, shape):
+
+    stack = np.random.default_rng(1).normal(0, 20, (4,) + shape)
+    full_result = make_process_roi(useHalfSpectrum=False).compute_nps_stack(stack=stack, pixel_spacing=(0.7, 0.7))
+    half_result = make_process_roi(useHalfSpectrum=True).compute_nps_stack(stack=stack, pixel_spacing=(0.7, 0.7))
+    for roi_array, nps_dict in zip(stack, half_result['nps_dicts']):
+        assert_nps_equal(nps_dict, baseline_nps(roi_array, (0.7, 0.7)))
+    # whole shifted spectrum is rebuilt from half spectrum
+    for half_spectrum, full_spectrum in zip(half_result['nps_2d'], full_result['nps_2d']):
+        np.testing.assert_allclose(nps_tool.ProcessROI.full_from_half_spectrum(half_spectrum, shape[1]),
+                                   full_spectrum, rtol=1e-12, atol=1e-12 * full_spectrum.max())
+
+
+@pytest.mark.parametrize('shape', [(32, 32), (33, 57), (8, 5), (1, 6)])
+def test_bincount_radial_mean_matches_baseline(shape):
+
+    stack = np.random.default_rng(2).random((5,) + shape)
+    radial_bins = nps_tool.RadialBinCache()
+    for _ in range(2):
+        # second pass uses cached ring labels
+        means = radial_bins.radial_mean(stack, bin_width=1)
+        for array, mean in zip(stack, means):
+            np.testing.assert_allclose(mean, baseline_radial_mean(array), rtol=1e-12)
+    assert len(radial_bins.bins) == 1
+    np.testing.assert_allclose(nps_tool.ProcessROI.radial_mean(stack[0]), baseline_radial_mean(stack[0]), rtol=1e-12)
+
+
+def baseline_current_nps(values, frequencies, freq_value):
+
+    """
+    NPS value at freq_value as originally computed (get_current_nps: line
+    between nearest lower and upper frequency, negative values set to zero).
+    """
+
+    min_bound_val = max([freq for freq in frequencies if freq <= freq_value])
+    max_bound_val = min([freq for freq in frequencies if freq >= freq_value])
+    min_bound_idx = list(frequencies).index(min_bound_val)
+    max_bound_idx = list(frequencies).index(max_bound_val)
+    if min_bound_val == max_bound_val:
+        current_nps = values[min_bound_idx]
+    else:
+        slope = (values[max_bound_idx] - values[min_bound_idx]) / (max_bound_val - min_bound_val)
+        shift = values[min_bound_idx] - slope * min_bound_val
+        current_nps = slope * freq_value + shift
+    if current_nps < 0:
+        current_nps = 0
+    return current_nps
+
+
+def baseline_interpolation(freq_range, values, frequencies):
+
+    """
+    NPS interpolated at frequencies of freq_range as originally computed
+    (freq_range is truncated at the first frequency, which cannot be interpolated).
+    """
+
+    nps_range = []
+    new_freq_range = []
+    for freq_value in freq_range:
+        try:
+            nps_range.append(baseline_current_nps(values, frequencies, freq_value))
+        except ValueError:
+            break
+        new_freq_range.append(freq_value)
+    return {'values': nps_range, 'frequencies': new_freq_range}
+
+
+def test_interpolation_matches_baseline(make_process_roi):
+
+    rng = np.random.default_rng(3)
+    process_roi = make_process_roi()
+    for _ in range(300):
+        num_of_samples = int(rng.integers(0, 60))
+        values = list(rng.normal(0.2, 1, num_of_samples + 1))
+        frequencies = list(np.fft.fftfreq(max(2 * num_of_samples, 1), rng.uniform(0.03, 0.2))[:num_of_samples])
+        if rng.random() < 0.2 and num_of_samples:
+            # frequencies starting above start of freq_range
+            frequencies = [freq + rng.uniform(0.001, 0.5) for freq in frequencies]
+        interpolated = process_roi.interpolate_nps(values=values, frequencies=frequencies)
+        reference = baseline_interpolation(process_roi.freq_range, values, frequencies)
+        np.testing.assert_array_equal(interpolated['frequencies'], reference['frequencies'])
+        np.testing.assert_allclose(interpolated['values'], reference['values'], rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize('useHalfSpectrum', [False, True])
+def test_ensemble_nps_is_mean_of_roi_nps(make_process_roi, useHalfSpectrum):
+
+    rng = np.random.default_rng(14)
+    process_roi = make_process_roi(useEnsembleNPS=True, useHalfSpectrum=useHalfSpectrum)
+    roi_nps_dicts = []
+    for num_of_image in range(3):
+        process_roi.basename = 'img_%d' % num_of_image
+        image = rng.normal(40, 20, (64, 64))
+        roi_arrays = [image[:32, :32], image[32:, :32], image[:32, 32:]]
+        roi_nps_dicts += process_roi.compute_nps_of_rois(roi_arrays=roi_arrays, pixel_spacing=(0.7, 0.7))
+    ensemble_dict = process_roi.ensemble_nps()
+    assert ensemble_dict['num_of_rois'] == 9
+    # radial average and interpolation are linear, so the NPS of the mean 2d NPS
+    # is the mean of the NPS of all ROIs of the series
+    interpolated_values = [process_roi.interpolate_nps(values=nps_dict['values'],
+                                                       frequencies=nps_dict['frequencies'])['values']
+                           for nps_dict in roi_nps_dicts]
+    np.testing.assert_allclose(ensemble_dict['values'], np.mean(interpolated_values, axis=0), rtol=1e-10)
+    for key in ['AUC', 'integral_of_2d_NPS']:
+        np.testing.assert_allclose(ensemble_dict[key], np.mean([nps_dict[key] for nps_dict in roi_nps_dicts]),
+                                   rtol=1e-10)
+
+
+@pytest.mark.parametrize('useHalfSpectrum', [False, True])
+@pytest.mark.parametrize('fft_backend', ['scipy', 'pyfftw', 'auto'])
+def test_fft_backends_give_same_nps(make_process_roi, fft_backend, useHalfSpectrum):
+
+    if fft_backend == 'pyfftw':
+        pytest.importorskip('pyfftw')
+    stack = np.random.default_rng(15).normal(0, 20, (4, 30, 21))
+    reference = make_process_roi(useHalfSpectrum=useHalfSpectrum).compute_nps_stack(
+        stack=stack, pixel_spacing=(0.7, 0.7))
+    process_roi = make_process_roi(useHalfSpectrum=useHalfSpectrum, fft_backend=fft_backend, fft_workers=2)
+    # second stack of same shape is transformed by the plan (pyfftw) or backend (auto) of the first one
+    for _ in range(2):
+        result = process_roi.compute_nps_stack(stack=stack, pixel_spacing=(0.7, 0.7))
+        np.testing.assert_allclose(result['nps_2d'], reference['nps_2d'], rtol=1e-10,
+                                   atol=1e-12 * reference['nps_2d'].max())
+        for nps_dict, reference_dict in zip(result['nps_dicts'], reference['nps_dicts']):
+            np.testing.assert_allclose(nps_dict['values'], reference_dict['values'], rtol=1e-10,
+                                       atol=1e-12 * np.nanmax(reference_dict['values']))
+
+
+def test_single_precision_report(make_process_roi, capsys):
+
+    rng = np.random.default_rng(16)
+    roi_arrays = [rng.normal(40, 20, (32, 32)), rng.normal(40, 20, (40, 24))]
+    process_roi = make_process_roi(useSinglePrecision=True)
+    process_roi.key_image = 'img_1.dcm'
+    process_roi.basename = 'img_1'
+    roi_nps_dicts = process_roi.compute_nps_of_rois(roi_arrays=roi_arrays, pixel_spacing=(0.7, 0.7))
+    assert roi_nps_dicts[0]['values'].dtype == np.float32
+    report = process_roi.check_single_precision(roi_arrays=roi_arrays, pixel_spacing=(0.7, 0.7),
+                                                roi_nps_dicts=roi_nps_dicts)
+    assert report['image'] == 'img_1.dcm' and report['num_of_rois'] == 2
+    # deviation of float32 NPS from NPS computed in float64, relative to maximum of each curve
+    reference_process_roi = make_process_roi()
+    reference_process_roi.basename = 'img_1'
+    reference_dicts = reference_process_roi.compute_nps_of_rois(roi_arrays=roi_arrays, pixel_spacing=(0.7, 0.7))
+    max_rel_dev_nps = max(np.max(np.abs(nps_dict['values'] - reference_dict['values'])) /
+                          np.max(reference_dict['values'])
+                          for nps_dict, reference_dict in zip(roi_nps_dicts, reference_dicts))
+    assert report['max_rel_dev_nps'] == pytest.approx(max_rel_dev_nps)
+    assert 0 < report['max_rel_dev_nps'] < 1e-4
+    assert report['max_rel_dev_peak_freq'] < 1e-3
+    # deviations within default tolerance are not flagged
+    assert not report['exceeds_tolerance'] and 'Warning' not in capsys.readouterr().out
+    # compute_dtype is restored after the check
+    assert process_roi.compute_dtype == np.float32
+    # deviations larger than tolerance are flagged and printed
+    process_roi.single_precision_tolerance = 1e-12
+    report = process_roi.check_single_precision(roi_arrays=roi_arrays, pixel_spacing=(0.7, 0.7),
+                                                roi_nps_dicts=roi_nps_dicts)
+    assert report['exceeds_tolerance'] and 'Warning: float32 NPS of img_1.dcm' in capsys.readouterr().out
+
+
+def baseline_polynomial_fit(array, fit_order):
+
+    """
+    Fitted background of ROI as originally computed
+    (create_pol_fit: curve_fit of prepare_f_1 or prepare_f_2).
+    """
+
+    width = array.shape[1]
+
+    def prepare_f_1(xy, a, b, c, d):
+        i = xy // width
+        j = xy % width
+        return i * a + j * b + i * j * c + d
+
+    def prepare_f_2(xy, a, b, c, d, e, f, g, h, k):
+        i = xy // width
+        j = xy % width
+        return i * a + j * b + i * j * c + i * j ** 2 * d + i ** 2 * j * e + i ** 2 * j ** 2 * f + \
+            i ** 2 * g + j ** 2 * h + k
+
+    prepare_f = prepare_f_1 if fit_order == 1 else prepare_f_2
+    xy = np.arange(array.size)
+    coefficients = scipy.optimize.curve_fit(prepare_f, xy, np.ravel(array))[0]
+    return prepare_f(xy, *coefficients).reshape(array.shape)
+
+
+@pytest.mark.parametrize('fit_order', [1, 2])
+def test_polynomial_detrender_matches_baseline(fit_order):
+
+    rng = np.random.default_rng(17)
+    y, x = np.mgrid[0:30, 0:24].astype(np.float64)
+    background = 100 + 0.5 * y - 0.3 * x + 0.01 * x * y
+    if fit_order == 2:
+        background += 0.02 * y ** 2 - 0.01 * x ** 2 + 0.001 * x ** 2 * y - 0.002 * x * y ** 2 + 1e-4 * x ** 2 * y ** 2
+    detrender = nps_tool.PolynomialDetrender()
+    # backgrounds of the polynomial model are removed exactly
+    stack = np.stack([background, 2 * background - 50])
+    np.testing.assert_allclose(detrender.detrend(stack, order=fit_order), 0, atol=1e-9)
+    # same fit as before for noisy ROIs
+    stack = stack + rng.normal(0, 5, stack.shape)
+    for array, fit in zip(stack, detrender.fit(stack, order=fit_order)):
+        np.testing.assert_allclose(fit, baseline_polynomial_fit(array, fit_order), rtol=1e-6)
+    assert len(detrender.projectors) == 1
+
+
+def test_running_stats_matches_numpy():
+
+    rng = np.random.default_rng(4)
+    scalars = rng.normal(1e3, 5, 500)
+    running_stats = nps_tool.RunningStats()
+    assert np.isnan(running_stats.mean())
+    for value in scalars:
+        running_stats.add(value)
+    np.testing.assert_allclose(running_stats.mean(), np.mean(scalars), rtol=1e-12)
+    np.testing.assert_allclose(running_stats.sd(), np.std(scalars), rtol=1e-9)
+    # arrays of different lengths are averaged element-wise among arrays reaching the element
+    arrays = [rng.normal(0, 1, rng.integers(1, 30)) for _ in range(200)]
+    running_stats = nps_tool.RunningStats()
+    for array in arrays:
+        running_stats.add(array)
+    max_length = max(len(array) for array in arrays)
+    padded = np.full((len(arrays), max_length), np.nan)
+    for num_of_array, array in enumerate(arrays):
+        padded[num_of_array, :len(array)] = array
+    np.testing.assert_allclose(running_stats.mean(), np.nanmean(padded, axis=0), rtol=1e-10, atol=1e-12)
+    np.testing.assert_allclose(running_stats.sd(), np.nanstd(padded, axis=0), rtol=1e-10, atol=1e-12)
+
+
+def random_curve(rng):
+
+    """
+    NPS-like curve of one of several kinds (plateaus, monotonic, late maximum,
+    zeros, clipped noise, oscillating).
+    """
+
+    num_of_values = int(rng.integers(1, 40))
+    kind = rng.integers(0, 7)
+    if kind == 0:
+        return rng.integers(0, 4, num_of_values).astype(float)
+    if kind == 1:
+        return np.sort(rng.random(num_of_values))
+    if kind == 2:
+        return np.sort(rng.random(num_of_values))[::-1].copy()
+    if kind == 3:
+        return np.r_[rng.random(num_of_values), 5.0]
+    if kind == 4:
+        return np.zeros(num_of_values)
+    if kind == 5:
+        return np.maximum(rng.normal(0.3, 1, num_of_values), 0)
+    return np.abs(np.sin(np.arange(num_of_values) / 3.0 + rng.random())) * rng.random()
+
+
+def test_peak_info_batch_matches_baseline(make_process_roi):
+
+    rng = np.random.default_rng(5)
+    process_roi = make_process_roi()
+    frequencies = process_roi.freq_range
+    curves = [random_curve(rng) for _ in range(3000)]
+    peak_info_dicts = process_roi.peak_info_batch(curves=curves, frequencies=frequencies)
+    assert len(peak_info_dicts) == len(curves)
+    for curve, peak_info_dict in zip(curves, peak_info_dicts):
+        values = list(curve)
+        freqs = list(frequencies[:len(values)])
+        peak_dict = nps_tool.ProcessROI.collect_all_max_peaks_nps({'values': values, 'frequencies': freqs})
+        reference_dict = process_roi.handle_peak_info(peak_dict, values, freqs)
+        assert peak_info_dict.keys() == reference_dict.keys()
+        for key, reference_value in reference_dict.items():
+            if isinstance(reference_value, str):
+                assert peak_info_dict[key] == reference_value, (curve, key)
+            else:
+                assert peak_info_dict[key] == pytest.approx(reference_value, rel=1e-12, abs=1e-12), (curve, key)
+
+
+@pytest.mark.parametrize('shape', [(32, 32), (33, 57), (8, 5)])
+def test_sparse_radial_mean_matches_baseline(make_process_roi, shape):
+
+    rng = np.random.default_rng(6)
+    stack = rng.random((5,) + shape)
+    means = nps_tool.RadialBinCache().radial_mean(stack, bin_width=1, scheme='nearest')
+    for array, mean in zip(stack, means):
+        np.testing.assert_allclose(mean, baseline_radial_mean(array), rtol=1e-12)
+    # half spectra through the whole NPS computation
+    stack = rng.normal(0, 20, (3,) + shape)
+    result = make_process_roi(useHalfSpectrum=True, radial_scheme='nearest').compute_nps_stack(
+        stack=stack, pixel_spacing=(0.7, 0.7))
+    for roi_array, nps_dict in zip(stack, result['nps_dicts']):
+        assert_nps_equal(nps_dict, baseline_nps(roi_array, (0.7, 0.7)))
+    # linear scheme keeps constant spectra (plus value at zero frequency)
+    means = nps_tool.RadialBinCache().radial_mean(np.ones((2,) + shape), bin_width=1, scheme='linear')
+    np.testing.assert_allclose(means[~np.isnan(means)], 2)
+
+
+def test_padded_nps_keeps_values_and_variance(make_process_roi):
+
+    rng = np.random.default_rng(7)
+    stack = rng.normal(100, 10, (3, 32, 32))
+    unpadded = make_process_roi(useHalfSpectrum=True).compute_nps_stack(stack=stack, pixel_spacing=(0.5, 0.5))
+    padded = make_process_roi(useHalfSpectrum=True, roi_fft_size=(64, 64)).compute_nps_stack(
+        stack=stack, pixel_spacing=(0.5, 0.5))
+    assert padded['fft_shape'] == (64, 64) and padded['roi_shape'] == (32, 32)
+    # every second frequency of padded spectrum is a frequency of unpadded spectrum
+    np.testing.assert_allclose(padded['nps_2d'][:, ::2, ::2], unpadded['nps_2d'], rtol=1e-10,
+                               atol=1e-12 * unpadded['nps_2d'].max())
+    for unpadded_dict, padded_dict in zip(unpadded['nps_dicts'], padded['nps_dicts']):
+        np.testing.assert_allclose(padded_dict['integral_of_2d_NPS'], unpadded_dict['integral_of_2d_NPS'], rtol=1e-10)
+    # Parseval: integral of 2d NPS is variance of ROI for any padded size
+    stack = rng.normal(0, 5, (2, 40, 21))
+    for roi_fft_size in ('fast', (64, 64), (48, 30)):
+        result = make_process_roi(useHalfSpectrum=True, roi_fft_size=roi_fft_size).compute_nps_stack(
+            stack=stack, pixel_spacing=(0.5, 1.0))
+        for roi_array, nps_dict in zip(stack, result['nps_dicts']):
+            np.testing.assert_allclose(nps_dict['integral_of_2d_NPS'], roi_array.var(), rtol=1e-10)
+            np.testing.assert_allclose(nps_dict['SD'] ** 2, roi_array.var(), rtol=1e-10)
+
+
+def test_windowed_and_tiled_nps_keep_variance(make_process_roi):
+
+    rng = np.random.default_rng(8)
+    stack = rng.normal(100, 10, (3, 30, 24))
+    plain = make_process_roi(useHalfSpectrum=True).compute_nps_stack(stack=stack, pixel_spacing=(0.5, 0.5))
+    boxcar = make_process_roi(useHalfSpectrum=True, roi_window='boxcar').compute_nps_stack(
+        stack=stack, pixel_spacing=(0.5, 0.5))
+    for plain_dict, boxcar_dict in zip(plain['nps_dicts'], boxcar['nps_dicts']):
+        assert_nps_equal(boxcar_dict, plain_dict)
+    # Parseval: integral of 2d NPS is window-weighted variance of ROI
+    process_roi = make_process_roi(useHalfSpectrum=True, roi_window='hann')
+    window = process_roi.window_of(stack.shape[1:])
+    result = process_roi.compute_nps_stack(stack=stack, pixel_spacing=(0.5, 0.5))
+    for roi_array, nps_dict in zip(stack, result['nps_dicts']):
+        weighted_variance = np.sum((window * (roi_array - roi_array.mean())) ** 2) / np.sum(window ** 2)
+        np.testing.assert_allclose(nps_dict['integral_of_2d_NPS'], weighted_variance, rtol=1e-10)
+    # sub-ROIs are views into ROI, NPS of ROI is mean of NPS of its sub-ROIs
+    roi_array = rng.normal(100, 10, (64, 80))
+    process_roi = make_process_roi(useHalfSpectrum=True, subroi_size=32, subroi_overlap=0.5)
+    tiles = process_roi.tiles_of_roi(roi_array)
+    assert tiles.shape == (3, 4, 32, 32) and np.shares_memory(tiles, roi_array)
+    nps_dict = process_roi.compute_nps_of_rois(roi_arrays=[roi_array], pixel_spacing=(0.5, 0.5), accumulate=False)[0]
+    tile_stack = tiles.reshape(-1, 32, 32)
+    np.testing.assert_allclose(nps_dict['integral_of_2d_NPS'], tile_stack.var(axis=(1, 2)).mean(), rtol=1e-10)
+    tile_dicts = make_process_roi(useHalfSpectrum=True).compute_nps_stack(
+        stack=tile_stack, pixel_spacing=(0.5, 0.5))['nps_dicts']
+    np.testing.assert_allclose(nps_dict['values'], np.mean([tile_dict['values'] for tile_dict in tile_dicts], axis=0),
+                               rtol=1e-12)
+    np.testing.assert_allclose(nps_dict['SD'], roi_array.std(), rtol=1e-12)
+
+
+def volume_nps_of(make_process_roi, write_dicom, folder, volume, depth, overlap=0.5):
+
+    """
+    Write slices of volume as dicoms (slice spacing 2.5 mm), add them
+    to 3d NPS of one cuboid ROI (24 x 20 px) of the series and finish the series.
+    """
+
+    image_files = [str(folder / ('img_%d.dcm' % num_of_slice)) for num_of_slice in range(len(volume))]
+    for num_of_slice, (image_file, pixel_array_image) in enumerate(zip(image_files, volume)):
+        write_dicom(image_file, pixel_array_image, instance_number=num_of_slice + 1, position=-2.5 * num_of_slice)
+    header_catalog = nps_tool.HeaderCatalog(metadata_tags_list=[], workers=1)
+    header_catalog.build(image_files)
+    process_roi = make_process_roi(header_catalog=header_catalog, useVolumeNPS=True, volume_nps_depth=depth,
+                                   volume_nps_overlap=overlap)
+    process_roi.volume_rois = [(0, 0, 20, 24)]
+    for image_file, pixel_array_image in zip(image_files, volume):
+        process_roi.key_image = image_file
+        process_roi.add_slice_to_volume_nps(pixel_array_image=pixel_array_image, pixel_spacing=(0.5, 0.6))
+    process_roi.finish_volume_nps(pixel_spacing=(0.5, 0.6))
+    return process_roi
+
+
+def test_volume_nps_covers_all_slices(make_process_roi, write_dicom, tmp_path):
+
+    volume = np.random.default_rng(9).integers(-50, 50, (13, 30, 30))
+    process_roi = volume_nps_of(make_process_roi, write_dicom, tmp_path / 'ser_1', volume, depth=6)
+    volume_nps_dicts = process_roi.volume_nps()
+    assert len(volume_nps_dicts) == 1 and process_roi.volume_dropped_slices == 0
+    volume_dict = volume_nps_dicts[0]
+    # chunks start at slices 0, 3 and 6, the final chunk at slice 7 covers the last slice
+    assert volume_dict['shape'] == (6, 24, 20) and volume_dict['num_of_cuboids'] == 4
+    assert volume_dict['slice_spacing'] == 2.5
+    # Parseval: integral of 3d NPS is mean variance of cuboids
+    variances = [volume[start:start + 6, :24, :20].var() for start in (0, 3, 6, 7)]
+    np.testing.assert_allclose(volume_dict['integral_of_3d_NPS'], np.mean(variances), rtol=1e-10)
+    # longitudinal NPS averages fx, fy in {0, 1, -1} except fx = fy = 0 (full spectra of cuboids)
+    cuboids = np.array([volume[start:start + 6, :24, :20] for start in (0, 3, 6, 7)], dtype=np.float64)
+    cuboids -= cuboids.mean(axis=(1, 2, 3), keepdims=True)
+    nps_3d = np.mean(np.abs(np.fft.fftn(cuboids, axes=(1, 2, 3))) ** 2, axis=0) * (2.5 * 0.5 * 0.6 / cuboids[0].size)
+    band = [nps_3d[:, ky, kx] for ky in (0, 1, -1) for kx in (0, 1, -1) if (ky, kx) != (0, 0)]
+    np.testing.assert_allclose(volume_dict['longitudinal_values'], np.mean(band, axis=0)[:4], rtol=1e-10)
+    # series shorter than depth form one shorter chunk, single slices are dropped
+    process_roi = volume_nps_of(make_process_roi, write_dicom, tmp_path / 'ser_2', volume[:4], depth=6)
+    assert [volume_dict['shape'] for volume_dict in process_roi.volume_nps()] == [(4, 24, 20)]
+    process_roi = volume_nps_of(make_process_roi, write_dicom, tmp_path / 'ser_3', volume[:1], depth=6)
+    assert process_roi.volume_nps() == [] and process_roi.volume_dropped_slices == 1
+
+
+def test_volume_rois_need_same_rois_on_all_slices(make_process_roi):
+
+    process_roi = make_process_roi(useVolumeNPS=True)
+    rois = np.array([[0, 0, 20, 24], [30, 30, 50, 50]])
+    process_roi.set_volume_rois(all_roi_dict={'img_1.dcm': rois, 'img_2.dcm': rois.copy()})
+    assert process_roi.volume_rois == [(0, 0, 20, 24), (30, 30, 50, 50)] and not process_roi.volume_rois_differ
+    # ROI moved on second slice: no cuboids, noted in the worksheet
+    process_roi.set_volume_rois(all_roi_dict={'img_1.dcm': rois, 'img_2.dcm': rois + 1})
+    assert process_roi.volume_rois == [] and process_roi.volume_rois_differ
+    written = {}
+    worksheet = types.SimpleNamespace(write=lambda row, col, value: written.update({(row, col): value}))
+    process_roi.write_volume_nps(worksheet=worksheet)
+    assert written[(1, 0)] == 'ROIs differ between slices, no cuboid ROIs'
+    # without useVolumeNPS no cuboids are formed
+    process_roi = make_process_roi()
+    process_roi.set_volume_rois(all_roi_dict={'img_1.dcm': rois})
+    assert process_roi.volume_rois == [] and not process_roi.volume_rois_differ